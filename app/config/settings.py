@@ -29,6 +29,187 @@ API_WORKERS = int(os.getenv("API_WORKERS", "2"))
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+# Fast model for the simple structured-extraction nodes (defaults to LLM_MODEL)
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", LLM_MODEL)
+LLM_FAST_NODES = ["capture_important_info", "classify_ambiguity"]
+
+
+def _node_model_chain(node: str) -> list:
+    """
+    Ordered model fallback chain of a node: LLM_MODELS_<NODE>=model-a,model-b, or else
+    LLM_MODEL_<NODE> (LLM_FAST_MODEL for the fast nodes) followed by LLM_MODEL.
+    """
+    explicit = os.getenv(f"LLM_MODELS_{node.upper()}", "")
+    if explicit:
+        chain = [model.strip() for model in explicit.split(",") if model.strip()]
+    else:
+        chain = [os.getenv(f"LLM_MODEL_{node.upper()}", LLM_FAST_MODEL if node in LLM_FAST_NODES else LLM_MODEL),
+                 LLM_MODEL]
+    return list(dict.fromkeys(chain))
+
+
+# Per-node model settings, e.g. LLM_MODEL_CLASSIFY_AMBIGUITY=gpt-4o-mini, LLM_TEMPERATURE_GENERATE_RESPONSE=0.3,
+# LLM_MODELS_GENERATE_RESPONSE=gpt-4o,gpt-4o-mini, LLM_LATENCY_TARGET_MS_CLASSIFY_AMBIGUITY=800
+LLM_NODES = ["capture_important_info", "classify_ambiguity", "generate_response", "summarize_conversation"]
+LLM_NODE_SETTINGS = {
+    node: {
+        "model": _node_model_chain(node)[0],
+        "models": _node_model_chain(node),
+        "temperature": (
+            float(os.getenv(f"LLM_TEMPERATURE_{node.upper()}"))
+            if os.getenv(f"LLM_TEMPERATURE_{node.upper()}") else None
+        ),
+        # With LLM_ROUTING=latency, the first model of the chain whose recent latency meets this target is used
+        "latency_target_ms": float(os.getenv(f"LLM_LATENCY_TARGET_MS_{node.upper()}", "0")),
+    }
+    for node in LLM_NODES
+}
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))  # seconds
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_FALLBACK_MAX_RETRIES = int(os.getenv("LLM_FALLBACK_MAX_RETRIES", "0"))  # retries of a model that has a fallback
+
+# Model routing: "ordered" uses the chain in order and falls back on errors;
+# "latency" also skips models that miss the node's latency target
+LLM_ROUTING = os.getenv("LLM_ROUTING", "ordered")
+LLM_ROUTING_WINDOW = float(os.getenv("LLM_ROUTING_WINDOW", "300"))  # seconds of recent calls considered
+LLM_ROUTING_MIN_CALLS = int(os.getenv("LLM_ROUTING_MIN_CALLS", "5"))  # calls before a model's stats are used
+LLM_ROUTING_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTING_MAX_ERROR_RATE", "0.5"))  # above this, tried last
+
+# Hedged model calls (async graph only): when a call of a hedged node takes longer than the node's
+# recent LLM_HEDGE_PERCENTILE latency, a duplicate is sent and the first answer wins. Only for nodes
+# whose calls are idempotent and not streamed to the client (the structured-output nodes).
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_HEDGE_NODES = [
+    node.strip() for node in os.getenv("LLM_HEDGE_NODES", "capture_important_info,classify_ambiguity").split(",")
+    if node.strip()
+]
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "100"))  # never hedge sooner than this
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))  # maximum share of a node's recent calls hedged
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "500"))  # recent calls per node for the delay and the budget
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # calls observed before hedging starts
+
+# Admission control for model calls (chat and embeddings); a limit of 0 disables that bucket.
+# The limits are the account's: each of the API_WORKERS processes gets an equal share of them.
+# Calls are charged their estimated tokens up front (prompt + ADMISSION_COMPLETION_TOKENS); the
+# estimate is not corrected afterwards with the usage the API reports.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "500"))  # requests per minute
+LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "200000"))  # tokens per minute
+# The provider limits the embeddings model separately; query and document embeddings have their own buckets
+EMBEDDING_RATE_LIMIT_RPM = int(os.getenv("EMBEDDING_RATE_LIMIT_RPM", "3000"))  # requests per minute
+EMBEDDING_RATE_LIMIT_TPM = int(os.getenv("EMBEDDING_RATE_LIMIT_TPM", "1000000"))  # tokens per minute
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "200"))  # calls waiting in total (503 beyond)
+ADMISSION_CLIENT_QUEUE_SIZE = int(os.getenv("ADMISSION_CLIENT_QUEUE_SIZE", "20"))  # per client (429 beyond)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))  # max seconds waiting in queue
+ADMISSION_COMPLETION_TOKENS = int(os.getenv("ADMISSION_COMPLETION_TOKENS", "400"))  # expected output tokens
+
+# Embedding settings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Query embedding cache: in-process LRU capped in bytes, backed by an optional Postgres table
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+QUERY_EMBEDDING_CACHE_DB_ENABLED = os.getenv("QUERY_EMBEDDING_CACHE_DB_ENABLED", "true").lower() == "true"
+
+# Document ingestion: documents are split into chunks on headings, PDF pages and paragraphs; chunks are
+# embedded in batches (a few batches at a time) and upserted to Qdrant in batches of points
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))  # trailing sentences repeated in the next chunk
+INGEST_EMBEDDING_BATCH_SIZE = int(os.getenv("INGEST_EMBEDDING_BATCH_SIZE", "64"))  # chunks per embeddings call
+INGEST_EMBEDDING_CONCURRENCY = int(os.getenv("INGEST_EMBEDDING_CONCURRENCY", "4"))  # embeddings calls in flight
+INGEST_UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "256"))  # points per Qdrant upsert
+# Bulk upload (/documents/bulk): files, or the members of zip archives, are extracted in a process pool
+BULK_EXTRACTION_WORKERS = int(os.getenv("BULK_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))  # files per request, after expanding the archives
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(512 * 1024 * 1024)))  # total size, after expanding the archives
+# Search returns documents: up to this many matching chunks of each one, grouped by document
+SEARCH_CHUNKS_PER_DOCUMENT = int(os.getenv("SEARCH_CHUNKS_PER_DOCUMENT", "3"))
+
+# HTTP client settings shared by the OpenAI chat and embedding clients
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))  # seconds
+
+# Context assembly settings: token budget of the retrieved context per node (0 = unlimited)
+CONTEXT_TOKEN_BUDGETS = {
+    "classify_ambiguity": int(os.getenv("CONTEXT_BUDGET_CLASSIFY_AMBIGUITY", "1500")),
+    "generate_response": int(os.getenv("CONTEXT_BUDGET_GENERATE_RESPONSE", "3000")),
+}
+CONTEXT_PASSAGE_TOKENS = int(os.getenv("CONTEXT_PASSAGE_TOKENS", "200"))  # max tokens per passage
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))  # near-duplicate similarity
+
+# Semantic answer cache settings
+# Off by default; only first turns of a thread are cached (the key is the query and the vehicle info)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))  # cosine
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))  # in-process LRU size
+ANSWER_CACHE_DB_ENABLED = os.getenv("ANSWER_CACHE_DB_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_DB_CANDIDATES = int(os.getenv("ANSWER_CACHE_DB_CANDIDATES", "200"))  # rows compared per lookup
+ANSWER_CACHE_GENERATION_CHECK = float(os.getenv("ANSWER_CACHE_GENERATION_CHECK", "5"))  # seconds
+
+# Chat graph settings
+CHAT_GRAPH_VERSION = os.getenv("CHAT_GRAPH_VERSION", "1")
+# Generate the answer in parallel with the ambiguity classification
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"
+SPECULATIVE_MAX_WORKERS = int(os.getenv("SPECULATIVE_MAX_WORKERS", "8"))  # threads for the sync graph
+
+# Conversation summary settings
+SUMMARY_MESSAGE_THRESHOLD = int(os.getenv("SUMMARY_MESSAGE_THRESHOLD", "6"))  # summarize above this many messages
+# Summarize after the response is sent instead of inside the graph (async graph only)
+SUMMARY_IN_BACKGROUND = os.getenv("SUMMARY_IN_BACKGROUND", "true").lower() == "true"
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+SUMMARY_JOB_HISTORY = int(os.getenv("SUMMARY_JOB_HISTORY", "100"))  # finished jobs kept for inspection
+
+# Turn scheduler settings: turns of the same thread run one at a time
+TURN_QUEUE_LIMIT = int(os.getenv("TURN_QUEUE_LIMIT", "3"))  # turns waiting per thread before rejecting (429)
+# Merge messages queued behind a running turn of the same thread into a single turn
+TURN_COALESCE = os.getenv("TURN_COALESCE", "true").lower() == "true"
+TURN_DEBOUNCE_MS = int(os.getenv("TURN_DEBOUNCE_MS", "0"))  # extra wait for more fragments (0 = no wait)
+
+# Turn deadline settings: a turn's time budget counts from when it is submitted, including the wait
+# for earlier turns of the thread; optional stages are skipped or cut short when it runs low
+TURN_DEADLINE_MS = int(os.getenv("TURN_DEADLINE_MS", "30000"))  # 0 = no deadline
+DEADLINE_GENERATE_RESERVE_MS = int(os.getenv("DEADLINE_GENERATE_RESERVE_MS", "8000"))  # kept for generate_response
+DEADLINE_OPTIONAL_MIN_MS = int(os.getenv("DEADLINE_OPTIONAL_MIN_MS", "1000"))  # skip optional stages below this
+DEADLINE_GENERATE_MIN_MS = int(os.getenv("DEADLINE_GENERATE_MIN_MS", "2000"))  # generate_response always gets this
+DEADLINE_MAX_WORKERS = int(os.getenv("DEADLINE_MAX_WORKERS", "16"))  # threads for timed calls of the sync graph
+
+# Batch chat settings (/chat/batch)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+# Cross-worker turn serialization: the in-process locks only serialize the turns of a thread
+# within a worker. When on, the holder of a thread's lock also holds a Postgres advisory lock,
+# keeping a connection of the lock pool for the whole turn; waiters poll without a connection.
+# Off by default, since the lock pool then bounds the turns each worker can run at the same time.
+THREAD_ADVISORY_LOCKS = os.getenv("THREAD_ADVISORY_LOCKS", "false").lower() == "true"
+# Connections holding the locks: batch turns, summary jobs and up to DB_POOL_SIZE interactive turns
+THREAD_LOCK_POOL_SIZE = int(os.getenv("THREAD_LOCK_POOL_SIZE",
+                                      str(BATCH_MAX_CONCURRENCY + SUMMARY_WORKERS + DB_POOL_SIZE)))
+THREAD_LOCK_RETRY_MS = int(os.getenv("THREAD_LOCK_RETRY_MS", "50"))  # first wait before retrying a held lock
+THREAD_LOCK_RETRY_MAX_MS = int(os.getenv("THREAD_LOCK_RETRY_MAX_MS", "500"))  # longest wait between retries
+
+# Chat history settings: messages are also appended to the chat_messages log at the end of each turn
+MESSAGE_LOG_ENABLED = os.getenv("MESSAGE_LOG_ENABLED", "true").lower() == "true"
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+# Checkpoint retention settings
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))  # checkpoints kept per thread
+CHECKPOINT_THREAD_TTL_DAYS = float(os.getenv("CHECKPOINT_THREAD_TTL_DAYS", "30"))  # idle threads dropped (0 = never)
+CHECKPOINT_PRUNE_BATCH_SIZE = int(os.getenv("CHECKPOINT_PRUNE_BATCH_SIZE", "50"))  # threads per transaction
+CHECKPOINT_PRUNE_INTERVAL = int(os.getenv("CHECKPOINT_PRUNE_INTERVAL", "3600"))  # seconds (0 = no background job)
+CHECKPOINT_PRUNE_VACUUM = os.getenv("CHECKPOINT_PRUNE_VACUUM", "false").lower() == "true"  # VACUUM after pruning
+
+# Checkpoint compression: "none", "zlib" or "zstd" (needs zstandard, falls back to zlib). Blobs and writes of at
+# least CHECKPOINT_COMPRESS_MIN_BYTES are compressed and tagged (e.g. "msgpack+zstd"); rows written with any
+# setting stay readable, so enable it once every worker runs a version that can decode the tags.
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "none").lower()
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv("CHECKPOINT_COMPRESS_MIN_BYTES", "1024"))
+CHECKPOINT_COMPRESS_LEVEL = int(os.getenv("CHECKPOINT_COMPRESS_LEVEL", "3"))  # zstd 1-22, zlib 1-9
+
 #VECTOR STORE
 QDRANT_URL = os.getenv("QDRANT_URL", "https://your-qdrant-url")  # Reemplázalo con tu URL real
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")  # Asegúrate de que esté en tu .env
@@ -39,6 +220,15 @@ GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
 # Logging settings
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+# Metrics and tracing settings (/metrics needs prometheus_client)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# With several API_WORKERS, the workers share their metrics through files in this directory
+# (prometheus_client multiprocess mode), so /metrics reports all of them whichever worker is
+# scraped. It must be empty when the server starts; main.py creates a temporary one when it
+# starts more than one worker and the variable is not set.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+TRACE_ID_HEADER = os.getenv("TRACE_ID_HEADER", "X-Request-Id")  # incoming trace id, echoed as X-Trace-Id
+
 
 # Build connection strings
 def get_sync_connection_string() -> str:
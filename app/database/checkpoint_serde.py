@@ -0,0 +1,312 @@
+"""
+Compressed serializer for the LangGraph checkpoint blobs and writes.
+
+CompressedSerializer wraps the default serializer (msgpack for the graph state) and
+compresses payloads of at least CHECKPOINT_COMPRESS_MIN_BYTES with zstd or zlib. The
+codec is appended to the type tag stored next to each row ("msgpack+zstd"), so rows
+written before compression was enabled, or with another codec, are still decoded.
+Primitive channel values (the summary, the answer) are inlined by the PostgresSaver in
+the checkpoint JSONB row and do not go through the serializer.
+
+The command samples real rows to compare the codecs (stored size, encode and decode
+time) and can rewrite the existing rows with the configured codec.
+
+Usage:
+    python -m app.database.checkpoint_serde --sample 500
+    python -m app.database.checkpoint_serde --migrate --codec zstd
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from app.config.settings import (
+    CHECKPOINT_COMPRESSION,
+    CHECKPOINT_COMPRESS_MIN_BYTES,
+    CHECKPOINT_COMPRESS_LEVEL
+)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CODECS = ["none", "zlib", "zstd"]
+
+# Tables with serialized rows, and their primary key (used to page through them and rewrite rows)
+SERIALIZED_TABLES = {
+    "checkpoint_blobs": ["thread_id", "checkpoint_ns", "channel", "version"],
+    "checkpoint_writes": ["thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"],
+}
+
+# Compressor objects are not thread-safe; each thread keeps its own
+_zstd_local = threading.local()
+
+
+def _zstd_compress(data: bytes, level: int) -> bytes:
+    compressor = getattr(_zstd_local, "compressor", None)
+    if compressor is None or _zstd_local.level != level:
+        compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=level)
+        _zstd_local.level = level
+    return compressor.compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError("Checkpoint row compressed with zstd but the zstandard package is not installed")
+    decompressor = getattr(_zstd_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor.decompress(data)
+
+
+def resolve_codec(codec: Optional[str]) -> Optional[str]:
+    """
+    Get the codec to write with.
+
+    Args:
+        codec: "none", "zlib" or "zstd"
+
+    Returns:
+        The codec, zlib if zstd was asked for without zstandard installed, or None for no compression
+    """
+    if not codec or codec == "none":
+        return None
+    if codec not in CODECS:
+        raise ValueError(f"Unknown checkpoint compression codec: {codec} (expected one of {', '.join(CODECS)})")
+    if codec == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("zstandard is not installed, compressing checkpoints with zlib")
+        return "zlib"
+    return codec
+
+
+class CompressedSerializer:
+    """
+    Checkpoint serializer that compresses large payloads and tags them with the codec.
+
+    Decoding only looks at the tag of each row, so it reads rows of any codec, and rows
+    of the plain serializer, whatever codec is used for writing.
+    """
+
+    def __init__(
+            self,
+            codec: Optional[str] = CHECKPOINT_COMPRESSION,
+            min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES,
+            level: int = CHECKPOINT_COMPRESS_LEVEL,
+            base: Optional[Any] = None
+    ):
+        self.codec = resolve_codec(codec)
+        self.min_bytes = min_bytes
+        self.level = level
+        self.base = base or JsonPlusSerializer()
+
+    def __repr__(self) -> str:
+        return f"CompressedSerializer(codec={self.codec}, min_bytes={self.min_bytes}, level={self.level})"
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return _zstd_compress(data, self.level)
+        return zlib.compress(data, self.level)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.base.dumps_typed(obj)
+        if self.codec is None or data is None or len(data) < self.min_bytes:
+            return type_, data
+        compressed = self._compress(data)
+        # Payloads that do not shrink (already compressed bytes, for instance) are stored as they are
+        if len(compressed) >= len(data):
+            return type_, data
+        return f"{type_}+{self.codec}", compressed
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        base_type, _, codec = type_.rpartition("+")
+        if codec == "zstd":
+            return self.base.loads_typed((base_type, _zstd_decompress(payload)))
+        if codec == "zlib":
+            return self.base.loads_typed((base_type, zlib.decompress(payload)))
+        return self.base.loads_typed(data)
+
+
+# Singleton serializer
+_checkpoint_serde = None
+
+
+def get_checkpoint_serde() -> CompressedSerializer:
+    """Get or create the CompressedSerializer singleton used by the Postgres savers."""
+    global _checkpoint_serde
+    if _checkpoint_serde is None:
+        _checkpoint_serde = CompressedSerializer()
+        logger.info(f"Checkpoint serializer: {_checkpoint_serde}")
+    return _checkpoint_serde
+
+
+def benchmark_rows(
+        rows: Sequence[Tuple[str, bytes]],
+        codecs: Sequence[str],
+        min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES,
+        level: int = CHECKPOINT_COMPRESS_LEVEL
+) -> Dict[str, Any]:
+    """
+    Compare the codecs on a sample of serialized rows.
+
+    Args:
+        rows: (type, blob) pairs as stored in the checkpoint tables
+        codecs: Codecs to compare ("none" is the plain serializer)
+        min_bytes: Compression threshold
+        level: Compression level
+
+    Returns:
+        Report with the stored bytes of the sample and, per codec, the bytes, the ratio to the
+        uncompressed size and the total encode and decode time
+    """
+    reader = CompressedSerializer(codec=None)
+    values = [reader.loads_typed(row) for row in rows]
+    report: Dict[str, Any] = {
+        "rows": len(rows),
+        "stored_bytes": sum(len(blob) for _, blob in rows),
+        "codecs": {},
+    }
+
+    plain_bytes = None
+    for codec in codecs:
+        serde = CompressedSerializer(codec=codec, min_bytes=min_bytes, level=level)
+        encoded = []
+        started = time.perf_counter()
+        for value in values:
+            encoded.append(serde.dumps_typed(value))
+        encode_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for row in encoded:
+            serde.loads_typed(row)
+        decode_s = time.perf_counter() - started
+
+        size = sum(len(blob) for _, blob in encoded)
+        if plain_bytes is None and serde.codec is None:
+            plain_bytes = size
+        report["codecs"][serde.codec or "none"] = {
+            "bytes": size,
+            "ratio": round(size / plain_bytes, 4) if plain_bytes else None,
+            "compressed_rows": sum(1 for type_, _ in encoded if type_.endswith(f"+{serde.codec}")),
+            "encode_ms": round(encode_s * 1000, 2),
+            "decode_ms": round(decode_s * 1000, 2),
+        }
+    return report
+
+
+def sample_rows(sample: int) -> Dict[str, List[Tuple[str, bytes]]]:
+    """Take a random sample of the serialized rows of each checkpoint table."""
+    from app.database.postgres import get_connection_pool
+
+    with get_connection_pool().connection() as conn:
+        return {
+            table: [
+                (row["type"], bytes(row["blob"])) for row in conn.execute(
+                    f"SELECT type, blob FROM {table} WHERE blob IS NOT NULL AND type <> 'empty' "
+                    f"ORDER BY random() LIMIT %s", (sample,)
+                ).fetchall()
+            ]
+            for table in SERIALIZED_TABLES
+        }
+
+
+def migrate_rows(codec: str = CHECKPOINT_COMPRESSION, batch_size: int = 500, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Rewrite the serialized rows of the checkpoint tables with a codec.
+
+    Rows are read in primary key order, one batch per transaction; rows whose encoding
+    does not change are left untouched. Blobs and writes are never updated by the
+    saver once written, so this can run while the application is serving.
+
+    Args:
+        codec: Codec to rewrite the rows with ("none" decompresses them)
+        batch_size: Rows read per transaction
+        dry_run: Only report the rows and bytes that would change
+
+    Returns:
+        Report with the rows scanned and rewritten, and the bytes before and after, per table
+    """
+    from app.database.postgres import get_connection_pool
+
+    serde = CompressedSerializer(codec=codec)
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"codec": serde.codec or "none", "dry_run": dry_run, "tables": {}}
+
+    with get_connection_pool().connection() as conn:
+        for table, key in SERIALIZED_TABLES.items():
+            columns = ", ".join(key)
+            totals = {"scanned": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+            after = None
+            while True:
+                where = f"WHERE ({columns}) > ({', '.join(['%s'] * len(key))})" if after is not None else ""
+                rows = conn.execute(
+                    f"SELECT {columns}, type, blob FROM {table} {where} ORDER BY {columns} LIMIT %s",
+                    (*(after or ()), batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                after = tuple(rows[-1][column] for column in key)
+
+                with conn.transaction():
+                    for row in rows:
+                        totals["scanned"] += 1
+                        if row["blob"] is None or row["type"] == "empty":
+                            continue
+                        blob = bytes(row["blob"])
+                        type_, new_blob = serde.dumps_typed(serde.loads_typed((row["type"], blob)))
+                        if type_ == row["type"] and new_blob == blob:
+                            continue
+                        totals["rewritten"] += 1
+                        totals["bytes_before"] += len(blob)
+                        totals["bytes_after"] += len(new_blob)
+                        if not dry_run:
+                            conn.execute(
+                                f"UPDATE {table} SET type = %s, blob = %s "
+                                f"WHERE ({columns}) = ({', '.join(['%s'] * len(key))})",
+                                (type_, new_blob, *(row[column] for column in key))
+                            )
+            report["tables"][table] = totals
+
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    rewritten = sum(totals["rewritten"] for totals in report["tables"].values())
+    logger.info(f"Checkpoint {'dry run' if dry_run else 'migration'} to {report['codec']}: "
+                f"{rewritten} rows in {report['duration_ms']} ms")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare checkpoint codecs or rewrite the checkpoint rows.")
+    parser.add_argument("--sample", type=int, default=500, help="Rows sampled per table for the comparison")
+    parser.add_argument("--min-bytes", type=int, default=CHECKPOINT_COMPRESS_MIN_BYTES,
+                        help="Compression threshold of the comparison")
+    parser.add_argument("--level", type=int, default=CHECKPOINT_COMPRESS_LEVEL, help="Compression level")
+    parser.add_argument("--migrate", action="store_true", help="Rewrite the rows with --codec")
+    parser.add_argument("--codec", choices=CODECS, default=CHECKPOINT_COMPRESSION,
+                        help="Codec of the migration")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per transaction of the migration")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what the migration would rewrite")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.migrate:
+        report = migrate_rows(codec=args.codec, batch_size=args.batch_size, dry_run=args.dry_run)
+    else:
+        codecs = ["none", "zlib"] + (["zstd"] if ZSTD_AVAILABLE else [])
+        report = {
+            table: benchmark_rows(rows, codecs, min_bytes=args.min_bytes, level=args.level)
+            for table, rows in sample_rows(args.sample).items()
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -69,6 +69,8 @@ def init_db():
     """
     from app.database.base import Base
     from app.database.engine import get_engine
+    # Import the models so their tables are registered in Base.metadata
+    import app.database.models  # noqa: F401
 
     try:
         # Ensure database exists
@@ -0,0 +1,62 @@
+from sqlalchemy import Column, Integer, String, Text, LargeBinary, DateTime, Float, Index
+
+from app.database.base import Base, TimeStampedModel
+
+
+class AnswerCacheEntry(Base, TimeStampedModel):
+    """
+    Persistent tier of the semantic answer cache.
+    The query embedding is stored as float32 bytes.
+    """
+    __tablename__ = "answer_cache"
+
+    id = Column(String(36), primary_key=True)
+    generation = Column(Integer, nullable=False)
+    vehicle_key = Column(String(255), nullable=False)
+    query = Column(Text, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)
+    answer = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False, default=0)
+    generation_ms = Column(Float, nullable=False, default=0.0)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_answer_cache_lookup", "generation", "vehicle_key", "expires_at"),
+    )
+
+
+class AnswerCacheGeneration(Base, TimeStampedModel):
+    """
+    Single-row table holding the current corpus generation of the answer cache.
+    Bumped whenever documents are uploaded or deleted, so every worker drops its entries.
+    """
+    __tablename__ = "answer_cache_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+class QueryEmbeddingCacheEntry(Base, TimeStampedModel):
+    """
+    Persistent tier of the query embedding cache.
+    Keyed by a hash of the model name and the normalized query; the vector is stored as float32 bytes.
+    """
+    __tablename__ = "query_embedding_cache"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(255), nullable=False)
+    query = Column(Text, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)
+
+
+class ChatMessage(Base, TimeStampedModel):
+    """
+    Append-only log of the messages of each thread, written at the end of every turn.
+    Serves the chat history without loading checkpoints; seq orders the messages of a thread.
+    """
+    __tablename__ = "chat_messages"
+
+    thread_id = Column(String(255), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    role = Column(String(16), nullable=False)
+    content = Column(Text, nullable=False)
@@ -1,20 +1,25 @@
 import logging
 import time
+from contextlib import contextmanager, asynccontextmanager
 from functools import wraps
-from typing import Callable, TypeVar, Any
+from typing import Callable, TypeVar, Any, Dict, Iterator, AsyncIterator, Optional
 
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from psycopg_pool import ConnectionPool, AsyncConnectionPool
 from psycopg.rows import dict_row
 from langgraph.checkpoint.postgres import PostgresSaver
 from langgraph.store.postgres import PostgresStore
+from langgraph.store.postgres.aio import AsyncPostgresStore
 
 from app.config.settings import (
     postgresql_connection_string,
     DB_POOL_SIZE,
+    THREAD_LOCK_POOL_SIZE,
     DB_CONNECTION_RETRIES,
     DB_RETRY_DELAY
 )
+from app.database.checkpoint_serde import get_checkpoint_serde
+from app.services.metrics import track, DB_POOL_ACQUIRE, DB_POOL_HOLD, CHECKPOINT_DURATION, CHECKPOINT_ERRORS
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +36,11 @@ connection_kwargs = {
 # Singleton instances
 _connection_pool = None
 _async_connection_pool = None
+_async_lock_pool = None
 _postgres_saver = None
 _async_postgres_saver = None
 _postgres_store = None
+_async_postgres_store = None
 
 
 def with_retry(max_retries: int = DB_CONNECTION_RETRIES, delay: int = DB_RETRY_DELAY) -> Callable:
@@ -77,6 +84,68 @@ def with_retry(max_retries: int = DB_CONNECTION_RETRIES, delay: int = DB_RETRY_D
     return decorator
 
 
+class InstrumentedConnectionPool(ConnectionPool):
+    """ConnectionPool recording how long clients wait for a connection and how long they hold it."""
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        started = time.perf_counter()
+        with super().connection(timeout=timeout) as conn:
+            acquired = time.perf_counter()
+            DB_POOL_ACQUIRE.labels(pool="sync").observe(acquired - started)
+            try:
+                yield conn
+            finally:
+                DB_POOL_HOLD.labels(pool="sync").observe(time.perf_counter() - acquired)
+
+
+class InstrumentedAsyncConnectionPool(AsyncConnectionPool):
+    """Async version of InstrumentedConnectionPool."""
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None) -> AsyncIterator[Any]:
+        started = time.perf_counter()
+        async with super().connection(timeout=timeout) as conn:
+            acquired = time.perf_counter()
+            DB_POOL_ACQUIRE.labels(pool="async").observe(acquired - started)
+            try:
+                yield conn
+            finally:
+                DB_POOL_HOLD.labels(pool="async").observe(time.perf_counter() - acquired)
+
+
+class InstrumentedPostgresSaver(PostgresSaver):
+    """PostgresSaver recording the duration of checkpoint reads and writes."""
+
+    def get_tuple(self, config):
+        with track(CHECKPOINT_DURATION, errors=CHECKPOINT_ERRORS, operation="get_tuple"):
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with track(CHECKPOINT_DURATION, errors=CHECKPOINT_ERRORS, operation="put"):
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path: str = ""):
+        with track(CHECKPOINT_DURATION, errors=CHECKPOINT_ERRORS, operation="put_writes"):
+            return super().put_writes(config, writes, task_id, task_path)
+
+
+class InstrumentedAsyncPostgresSaver(AsyncPostgresSaver):
+    """Async version of InstrumentedPostgresSaver."""
+
+    async def aget_tuple(self, config):
+        with track(CHECKPOINT_DURATION, errors=CHECKPOINT_ERRORS, operation="get_tuple"):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with track(CHECKPOINT_DURATION, errors=CHECKPOINT_ERRORS, operation="put"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = ""):
+        with track(CHECKPOINT_DURATION, errors=CHECKPOINT_ERRORS, operation="put_writes"):
+            return await super().aput_writes(config, writes, task_id, task_path)
+
+
 def get_connection_pool() -> ConnectionPool:
     """
     Get or create a PostgreSQL connection pool.
@@ -87,7 +156,7 @@ def get_connection_pool() -> ConnectionPool:
     if _connection_pool is None:
         try:
             # Create connection pool
-            _connection_pool = ConnectionPool(
+            _connection_pool = InstrumentedConnectionPool(
                 conninfo=postgresql_connection_string,
                 max_size=DB_POOL_SIZE,
                 kwargs=connection_kwargs,
@@ -112,7 +181,7 @@ async def get_async_connection_pool() -> AsyncConnectionPool:
     if _async_connection_pool is None:
         try:
             # Create async connection pool
-            _async_connection_pool = AsyncConnectionPool(
+            _async_connection_pool = InstrumentedAsyncConnectionPool(
                 conninfo=postgresql_connection_string,
                 max_size=DB_POOL_SIZE,
                 kwargs=connection_kwargs,
@@ -127,6 +196,36 @@ async def get_async_connection_pool() -> AsyncConnectionPool:
     return _async_connection_pool
 
 
+async def _unlock_all(conn) -> None:
+    """Drop the advisory locks a connection still holds before it goes back to the lock pool."""
+    await conn.execute("SELECT pg_advisory_unlock_all()")
+
+
+async def get_async_lock_pool() -> AsyncConnectionPool:
+    """
+    Get or create the pool of the connections holding the per-thread advisory locks.
+    Separate from the main pool, so turns holding a lock can always get a connection
+    for their checkpoints.
+    """
+    global _async_lock_pool
+
+    if _async_lock_pool is None:
+        try:
+            _async_lock_pool = InstrumentedAsyncConnectionPool(
+                conninfo=postgresql_connection_string,
+                max_size=THREAD_LOCK_POOL_SIZE,
+                kwargs=connection_kwargs,
+                reset=_unlock_all,
+            )
+
+            logger.info("Async PostgreSQL lock pool initialized")
+        except Exception as e:
+            logger.error(f"Failed to initialize async PostgreSQL lock pool: {str(e)}")
+            raise
+
+    return _async_lock_pool
+
+
 @with_retry()
 def get_postgres_saver() -> PostgresSaver:
     """
@@ -140,7 +239,7 @@ def get_postgres_saver() -> PostgresSaver:
             pool = get_connection_pool()
 
             # Create PostgresSaver
-            _postgres_saver = PostgresSaver(pool)
+            _postgres_saver = InstrumentedPostgresSaver(pool, serde=get_checkpoint_serde())
 
             # Initialize tables
             _postgres_saver.setup()
@@ -171,13 +270,12 @@ async def get_async_postgres_saver() -> AsyncPostgresSaver:
             pool = await get_async_connection_pool()
 
             # Create AsyncPostgresSaver
-            _async_postgres_saver = AsyncPostgresSaver(pool)
+            _async_postgres_saver = InstrumentedAsyncPostgresSaver(pool, serde=get_checkpoint_serde())
 
             # Initialize tables
             await _async_postgres_saver.setup()
             logger.info("Async PostgreSQL saver initialized successfully")
         except Exception as e:
-            print(e)
             logger.error(f"Failed to initialize async PostgreSQL saver: {str(e)}")
             raise
 
@@ -207,6 +305,27 @@ def get_postgres_store() -> PostgresStore:
     return _postgres_store
 
 
+async def get_async_postgres_store() -> AsyncPostgresStore:
+    """
+    Get or create an AsyncPostgresStore instance.
+    This is a singleton pattern to ensure we only have one instance.
+    """
+    global _async_postgres_store
+
+    if _async_postgres_store is None:
+        try:
+            pool = await get_async_connection_pool()
+
+            # Create AsyncPostgresStore
+            _async_postgres_store = AsyncPostgresStore(pool)
+            logger.info("Async PostgreSQL store initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize async PostgreSQL store: {str(e)}")
+            raise
+
+    return _async_postgres_store
+
+
 def check_postgres_connection() -> bool:
     """
     Check if the PostgreSQL connection is working.
@@ -227,12 +346,30 @@ def check_postgres_connection() -> bool:
         return False
 
 
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Get the usage stats of the connection pools that have been created.
+
+    Returns:
+        Dictionary of psycopg_pool stats (pool_size, pool_available, requests_waiting, ...) per pool
+    """
+    stats = {}
+    if _connection_pool is not None:
+        stats["sync"] = _connection_pool.get_stats()
+    if _async_connection_pool is not None:
+        stats["async"] = _async_connection_pool.get_stats()
+    if _async_lock_pool is not None:
+        stats["locks"] = _async_lock_pool.get_stats()
+    return stats
+
+
 def close_postgres_connections() -> None:
     """
     Close all PostgreSQL connections.
     Called on application shutdown.
     """
-    global _connection_pool, _async_connection_pool, _postgres_saver, _async_postgres_saver, _postgres_store
+    global _connection_pool, _async_connection_pool, _async_lock_pool, _postgres_saver, _async_postgres_saver, \
+        _postgres_store, _async_postgres_store
 
     try:
         if _connection_pool is not None:
@@ -244,12 +381,19 @@ def close_postgres_connections() -> None:
             import asyncio
             asyncio.create_task(_async_connection_pool.close())
             logger.info("Async PostgreSQL connection pool closing")
+
+        if _async_lock_pool is not None:
+            import asyncio
+            asyncio.create_task(_async_lock_pool.close())
+            logger.info("Async PostgreSQL lock pool closing")
     except Exception as e:
         logger.error(f"Error closing PostgreSQL connection pools: {str(e)}")
 
     # Reset singleton instances
     _connection_pool = None
     _async_connection_pool = None
+    _async_lock_pool = None
     _postgres_saver = None
     _async_postgres_saver = None
     _postgres_store = None
+    _async_postgres_store = None
@@ -0,0 +1,301 @@
+"""
+Retention for the LangGraph checkpoint tables.
+
+PostgresSaver keeps every superstep checkpoint of every thread, with its pending writes
+and the channel blobs it references. This module prunes them with two policies:
+- keep only the last CHECKPOINT_KEEP_LAST checkpoints of each thread (and namespace)
+- drop threads whose last checkpoint is older than CHECKPOINT_THREAD_TTL_DAYS
+
+Threads are processed in small batches, each in its own transaction. Writes and blobs are
+removed once no kept checkpoint references them. A dry run reports the rows and bytes that
+would be reclaimed without deleting anything.
+
+Usage:
+    python -m app.database.retention --dry-run
+    python -m app.database.retention --keep-last 10 --ttl-days 7 --vacuum
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
+
+from psycopg import IsolationLevel
+
+from app.config.settings import (
+    CHECKPOINT_KEEP_LAST,
+    CHECKPOINT_THREAD_TTL_DAYS,
+    CHECKPOINT_PRUNE_BATCH_SIZE,
+    CHECKPOINT_PRUNE_INTERVAL,
+    CHECKPOINT_PRUNE_VACUUM
+)
+from app.database.postgres import get_connection_pool
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TABLES = ["checkpoints", "checkpoint_writes", "checkpoint_blobs"]
+
+# Only one worker prunes at a time
+PRUNE_ADVISORY_LOCK_ID = 7_305_114
+
+# Threads of the next batch, with their number of checkpoints and last activity
+SELECT_THREADS_SQL = """
+    SELECT thread_id,
+           count(*) AS checkpoints,
+           max((checkpoint ->> 'ts')::timestamptz) AS last_ts
+    FROM checkpoints
+    WHERE thread_id > %(after)s
+    GROUP BY thread_id
+    ORDER BY thread_id
+    LIMIT %(limit)s
+"""
+
+# Checkpoints that survive: the newest keep_last per namespace of the non-expired threads
+KEPT_CTE = """
+    WITH kept AS (
+        SELECT thread_id, checkpoint_ns, checkpoint_id, checkpoint
+        FROM (
+            SELECT thread_id, checkpoint_ns, checkpoint_id, checkpoint,
+                   row_number() OVER (
+                       PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                   ) AS recency
+            FROM checkpoints
+            WHERE thread_id = ANY(%(kept_threads)s)
+        ) ranked
+        WHERE recency <= %(keep_last)s
+    )
+"""
+
+# Rows of each table that are no longer needed once only the kept checkpoints remain
+DOOMED_CONDITIONS = {
+    "checkpoints": """
+        t.thread_id = ANY(%(threads)s) AND NOT EXISTS (
+            SELECT 1 FROM kept k
+            WHERE k.thread_id = t.thread_id AND k.checkpoint_ns = t.checkpoint_ns
+              AND k.checkpoint_id = t.checkpoint_id
+        )
+    """,
+    "checkpoint_writes": """
+        t.thread_id = ANY(%(threads)s) AND NOT EXISTS (
+            SELECT 1 FROM kept k
+            WHERE k.thread_id = t.thread_id AND k.checkpoint_ns = t.checkpoint_ns
+              AND k.checkpoint_id = t.checkpoint_id
+        )
+    """,
+    "checkpoint_blobs": """
+        t.thread_id = ANY(%(threads)s) AND NOT EXISTS (
+            SELECT 1 FROM kept k
+            WHERE k.thread_id = t.thread_id AND k.checkpoint_ns = t.checkpoint_ns
+              AND k.checkpoint -> 'channel_versions' ->> t.channel = t.version
+        )
+    """,
+}
+
+
+def _report_sql(table: str) -> str:
+    return f"""{KEPT_CTE.rstrip()}
+    SELECT count(*) AS row_count, coalesce(sum(pg_column_size(t.*)), 0) AS byte_count
+    FROM {table} t
+    WHERE {DOOMED_CONDITIONS[table]}
+    """
+
+
+def _delete_sql(table: str) -> str:
+    return f"""{KEPT_CTE.rstrip()},
+    deleted AS (
+        DELETE FROM {table} t
+        WHERE {DOOMED_CONDITIONS[table]}
+        RETURNING pg_column_size(t.*) AS size
+    )
+    SELECT count(*) AS row_count, coalesce(sum(size), 0) AS byte_count FROM deleted
+    """
+
+
+def _empty_totals() -> Dict[str, Dict[str, int]]:
+    return {table: {"rows": 0, "bytes": 0} for table in CHECKPOINT_TABLES}
+
+
+def _prune_batch(conn, threads: List[Dict[str, Any]], keep_last: int, cutoff: Optional[datetime],
+                 dry_run: bool) -> Dict[str, Any]:
+    """Prune (or measure) one batch of threads in a single transaction."""
+    expired = [t["thread_id"] for t in threads if cutoff is not None and t["last_ts"] and t["last_ts"] < cutoff]
+    over_limit = [t["thread_id"] for t in threads if t["thread_id"] not in expired and t["checkpoints"] > keep_last]
+    affected = expired + over_limit
+    totals = _empty_totals()
+    if not affected:
+        return {"expired_threads": 0, "trimmed_threads": 0, "tables": totals}
+
+    params = {"threads": affected, "kept_threads": over_limit, "keep_last": keep_last}
+    # Repeatable read: rows written by a concurrent turn after the batch started are not touched
+    with conn.transaction():
+        for table in CHECKPOINT_TABLES:
+            result = conn.execute(_report_sql(table) if dry_run else _delete_sql(table), params).fetchone()
+            totals[table] = {"rows": result["row_count"], "bytes": int(result["byte_count"])}
+
+    return {"expired_threads": len(expired), "trimmed_threads": len(over_limit), "tables": totals}
+
+
+def prune_checkpoints(
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        ttl_days: float = CHECKPOINT_THREAD_TTL_DAYS,
+        batch_size: int = CHECKPOINT_PRUNE_BATCH_SIZE,
+        dry_run: bool = False,
+        vacuum: bool = CHECKPOINT_PRUNE_VACUUM
+) -> Dict[str, Any]:
+    """
+    Apply the retention policies to the checkpoint tables.
+
+    Args:
+        keep_last: Checkpoints kept per thread and namespace
+        ttl_days: Threads idle for longer are deleted entirely (0 disables)
+        batch_size: Threads processed per transaction
+        dry_run: Only report what would be deleted
+        vacuum: Run VACUUM ANALYZE on the tables afterwards (ignored in dry runs)
+
+    Returns:
+        Report with the threads scanned, expired and trimmed, and the rows and bytes
+        reclaimed (or reclaimable) per table
+    """
+    if keep_last < 1:
+        raise ValueError("keep_last must be at least 1")
+
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ttl_days) if ttl_days > 0 else None
+    report = {
+        "dry_run": dry_run,
+        "keep_last": keep_last,
+        "ttl_days": ttl_days,
+        "threads_scanned": 0,
+        "expired_threads": 0,
+        "trimmed_threads": 0,
+        "batches": 0,
+        "tables": _empty_totals(),
+    }
+
+    with get_connection_pool().connection() as conn:
+        locked = conn.execute(
+            "SELECT pg_try_advisory_lock(%s) AS locked", (PRUNE_ADVISORY_LOCK_ID,)
+        ).fetchone()["locked"]
+        if not locked:
+            logger.info("Checkpoint pruning already running in another worker, skipping")
+            return {**report, "skipped": True}
+
+        # Pooled connections are in autocommit mode; each batch opens its own transaction
+        previous_isolation = conn.isolation_level
+        conn.isolation_level = IsolationLevel.REPEATABLE_READ
+        try:
+            after = ""
+            while True:
+                threads = conn.execute(SELECT_THREADS_SQL, {"after": after, "limit": batch_size}).fetchall()
+                if not threads:
+                    break
+                after = threads[-1]["thread_id"]
+
+                batch = _prune_batch(conn, threads, keep_last, cutoff, dry_run)
+                report["batches"] += 1
+                report["threads_scanned"] += len(threads)
+                report["expired_threads"] += batch["expired_threads"]
+                report["trimmed_threads"] += batch["trimmed_threads"]
+                for table, counts in batch["tables"].items():
+                    report["tables"][table]["rows"] += counts["rows"]
+                    report["tables"][table]["bytes"] += counts["bytes"]
+        finally:
+            conn.isolation_level = previous_isolation
+            conn.execute("SELECT pg_advisory_unlock(%s)", (PRUNE_ADVISORY_LOCK_ID,))
+
+        if vacuum and not dry_run:
+            for table in CHECKPOINT_TABLES:
+                conn.execute(f"VACUUM (ANALYZE) {table}")
+
+    report["total_bytes"] = sum(counts["bytes"] for counts in report["tables"].values())
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(
+        f"Checkpoint {'dry run' if dry_run else 'pruning'}: {report['expired_threads']} expired and "
+        f"{report['trimmed_threads']} trimmed threads, {report['total_bytes']} bytes"
+        f"{' reclaimable' if dry_run else ' reclaimed'} in {report['duration_ms']} ms"
+    )
+    return report
+
+
+def table_sizes() -> Dict[str, int]:
+    """Total on-disk size of each checkpoint table, including indexes and TOAST."""
+    with get_connection_pool().connection() as conn:
+        return {
+            table: conn.execute("SELECT pg_total_relation_size(%s) AS size", (table,)).fetchone()["size"]
+            for table in CHECKPOINT_TABLES
+        }
+
+
+class CheckpointPruner:
+    """Background task that prunes the checkpoint tables every interval seconds."""
+
+    def __init__(self, interval: int = CHECKPOINT_PRUNE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        """Start the task in the running event loop (no-op if the interval is 0)."""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="checkpoint-pruner")
+            logger.info(f"Checkpoint pruner started (every {self.interval}s)")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # The pruning queries are blocking; keep them off the event loop
+                self.last_report = await asyncio.to_thread(prune_checkpoints)
+            except Exception as e:
+                logger.error(f"Checkpoint pruning failed: {str(e)}")
+
+    async def stop(self) -> None:
+        """Cancel the task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            logger.info("Checkpoint pruner stopped")
+
+
+# Singleton pruner
+_checkpoint_pruner = None
+
+
+def get_checkpoint_pruner() -> CheckpointPruner:
+    """Get or create the CheckpointPruner singleton."""
+    global _checkpoint_pruner
+    if _checkpoint_pruner is None:
+        _checkpoint_pruner = CheckpointPruner()
+    return _checkpoint_pruner
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prune the LangGraph checkpoint tables.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the reclaimable rows and bytes")
+    parser.add_argument("--keep-last", type=int, default=CHECKPOINT_KEEP_LAST,
+                        help="Checkpoints kept per thread")
+    parser.add_argument("--ttl-days", type=float, default=CHECKPOINT_THREAD_TTL_DAYS,
+                        help="Delete threads idle for longer than this (0 = never)")
+    parser.add_argument("--batch-size", type=int, default=CHECKPOINT_PRUNE_BATCH_SIZE,
+                        help="Threads processed per transaction")
+    parser.add_argument("--vacuum", action="store_true", default=CHECKPOINT_PRUNE_VACUUM,
+                        help="Run VACUUM ANALYZE on the checkpoint tables afterwards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    report = prune_checkpoints(
+        keep_last=args.keep_last,
+        ttl_days=args.ttl_days,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+        vacuum=args.vacuum
+    )
+    report["table_sizes"] = table_sizes()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
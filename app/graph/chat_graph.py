@@ -1,3 +1,4 @@
+import inspect
 import logging
 import platform
 from langgraph.checkpoint.memory import MemorySaver
@@ -11,8 +12,15 @@ from sqlalchemy.orm import sessionmaker
 
 from app.graph.state import State
 from app.graph.nodes import retrieve_context, generate_response, summarize_conversation, classify_ambiguity, \
-    ask_clarification, capture_important_info
-from app.database.postgres import get_postgres_saver, get_postgres_store, get_async_postgres_saver
+    ask_clarification, capture_important_info, aretrieve_context, agenerate_response, asummarize_conversation, \
+    aclassify_ambiguity, aask_clarification, acapture_important_info, detect_intent, adetect_intent, quick_response, \
+    aquick_response, check_answer_cache, acheck_answer_cache
+from app.graph.speculation import classify_ambiguity_speculative, aclassify_ambiguity_speculative
+from app.config.settings import SPECULATIVE_GENERATION, SUMMARY_MESSAGE_THRESHOLD, SUMMARY_IN_BACKGROUND, \
+    ANSWER_CACHE_ENABLED
+from app.database.postgres import get_postgres_saver, get_postgres_store, get_async_postgres_saver, \
+    get_async_postgres_store
+from app.services.metrics import instrument_node
 import os
 from dotenv import load_dotenv
 from typing import Optional
@@ -22,47 +30,121 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 
+def should_fast_path(state: State):
+    """Decide si responder directamente a un mensaje trivial o ejecutar el flujo completo."""
+    return "quick_response" if state.get("intent") else ["retrieve_context", "capture_important_info"]
+
+
 def should_summarize(state: State) -> str:
     """Decide si resumir o continuar."""
-    return "summarize_conversation" if len(state["messages"]) > 6 else "generate_response"
+    return "summarize_conversation" if len(state["messages"]) > SUMMARY_MESSAGE_THRESHOLD else "generate_response"
 
 def should_ambiguity(state: State) -> str:
     """Decide si resumir o continuar."""
     return "ask_clarification" if state["ambiguity_classification"]["is_ambiguous"] else "generate_response"
 
-def create_chat_graph():
+# Node implementations for the synchronous and asynchronous graphs
+SYNC_NODES = {
+    "detect_intent": detect_intent,
+    "quick_response": quick_response,
+    "retrieve_context": retrieve_context,
+    "capture_important_info": capture_important_info,
+    "classify_ambiguity": classify_ambiguity,
+    "ask_clarification": ask_clarification,
+    "check_answer_cache": check_answer_cache,
+    "generate_response": generate_response,
+    "summarize_conversation": summarize_conversation,
+}
+
+ASYNC_NODES = {
+    "detect_intent": adetect_intent,
+    "quick_response": aquick_response,
+    "retrieve_context": aretrieve_context,
+    "capture_important_info": acapture_important_info,
+    "classify_ambiguity": aclassify_ambiguity,
+    "ask_clarification": aask_clarification,
+    "check_answer_cache": acheck_answer_cache,
+    "generate_response": agenerate_response,
+    "summarize_conversation": asummarize_conversation,
+}
+
+
+# classify_ambiguity implementations that also generate the answer speculatively
+SPECULATIVE_CLASSIFIERS = {
+    "sync": classify_ambiguity_speculative,
+    "async": aclassify_ambiguity_speculative,
+}
+
+
+def build_workflow(
+        nodes: dict,
+        speculative: bool = False,
+        background_summary: bool = False,
+        answer_cache: bool = False
+) -> StateGraph:
     """
-    Create and compile the chat graph with the node functions.
+    Build the chat workflow (uncompiled) from a mapping of node names to implementations.
+
+    Args:
+        nodes: Either SYNC_NODES or ASYNC_NODES
+        speculative: Whether generate_response should start in parallel with classify_ambiguity
+        background_summary: Whether summarization runs outside the graph, after the response
+            (see app.services.summary_jobs); the graph then ends after generate_response
+        answer_cache: Whether to look up the semantic answer cache before generate_response
 
     Returns:
-        The compiled graph ready to be invoked
+        The StateGraph with all nodes and edges defined
     """
-    try:
-        # Create the graph with our State type
-        workflow = StateGraph(State)
-
-        # Add the nodes
-        workflow.add_node("retrieve_context", retrieve_context)
-        workflow.add_node("capture_important_info", capture_important_info)
-        workflow.add_node("classify_ambiguity", classify_ambiguity)
-        workflow.add_node("ask_clarification", ask_clarification)
-        workflow.add_node("generate_response", generate_response)
-        workflow.add_node("summarize_conversation", summarize_conversation)
-
-        # Define the flow
-        # Fan-out: START va directamente a ambos nodos en paralelo
-        workflow.add_edge(START, "retrieve_context")
-        workflow.add_edge(START, "capture_important_info")
-        # Fan-in: Ambos nodos alimentan a classify_ambiguity
-        workflow.add_edge(["retrieve_context", "capture_important_info"], "classify_ambiguity")
-        # Después de clasificar, decidir si pedir clarificación o generar respuesta
+    nodes = dict(nodes)
+    if speculative:
+        mode = "async" if inspect.iscoroutinefunction(nodes["classify_ambiguity"]) else "sync"
+        nodes["classify_ambiguity"] = SPECULATIVE_CLASSIFIERS[mode]
+    if background_summary:
+        nodes.pop("summarize_conversation")
+    if not answer_cache:
+        nodes.pop("check_answer_cache")
+
+    # Create the graph with our State type
+    workflow = StateGraph(State)
+
+    # Add the nodes, timed for the /metrics endpoint
+    for name, node in nodes.items():
+        workflow.add_node(name, instrument_node(name, node))
+
+    # Define the flow
+    # Primero se detectan los mensajes triviales, que se responden sin recuperar contexto
+    workflow.add_edge(START, "detect_intent")
+    # Fan-out: si no es trivial, ambos nodos se ejecutan en paralelo
+    workflow.add_conditional_edges(
+        "detect_intent",
+        should_fast_path,
+        ["quick_response", "retrieve_context", "capture_important_info"]
+    )
+    workflow.add_edge("quick_response", END)
+    # Fan-in: Ambos nodos alimentan a classify_ambiguity
+    workflow.add_edge(["retrieve_context", "capture_important_info"], "classify_ambiguity")
+    # Después de clasificar, decidir si pedir clarificación o generar respuesta
+    workflow.add_conditional_edges(
+        "classify_ambiguity",
+        should_ambiguity,
+        {
+            "ask_clarification": "ask_clarification",
+            "generate_response": "check_answer_cache" if answer_cache else "generate_response"
+        }
+    )
+    if answer_cache:
+        # Una respuesta cacheada termina el turno sin llamar al LLM
         workflow.add_conditional_edges(
-            "classify_ambiguity",
-            should_ambiguity,
-            {"ask_clarification": "ask_clarification", "generate_response": "generate_response"}
+            "check_answer_cache",
+            should_generate,
+            {"generate_response": "generate_response", "end": END}
         )
-        # Terminar después de pedir clarificación (esperar respuesta del usuario)
-        workflow.add_edge("ask_clarification", END)
+    # Terminar después de pedir clarificación (esperar respuesta del usuario)
+    workflow.add_edge("ask_clarification", END)
+    if background_summary:
+        # El resumen se programa en segundo plano después de responder
+        workflow.add_edge("generate_response", END)
+    else:
         # Decidir si resumir después de generar respuesta
         workflow.add_conditional_edges(
             "generate_response",
@@ -72,6 +154,28 @@ def create_chat_graph():
         # Terminar después de resumir
         workflow.add_edge("summarize_conversation", END)
 
+    return workflow
+
+
+def should_generate(state: State) -> str:
+    """Decide si generar la respuesta o usar la respuesta cacheada."""
+    return "end" if state.get("cache_hit") else "generate_response"
+
+
+def create_chat_graph():
+    """
+    Create and compile the chat graph with the node functions.
+
+    Returns:
+        The compiled graph ready to be invoked
+    """
+    try:
+        workflow = build_workflow(
+            SYNC_NODES,
+            speculative=SPECULATIVE_GENERATION,
+            answer_cache=ANSWER_CACHE_ENABLED
+        )
+
         store = get_postgres_store()
         checkpointer = get_postgres_saver()
         # Compile the graph with the checkpointer
@@ -84,3 +188,31 @@ def create_chat_graph():
         print(f"Error creating chat graph: {str(e)}")
         logger.error(f"Error creating chat graph: {str(e)}")
         raise
+
+
+async def create_async_chat_graph():
+    """
+    Create and compile the chat graph with the async node functions,
+    backed by the AsyncPostgresSaver and the async connection pool.
+
+    Returns:
+        The compiled graph ready to be invoked with ainvoke
+    """
+    try:
+        workflow = build_workflow(
+            ASYNC_NODES,
+            speculative=SPECULATIVE_GENERATION,
+            background_summary=SUMMARY_IN_BACKGROUND,
+            answer_cache=ANSWER_CACHE_ENABLED
+        )
+
+        store = await get_async_postgres_store()
+        checkpointer = await get_async_postgres_saver()
+        compiled_graph = workflow.compile(checkpointer=checkpointer, store=store)
+
+        logger.info("Async chat graph compiled successfully")
+        return compiled_graph
+
+    except Exception as e:
+        logger.error(f"Error creating async chat graph: {str(e)}")
+        raise
@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Any, Awaitable, Callable, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from app.config.settings import (
+    TURN_DEADLINE_MS,
+    DEADLINE_GENERATE_RESERVE_MS,
+    DEADLINE_OPTIONAL_MIN_MS,
+    DEADLINE_GENERATE_MIN_MS,
+    DEADLINE_MAX_WORKERS
+)
+from app.services.metrics import DEGRADATIONS
+
+logger = logging.getLogger(__name__)
+
+# Thread pool used by the sync graph to bound the duration of blocking calls
+_executor = None
+
+
+class TurnBudget:
+    """
+    Time budget of a chat turn, passed to the graph nodes in config["configurable"]["budget"].
+
+    Nodes ask it how long they may take. Optional stages are skipped when what is left,
+    minus the time reserved for generate_response, is too short; every skipped stage or
+    timed out call is recorded as a degradation of the turn.
+    """
+
+    def __init__(self, budget_ms: float = TURN_DEADLINE_MS):
+        self.budget_ms = budget_ms
+        self.started = time.monotonic()
+        self.deadline = self.started + budget_ms / 1000 if budget_ms > 0 else None
+        self.degradations: List[str] = []
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"TurnBudget(budget_ms={self.budget_ms}, degradations={self.degradations})"
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (None if the turn has no deadline)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def timeout(self, reserve_ms: float = 0, min_ms: float = 0) -> Optional[float]:
+        """
+        Get the timeout for a call of the current stage.
+
+        Args:
+            reserve_ms: Time kept for the later stages of the turn
+            min_ms: Minimum timeout, even when the budget is already spent
+
+        Returns:
+            The timeout in seconds, or None if the turn has no deadline
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        return max(remaining - reserve_ms / 1000, min_ms / 1000)
+
+    def allows(
+            self,
+            stage: str,
+            reserve_ms: float = DEADLINE_GENERATE_RESERVE_MS,
+            min_ms: float = DEADLINE_OPTIONAL_MIN_MS
+    ) -> bool:
+        """
+        Check whether an optional stage should run, recording a degradation if not.
+
+        Args:
+            stage: Name of the stage
+            reserve_ms: Time kept for the later stages of the turn
+            min_ms: Minimum time the stage needs to be worth running
+
+        Returns:
+            True if the stage has at least min_ms left after the reserve
+        """
+        remaining = self.remaining()
+        if remaining is None or (remaining * 1000 - reserve_ms) >= min_ms:
+            return True
+        self.degrade(stage, "skipped")
+        return False
+
+    def degraded(self, stage: str) -> bool:
+        """Check whether a stage was already skipped or cut short in this turn."""
+        with self._lock:
+            return any(degradation.startswith(f"{stage}:") for degradation in self.degradations)
+
+    def degrade(self, stage: str, reason: str) -> None:
+        """Record that a stage was skipped or cut short."""
+        with self._lock:
+            self.degradations.append(f"{stage}:{reason}")
+        DEGRADATIONS.labels(stage=stage, reason=reason).inc()
+        logger.warning(f"Stage {stage} degraded ({reason}) after {self.elapsed_ms():.0f} ms "
+                       f"of a {self.budget_ms} ms budget")
+
+
+def new_turn_budget(deadline_ms: Optional[int] = None) -> TurnBudget:
+    """
+    Create the budget of a new turn.
+
+    Args:
+        deadline_ms: Budget asked for by the client; it can only be shorter than TURN_DEADLINE_MS
+
+    Returns:
+        The TurnBudget, starting now
+    """
+    if deadline_ms is None:
+        return TurnBudget(TURN_DEADLINE_MS)
+    if TURN_DEADLINE_MS > 0:
+        return TurnBudget(min(deadline_ms, TURN_DEADLINE_MS))
+    return TurnBudget(deadline_ms)
+
+
+def get_budget(config: Optional[RunnableConfig]) -> TurnBudget:
+    """Get the turn budget from the graph config (a budget without deadline if there is none)."""
+    budget = ((config or {}).get("configurable") or {}).get("budget")
+    return budget if budget is not None else TurnBudget(0)
+
+
+def optional_timeout(budget: TurnBudget) -> Optional[float]:
+    """Timeout of an optional stage: what is left after the generate_response reserve."""
+    return budget.timeout(reserve_ms=DEADLINE_GENERATE_RESERVE_MS, min_ms=DEADLINE_OPTIONAL_MIN_MS)
+
+
+def generate_timeout(budget: TurnBudget) -> Optional[float]:
+    """Timeout of the answer generation: whatever is left, but at least DEADLINE_GENERATE_MIN_MS."""
+    return budget.timeout(min_ms=DEADLINE_GENERATE_MIN_MS)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Get or create the thread pool for timed calls."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DEADLINE_MAX_WORKERS, thread_name_prefix="deadline")
+    return _executor
+
+
+def call_with_timeout(timeout: Optional[float], func: Callable, *args: Any) -> Any:
+    """
+    Call a blocking function, giving up after timeout seconds.
+
+    The call runs in a worker thread (with the caller's context variables); on timeout
+    it is left to finish in the background, since a thread cannot be interrupted.
+
+    Raises:
+        TimeoutError: If the call did not finish in time
+    """
+    if timeout is None:
+        return func(*args)
+    context = contextvars.copy_context()
+    future = _get_executor().submit(context.run, func, *args)
+    try:
+        return future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Call did not finish in {timeout:.2f}s")
+
+
+async def acall_with_timeout(timeout: Optional[float], awaitable: Awaitable) -> Any:
+    """
+    Await a call, cancelling it after timeout seconds.
+
+    Raises:
+        TimeoutError: If the call did not finish in time
+    """
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Call did not finish in {timeout:.2f}s")
@@ -1,106 +1,204 @@
 import logging
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, AIMessage, RemoveMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_qdrant import Qdrant
-from qdrant_client import QdrantClient
+from langchain_core.runnables import RunnableConfig
 
+from app.graph.deadline import get_budget, optional_timeout, generate_timeout, call_with_timeout, \
+    acall_with_timeout
 from app.graph.state import State, AmbiguityClassification, VehicleInfo
-from app.config.settings import LLM_MODEL, QDRANT_URL, QDRANT_API_KEY
-from app.services.document_service import DocumentService
-from app.util.prompt import ASSISTANT_PROMPT, AMBIGUITY_CLASSIFIER_PROMPT, AMBIGUITY_CLASSIFIER_PROMPT_v2
+from app.config.settings import ANSWER_CACHE_ENABLED
+from app.services.admission import AdmissionError
+from app.services.answer_cache import get_answer_cache
+from app.services.document_service import get_document_service
+from app.services.llm_clients import get_chat_model, get_structured_model
+from app.util.context_assembler import assemble_context, get_token_budget, count_tokens
+from app.util.entity_matcher import match_vehicle_info, merge_vehicle_info
+from app.util.intent_classifier import classify_intent, record_intent, CONFIRMATION
+from app.util.prompt import ASSISTANT_PROMPT, AMBIGUITY_CLASSIFIER_PROMPT, AMBIGUITY_CLASSIFIER_PROMPT_v2, \
+    QUICK_RESPONSES, DEADLINE_ANSWER
 
 logger = logging.getLogger(__name__)
 
-# Singleton document service
-_document_service = None
+# Clasificación usada cuando classify_ambiguity se omite por falta de tiempo
+DEFAULT_CLASSIFICATION = {"is_ambiguous": False, "ambiguity_category": "NINGUNA", "clarification_question": ""}
 
+# Cached response chain (prompt | llm | parser), built once per worker
+_response_chain = None
 
-def get_document_service() -> DocumentService:
-    """Get or create a DocumentService singleton."""
-    global _document_service
-    if _document_service is None:
-        try:
-            _document_service = DocumentService()
-        except Exception as e:
-            logger.error(f"Error initializing document service: {str(e)}")
-            raise
-    return _document_service
 
+def _last_assistant_message(state: State) -> Optional[str]:
+    """Return the content of the assistant's last message, if any."""
+    for message in reversed(state.get("messages") or []):
+        if isinstance(message, AIMessage):
+            return message.content
+    return None
 
-# Nodo para capturar información importante
-def capture_important_info(state: State) -> dict:
+
+def _awaiting_answer(state: State) -> bool:
+    """Check whether the assistant's last message was a question the user may be answering."""
+    last_message = _last_assistant_message(state)
+    return bool(last_message) and last_message.rstrip(" .!)*_").endswith("?")
+
+
+def detect_intent(state: State) -> dict:
     """
-    Analiza la conversación para extraer y almacenar información importante
-    sobre el vehículo y las necesidades del usuario.
+    Detecta localmente saludos, agradecimientos, despedidas y confirmaciones simples,
+    que no necesitan recuperar contexto ni clasificar ambigüedad.
     """
-    llm = ChatOpenAI(model=LLM_MODEL)
+    intent = classify_intent(state["input"])
+
+    # Un "sí" o "no" puede ser la respuesta a una pregunta de clarificación
+    if intent == CONFIRMATION and _awaiting_answer(state):
+        intent = None
+
+    record_intent(intent)
+    if intent:
+        logger.info(f"Trivial intent {intent} detected for input: {state['input'][:50]}")
+    return {"intent": intent}
+
+
+async def adetect_intent(state: State) -> dict:
+    """Async version of detect_intent."""
+    return detect_intent(state)
+
+
+def quick_response(state: State) -> dict:
+    """Responde a un mensaje trivial sin llamar al LLM."""
+    answer = QUICK_RESPONSES[state["intent"]]
+    return {
+        "answer": answer,
+        "messages": [
+            HumanMessage(content=state["input"]),
+            AIMessage(content=answer)
+        ]
+    }
+
+
+async def aquick_response(state: State) -> dict:
+    """Async version of quick_response."""
+    return quick_response(state)
+
 
-    # Obtenemos los mensajes recientes para analizar
-    messages = state["messages"][-5:] if len(state["messages"]) > 5 else state["messages"]
-    logger.info(f"messages: {messages}")
+def _build_capture_messages(state: State, current_info: dict) -> list:
+    """Build the prompt used to extract vehicle information from the newest user message."""
     question = state["input"]
+    last_assistant_message = _last_assistant_message(state) or "(ninguno)"
     # Prompt para extraer la información clave
     system_prompt = f"""
     Eres un asistente experto en analizar conversaciones para extraer información importante.
 
-    A continuación, se te proporciona el historial de una conversación con un usuario sobre revisiones técnicas vehiculares.
+    El usuario conversa sobre revisiones técnicas vehiculares. Ya conocemos esta información de su vehículo:
+    - Tipo de vehículo: {current_info.get("vehicle_type")}
+    - Ubicación de la planta: {current_info.get("plant_location")}
+    - Tipo de servicio: {current_info.get("service_type")}
+    - Categoría tarifaria: {current_info.get("tariff_type")}
 
-    Tu tarea es extraer los siguientes detalles si están presentes:
+    Tu tarea es extraer del NUEVO mensaje del usuario los siguientes detalles si están presentes:
     - Tipo de vehículo (Ejemplo: "taxi", "particular", "transporte de mercancías")
     - Ubicación de la planta (Ejemplo: "sjl", "trapiche", "carabayllo")
     - Tipo de servicio (Ejemplo: "primera vez", "renovación")
     - Categoría tarifaria (Ejemplo: "M1", "N1")
 
-    Si algún dato no está disponible en la conversación, devuelve null para ese campo.
-    
-    pregunta: 
+    Si algún dato no está en el nuevo mensaje, devuelve null para ese campo.
+
+    Último mensaje del asistente (el usuario puede estar respondiéndolo):
+    {last_assistant_message}
+    Nuevo mensaje del usuario:
     {question}
-    Conversación:
-    {messages}
 
     Importante: 
-    1. No inventes información que no esté explícitamente mencionada en la conversación
-    2. Presta especial atención a las respuestas del usuario
+    1. No inventes información que no esté explícitamente mencionada en el mensaje
+    2. Si el usuario responde "sí" o "no" a una pregunta del asistente, usa la pregunta para interpretar la respuesta
     """
 
-    # Configuramos el LLM para obtener salida estructurada
-    structured_llm = llm.with_structured_output(VehicleInfo)
-
-    # Invocamos el modelo
-    result = structured_llm.invoke([
+    return [
         SystemMessage(content=system_prompt),
-        HumanMessage(content="Extrae la información vehicular de esta conversación")
-    ])
+        HumanMessage(content="Extrae la información vehicular del nuevo mensaje")
+    ]
+
 
-    # Actualizamos el estado con la información extraída
-    return {"vehicle_info": result}
+def _match_important_info(state: State) -> Tuple[dict, dict, bool]:
+    """
+    Run the local entity matcher on the newest user message.
+
+    Returns:
+        A tuple (current_info, matched, needs_llm)
+    """
+    current_info = merge_vehicle_info(state.get("vehicle_info"), None)
+    matched, conclusive = match_vehicle_info(state["input"])
+
+    # Una respuesta corta a una pregunta del asistente solo se entiende con la pregunta
+    needs_llm = not conclusive or (not matched and _awaiting_answer(state))
+    return current_info, matched, needs_llm
 
 
-def classify_ambiguity(state: State) -> dict:
+# Nodo para capturar información importante
+def capture_important_info(state: State, config: Optional[RunnableConfig] = None) -> dict:
     """
-    Determina si la consulta del usuario es ambigua y requiere clarificación.
+    Analiza el último mensaje del usuario para extraer información importante
+    sobre el vehículo y la combina con la información ya conocida.
+    El LLM solo se usa cuando el matcher local no es concluyente, y se omite
+    (quedando solo el matcher) cuando el plazo del turno no alcanza.
     """
-    llm = ChatOpenAI(model=LLM_MODEL)
+    current_info, matched, needs_llm = _match_important_info(state)
+    budget = get_budget(config)
+    if not needs_llm or not budget.allows("capture_important_info"):
+        return {"vehicle_info": merge_vehicle_info(current_info, matched)}
+
+    # LLM con salida estructurada (cacheado por nodo y esquema)
+    structured_llm = get_structured_model("capture_important_info", VehicleInfo)
+
+    # Invocamos el modelo
+    try:
+        result = call_with_timeout(
+            optional_timeout(budget), structured_llm.invoke, _build_capture_messages(state, current_info)
+        )
+    except TimeoutError:
+        budget.degrade("capture_important_info", "timeout")
+        return {"vehicle_info": merge_vehicle_info(current_info, matched)}
+
+    # Los valores del matcher local tienen prioridad sobre los del LLM
+    return {"vehicle_info": merge_vehicle_info(merge_vehicle_info(current_info, result), matched)}
+
 
+async def acapture_important_info(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """Async version of capture_important_info."""
+    current_info, matched, needs_llm = _match_important_info(state)
+    budget = get_budget(config)
+    if not needs_llm or not budget.allows("capture_important_info"):
+        return {"vehicle_info": merge_vehicle_info(current_info, matched)}
+
+    structured_llm = get_structured_model("capture_important_info", VehicleInfo)
+
+    try:
+        result = await acall_with_timeout(
+            optional_timeout(budget), structured_llm.ainvoke(_build_capture_messages(state, current_info))
+        )
+    except TimeoutError:
+        budget.degrade("capture_important_info", "timeout")
+        return {"vehicle_info": merge_vehicle_info(current_info, matched)}
+
+    return {"vehicle_info": merge_vehicle_info(merge_vehicle_info(current_info, result), matched)}
+
+
+def _build_classifier_messages(state: State) -> list:
+    """Build the prompt used to classify the ambiguity of the user's query."""
     user_query = state["input"]
-    context = state["context"]
+    context = assemble_context(user_query, state.get("documents") or [], get_token_budget("classify_ambiguity"))
 
     # Preparar historial de conversación en formato legible
     conversation_history = state["messages"][-5:] if len(state["messages"]) > 5 else state["messages"]
 
     # Si hay un resumen, incluirlo también
-    summary = state["summary"]
+    summary = state.get("summary", "")
     vehicle_info = state["vehicle_info"]
 
-    # Configurar el modelo para salida estructurada
-    structured_llm = llm.with_structured_output(AmbiguityClassification)
-
     # Preparar el prompt con los datos actuales
     system_instructions = AMBIGUITY_CLASSIFIER_PROMPT_v2.format(
         user_query=user_query,
@@ -110,11 +208,49 @@ def classify_ambiguity(state: State) -> dict:
         vehicle_info=vehicle_info
     )
 
-    # Invocar el modelo
-    result = structured_llm.invoke([
+    return [
         SystemMessage(content=system_instructions),
         HumanMessage(content="Analiza esta consulta sobre revisiones técnicas vehiculares")
-    ])
+    ]
+
+
+def classify_ambiguity(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """
+    Determina si la consulta del usuario es ambigua y requiere clarificación.
+    Sin tiempo suficiente en el plazo del turno, la consulta se trata como no ambigua.
+    """
+    budget = get_budget(config)
+    if not budget.allows("classify_ambiguity"):
+        return {"ambiguity_classification": dict(DEFAULT_CLASSIFICATION)}
+
+    # Modelo con salida estructurada (cacheado por nodo y esquema)
+    structured_llm = get_structured_model("classify_ambiguity", AmbiguityClassification)
+
+    # Invocar el modelo
+    try:
+        result = call_with_timeout(optional_timeout(budget), structured_llm.invoke, _build_classifier_messages(state))
+    except TimeoutError:
+        budget.degrade("classify_ambiguity", "timeout")
+        result = dict(DEFAULT_CLASSIFICATION)
+
+    return {"ambiguity_classification": result}
+
+
+async def aclassify_ambiguity(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """Async version of classify_ambiguity."""
+    budget = get_budget(config)
+    if not budget.allows("classify_ambiguity"):
+        return {"ambiguity_classification": dict(DEFAULT_CLASSIFICATION)}
+
+    structured_llm = get_structured_model("classify_ambiguity", AmbiguityClassification)
+
+    try:
+        result = await acall_with_timeout(
+            optional_timeout(budget), structured_llm.ainvoke(_build_classifier_messages(state))
+        )
+    except TimeoutError:
+        budget.degrade("classify_ambiguity", "timeout")
+        result = dict(DEFAULT_CLASSIFICATION)
 
     return {"ambiguity_classification": result}
 
@@ -137,138 +273,358 @@ def ask_clarification(state: State) -> dict:
         "previous_categories": [ambiguity_category]  # CORREGIDO: ahora es lista
     }
 
-def retrieve_context(state: State) -> dict:
+
+async def aask_clarification(state: State) -> dict:
+    """Async version of ask_clarification."""
+    return ask_clarification(state)
+
+def _build_documents(search_results: List[Dict[str, Any]]) -> List[Document]:
+    """Convert search results into LangChain Document objects."""
+    documents = []
+    for result in search_results:
+        doc = Document(
+            page_content=result["content"],
+            metadata={
+                **result["metadata"],
+                "score": result["score"],
+                "document_id": result["id"]
+            }
+        )
+        documents.append(doc)
+    return documents
+
+
+def retrieve_context(state: State, config: Optional[RunnableConfig] = None) -> dict:
     """
     Retrieve relevant context based on the user's input.
 
     In a more advanced implementation, this would use a vector store
     to retrieve relevant documents based on the user's query.
+    When the turn's deadline is too close, the answer is generated without context.
 
     Args:
         state: The current state
+        config: The graph config, carrying the turn budget
 
     Returns:
         The updated state with context
     """
     query_text = state["input"]
+    budget = get_budget(config)
+    if not budget.allows("retrieve_context"):
+        return {"context": "", "documents": []}
 
     # Get the document service
     document_service = get_document_service()
 
     # Search for relevant documents
-    search_results = document_service.search_documents(query_text, limit=5)
-
-    # Convert to LangChain Document objects
-    documents = []
-    for result in search_results:
-        doc = Document(
-            page_content=result["content"],
-            metadata={
-                **result["metadata"],
-                "score": result["score"],
-                "document_id": result["id"]
-            }
+    try:
+        search_results = call_with_timeout(
+            optional_timeout(budget), document_service.search_documents, query_text, 5
         )
-        documents.append(doc)
+    except TimeoutError:
+        budget.degrade("retrieve_context", "timeout")
+        return {"context": "", "documents": []}
 
-    # Build context text from documents
-    if documents:
-        context_parts = []
-        for i, doc in enumerate(documents, 1):
-            # Extract title or use a default
-            title = doc.metadata.get("name", f"Document {i}")
-            # Add source info and content
-            context_parts.append(f"Document {i}: {title}\n{doc.page_content}")
+    documents = _build_documents(search_results)
+    # The stored context uses the largest budget; classify_ambiguity trims it further
+    context = assemble_context(query_text, documents, get_token_budget("generate_response"))
+
+    logger.info(f"Retrieved {len(documents)} relevant documents for query: {query_text[:50]}...")
+    return {"context": context, "documents": documents}
 
-        # Join all parts with clear separators
-        context = "\n\n---\n\n".join(context_parts)
-    else:
-        context = ""
 
-    # Update state
-    state["documents"] = documents
-    state["context"] = context
+async def aretrieve_context(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """Async version of retrieve_context."""
+    query_text = state["input"]
+    budget = get_budget(config)
+    if not budget.allows("retrieve_context"):
+        return {"context": "", "documents": []}
+
+    document_service = get_document_service()
+    try:
+        search_results = await acall_with_timeout(
+            optional_timeout(budget), document_service.asearch_documents(query_text, limit=5)
+        )
+    except TimeoutError:
+        budget.degrade("retrieve_context", "timeout")
+        return {"context": "", "documents": []}
+
+    documents = _build_documents(search_results)
+    # The stored context uses the largest budget; classify_ambiguity trims it further
+    context = assemble_context(query_text, documents, get_token_budget("generate_response"))
 
     logger.info(f"Retrieved {len(documents)} relevant documents for query: {query_text[:50]}...")
     return {"context": context, "documents": documents}
 
 
-def generate_response(state: State) -> Dict[str, Any]:
+def get_response_prompt() -> ChatPromptTemplate:
+    """Prompt of the response chain, with context, chat_history, messages and input variables."""
+    return ChatPromptTemplate.from_messages([
+        ("system", ASSISTANT_PROMPT),
+        MessagesPlaceholder(variable_name="messages"),
+        ("human", "{input}")
+    ])
+
+
+def get_response_chain():
+    """
+    Get or create the response chain.
+
+    The system prompt is a template with context and chat_history variables,
+    so the same chain is reused for every turn.
+    """
+    global _response_chain
+    if _response_chain is None:
+        _response_chain = get_response_prompt() | get_chat_model("generate_response") | StrOutputParser()
+    return _response_chain
+
+
+def _build_response_inputs(state: State) -> Dict[str, Any]:
+    """Build the response chain inputs from the current state."""
+    # Limitar la cantidad de mensajes en el historial
+    recent_messages = state["messages"][-5:] if len(state["messages"]) > 5 else state["messages"]
+
+    return {
+        "context": state.get("context", ""),
+        "chat_history": state.get("summary", ""),
+        "messages": recent_messages,
+        "input": state["input"]
+    }
+
+
+def _response_update(state: State, response: str) -> Dict[str, Any]:
+    """Build the state update for a generated response."""
+    return {
+        "answer": response,
+        "messages": [
+            HumanMessage(content=state["input"]),
+            AIMessage(content=response)
+        ]
+    }
+
+
+def _estimate_tokens(state: State, response: str) -> int:
+    """Estimate the prompt and completion tokens a generated response cost."""
+    return sum(count_tokens(text) for text in (
+        ASSISTANT_PROMPT, state.get("context", ""), state.get("summary", ""), state["input"], response
+    ))
+
+
+def _answer_is_cacheable(state: State) -> bool:
+    """
+    Whether the answer of this turn can come from, or go to, the answer cache.
+
+    Only the first turn of a thread: later answers also depend on the history and the
+    summary, which are not part of the cache key.
+    """
+    return not state.get("messages") and not state.get("summary")
+
+
+def check_answer_cache(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """
+    Look up a cached answer for a similar query with the same vehicle info.
+    On a hit the answer is used directly and generate_response is skipped.
+    """
+    # La respuesta especulativa ya está generada, no hay nada que ahorrar
+    if state.get("speculative_answer") or not _answer_is_cacheable(state):
+        return {"cache_hit": False}
+
+    budget = get_budget(config)
+    if not budget.allows("check_answer_cache"):
+        return {"cache_hit": False}
+    try:
+        vector = call_with_timeout(optional_timeout(budget), get_document_service().embed_query, state["input"])
+    except TimeoutError:
+        budget.degrade("check_answer_cache", "timeout")
+        return {"cache_hit": False}
+    hit = get_answer_cache().lookup(state["input"], vector, state.get("vehicle_info"))
+    if hit is None:
+        return {"cache_hit": False}
+
+    logger.info(f"Answer cache hit ({hit['similarity']:.3f}) for input: {state['input'][:50]}...")
+    return {"cache_hit": True, **_response_update(state, hit["answer"])}
+
+
+async def acheck_answer_cache(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """Async version of check_answer_cache."""
+    if state.get("speculative_answer") or not _answer_is_cacheable(state):
+        return {"cache_hit": False}
+
+    budget = get_budget(config)
+    if not budget.allows("check_answer_cache"):
+        return {"cache_hit": False}
+    try:
+        vector = await acall_with_timeout(
+            optional_timeout(budget), get_document_service().aembed_query(state["input"])
+        )
+    except TimeoutError:
+        budget.degrade("check_answer_cache", "timeout")
+        return {"cache_hit": False}
+    hit = await get_answer_cache().alookup(state["input"], vector, state.get("vehicle_info"))
+    if hit is None:
+        return {"cache_hit": False}
+
+    logger.info(f"Answer cache hit ({hit['similarity']:.3f}) for input: {state['input'][:50]}...")
+    return {"cache_hit": True, **_response_update(state, hit["answer"])}
+
+
+def generate_response(state: State, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
     """
     Generate a response based on chat history, context, and summary.
 
+    The model call gets what is left of the turn's deadline (at least DEADLINE_GENERATE_MIN_MS);
+    past it, a canned apology is answered instead and not cached.
+
     Args:
         state: The current state including user input, chat history, and context.
+        config: The graph config, carrying the turn budget
 
     Returns:
         Updated state with the generated answer.
     """
     try:
-        llm = ChatOpenAI(model=LLM_MODEL)
-        context = state["context"]
-        summary = state["summary"]
-
-        # Construir el mensaje del sistema con el contexto y resumen
-        system_message = ASSISTANT_PROMPT.format(
-            context=context,
-            chat_history=summary
-        )
+        started = time.perf_counter()
+        # Reutilizar la respuesta especulativa si ya se generó durante la clasificación
+        response = state.get("speculative_answer")
+        if not response:
+            # Ejecutar la cadena del modelo
+            budget = get_budget(config)
+            if budget.degraded("speculative_answer"):
+                # La generación especulativa ya agotó el plazo, no se intenta de nuevo
+                budget.degrade("generate_response", "skipped")
+                return _response_update(state, DEADLINE_ANSWER)
+            try:
+                response = call_with_timeout(
+                    generate_timeout(budget), get_response_chain().invoke, _build_response_inputs(state)
+                )
+            except TimeoutError:
+                budget.degrade("generate_response", "timeout")
+                return _response_update(state, DEADLINE_ANSWER)
+        generation_ms = (time.perf_counter() - started) * 1000
+
+        if ANSWER_CACHE_ENABLED and _answer_is_cacheable(state):
+            get_answer_cache().store(
+                state["input"],
+                get_document_service().embed_query(state["input"]),
+                state.get("vehicle_info"),
+                response,
+                tokens=_estimate_tokens(state, response),
+                generation_ms=generation_ms
+            )
 
-        # Limitar la cantidad de mensajes en el historial
-        recent_messages = state["messages"][-5:] if len(state["messages"]) > 5 else state["messages"]
-
-        # Construir el prompt con historial y nuevo input
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_message),
-            MessagesPlaceholder(variable_name="messages"),
-            ("human", "{input}")
-        ])
-
-        # Ejecutar la cadena del modelo
-        chain = prompt | llm | StrOutputParser()
-        response = chain.invoke({
-            "messages": recent_messages,
-            "input": state["input"]
-        })
-
-        # Guardar la respuesta y actualizar el historial de chat
-        state["answer"] = response
-        state["messages"] += [
-            HumanMessage(content=state["input"]),
-            AIMessage(content=response)
-        ]
+        logger.info(f"Generated response for input: {state['input'][:50]}...")
+        return _response_update(state, response)
+
+    except AdmissionError:
+        # Surfaced to the routers as 429/503
+        raise
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        raise Exception("I'm sorry, I encountered an error generating a response.")
+
+
+async def agenerate_response(state: State, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """Async version of generate_response."""
+    try:
+        started = time.perf_counter()
+        response = state.get("speculative_answer")
+        if not response:
+            budget = get_budget(config)
+            if budget.degraded("speculative_answer"):
+                # La generación especulativa ya agotó el plazo, no se intenta de nuevo
+                budget.degrade("generate_response", "skipped")
+                return _response_update(state, DEADLINE_ANSWER)
+            try:
+                response = await acall_with_timeout(
+                    generate_timeout(budget), get_response_chain().ainvoke(_build_response_inputs(state))
+                )
+            except TimeoutError:
+                budget.degrade("generate_response", "timeout")
+                return _response_update(state, DEADLINE_ANSWER)
+        generation_ms = (time.perf_counter() - started) * 1000
+
+        if ANSWER_CACHE_ENABLED and _answer_is_cacheable(state):
+            await get_answer_cache().astore(
+                state["input"],
+                await get_document_service().aembed_query(state["input"]),
+                state.get("vehicle_info"),
+                response,
+                tokens=_estimate_tokens(state, response),
+                generation_ms=generation_ms
+            )
 
         logger.info(f"Generated response for input: {state['input'][:50]}...")
-        return state
+        return _response_update(state, response)
 
+    except AdmissionError:
+        # Surfaced to the routers as 429/503
+        raise
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
         raise Exception("I'm sorry, I encountered an error generating a response.")
 
 
-def summarize_conversation(state: State) -> Dict[str, Any]:
+def _build_summary_messages(state: State) -> list:
+    """Build the messages used to summarize the conversation."""
+    summary = state.get("summary", "")
+    summary_prompt = (
+        f"This is the current summary: {summary}\nExtend it with the new messages:"
+        if summary else "Create a summary of the conversation above:"
+    )
+
+    # Agregar el prompt al historial
+    return state["messages"] + [HumanMessage(content=summary_prompt)]
+
+
+def _summary_update(state: State, summary: str) -> Dict[str, Any]:
+    """Build the state update that stores the summary and trims old messages."""
+    # Eliminar todos los mensajes excepto los 2 más recientes
+    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
+
+    return {"summary": summary, "messages": delete_messages}
+
+
+def summarize_conversation(state: State, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
     """
     Summarizes the conversation and removes old messages.
+    Skipped when the turn's deadline is too close; the next turn summarizes instead.
 
     Args:
         state: The current state including chat history.
+        config: The graph config, carrying the turn budget
 
     Returns:
         Updated state with summary and trimmed messages.
     """
-    llm = ChatOpenAI(model=LLM_MODEL)
+    budget = get_budget(config)
+    if not budget.allows("summarize_conversation", reserve_ms=0):
+        return {}
 
-    summary = state.get("summary", "")
-    summary_prompt = (
-        f"This is the current summary: {summary}\nExtend it with the new messages:"
-        if summary else "Create a summary of the conversation above:"
-    )
+    llm = get_chat_model("summarize_conversation")
 
-    # Agregar el prompt al historial y ejecutar el resumen con el modelo
-    messages = state["messages"] + [HumanMessage(content=summary_prompt)]
-    response = llm.invoke(messages)
+    # Ejecutar el resumen con el modelo
+    try:
+        response = call_with_timeout(budget.timeout(), llm.invoke, _build_summary_messages(state))
+    except TimeoutError:
+        budget.degrade("summarize_conversation", "timeout")
+        return {}
 
-    # Eliminar todos los mensajes excepto los 2 más recientes
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
+    return _summary_update(state, response.content)
+
+
+async def asummarize_conversation(state: State, config: Optional[RunnableConfig] = None) -> Dict[str, Any]:
+    """Async version of summarize_conversation."""
+    budget = get_budget(config)
+    if not budget.allows("summarize_conversation", reserve_ms=0):
+        return {}
+
+    llm = get_chat_model("summarize_conversation")
+
+    try:
+        response = await acall_with_timeout(budget.timeout(), llm.ainvoke(_build_summary_messages(state)))
+    except TimeoutError:
+        budget.degrade("summarize_conversation", "timeout")
+        return {}
 
-    return {"summary": response.content, "messages": delete_messages}
+    return _summary_update(state, response.content)
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config.settings import CHAT_GRAPH_VERSION
+from app.graph.chat_graph import create_chat_graph, create_async_chat_graph
+
+logger = logging.getLogger(__name__)
+
+
+class ChatGraphRegistry:
+    """
+    Process-wide registry of compiled chat graphs.
+
+    The graph is compiled once per worker (normally from the startup event) and the
+    same compiled instance is handed out to every request. Graph definitions are
+    registered by version; activating a new version compiles it first and then swaps
+    the active reference, so in-flight requests keep running on the graph they got.
+
+    Each version has a synchronous builder (PostgresSaver, used with invoke) and an
+    asynchronous builder (AsyncPostgresSaver, used with ainvoke).
+    """
+
+    def __init__(self, default_version: str = CHAT_GRAPH_VERSION):
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._builders: Dict[str, Callable[[], Any]] = {default_version: create_chat_graph}
+        self._async_builders: Dict[str, Callable[[], Awaitable[Any]]] = {default_version: create_async_chat_graph}
+        self._active_version = default_version
+        self._active_graph = None
+        self._active_async_graph = None
+        self._compiled_at: Optional[float] = None
+        self._compile_time_ms: Optional[float] = None
+        self._async_compile_time_ms: Optional[float] = None
+        self._compile_count = 0
+
+    def register_builder(
+            self,
+            version: str,
+            builder: Optional[Callable[[], Any]] = None,
+            async_builder: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> None:
+        """
+        Register graph builders under a version.
+
+        Args:
+            version: Version label of the graph definition
+            builder: Optional callable returning a compiled synchronous graph
+            async_builder: Optional coroutine function returning a compiled async graph
+        """
+        with self._lock:
+            if builder is not None:
+                self._builders[version] = builder
+            if async_builder is not None:
+                self._async_builders[version] = async_builder
+        logger.info(f"Registered chat graph builder for version {version}")
+
+    def _compile(self, version: str):
+        """Compile the synchronous graph for the given version and return it with the elapsed time."""
+        builder = self._builders.get(version)
+        if builder is None:
+            raise ValueError(f"No chat graph builder registered for version {version}")
+
+        start = time.perf_counter()
+        graph = builder()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Chat graph version {version} compiled in {elapsed_ms:.1f} ms")
+        return graph, elapsed_ms
+
+    async def _acompile(self, version: str):
+        """Compile the async graph for the given version and return it with the elapsed time."""
+        builder = self._async_builders.get(version)
+        if builder is None:
+            raise ValueError(f"No async chat graph builder registered for version {version}")
+
+        start = time.perf_counter()
+        graph = await builder()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Async chat graph version {version} compiled in {elapsed_ms:.1f} ms")
+        return graph, elapsed_ms
+
+    def _get_async_lock(self) -> asyncio.Lock:
+        """Create the asyncio lock lazily, inside the running event loop."""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    def warmup(self) -> Dict[str, Any]:
+        """
+        Compile the active synchronous graph version if it has not been compiled yet.
+
+        Returns:
+            Information about the active graph
+        """
+        self.get_graph()
+        return self.info()
+
+    async def awarmup(self) -> Dict[str, Any]:
+        """
+        Compile both the synchronous and async graphs for the active version.
+
+        Returns:
+            Information about the active graph
+        """
+        await asyncio.to_thread(self.get_graph)
+        await self.aget_graph()
+        return self.info()
+
+    def get_graph(self):
+        """
+        Get the shared compiled synchronous graph, compiling it on first use.
+
+        Returns:
+            The compiled graph for the active version
+        """
+        graph = self._active_graph
+        if graph is not None:
+            return graph
+
+        with self._lock:
+            # Another thread may have compiled it while we waited for the lock
+            if self._active_graph is None:
+                graph, elapsed_ms = self._compile(self._active_version)
+                self._active_graph = graph
+                self._compile_time_ms = elapsed_ms
+                self._mark_compiled()
+            return self._active_graph
+
+    async def aget_graph(self):
+        """
+        Get the shared compiled async graph, compiling it on first use.
+
+        Returns:
+            The compiled async graph for the active version
+        """
+        graph = self._active_async_graph
+        if graph is not None:
+            return graph
+
+        async with self._get_async_lock():
+            if self._active_async_graph is None:
+                graph, elapsed_ms = await self._acompile(self._active_version)
+                self._active_async_graph = graph
+                self._async_compile_time_ms = elapsed_ms
+                self._mark_compiled()
+            return self._active_async_graph
+
+    async def aswap(
+            self,
+            version: str,
+            builder: Optional[Callable[[], Any]] = None,
+            async_builder: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Compile a graph version and make it the active one.
+
+        The graphs are compiled before the swap, so requests keep being served by the
+        previous graphs until the new ones are ready. A version registered with a single
+        builder only gets that graph; asking for the other one then raises ValueError.
+
+        Args:
+            version: Version label to activate
+            builder: Optional synchronous builder to register for this version
+            async_builder: Optional async builder to register for this version
+
+        Returns:
+            Information about the newly active graph
+        """
+        if builder is not None or async_builder is not None:
+            self.register_builder(version, builder, async_builder)
+
+        if version not in self._builders and version not in self._async_builders:
+            raise ValueError(f"No chat graph builder registered for version {version}")
+
+        async with self._get_async_lock():
+            # Only the graphs the version has a builder for; the other one stays uncompiled
+            graph, elapsed_ms = None, None
+            if version in self._builders:
+                graph, elapsed_ms = await asyncio.to_thread(self._compile, version)
+            async_graph, async_elapsed_ms = None, None
+            if version in self._async_builders:
+                async_graph, async_elapsed_ms = await self._acompile(version)
+
+            with self._lock:
+                previous_version = self._active_version
+                self._active_version = version
+                self._active_graph = graph
+                self._active_async_graph = async_graph
+                self._compile_time_ms = elapsed_ms
+                self._async_compile_time_ms = async_elapsed_ms
+                self._mark_compiled()
+
+        logger.info(f"Chat graph swapped from version {previous_version} to {version}")
+        return self.info()
+
+    def _mark_compiled(self) -> None:
+        """Record the time of the latest compilation."""
+        self._compiled_at = time.time()
+        self._compile_count += 1
+
+    def info(self) -> Dict[str, Any]:
+        """Return the active version, compile times and compile count."""
+        return {
+            "version": self._active_version,
+            "compiled": self._active_graph is not None,
+            "async_compiled": self._active_async_graph is not None,
+            "compiled_at": self._compiled_at,
+            "compile_time_ms": round(self._compile_time_ms, 2) if self._compile_time_ms is not None else None,
+            "async_compile_time_ms": (
+                round(self._async_compile_time_ms, 2) if self._async_compile_time_ms is not None else None
+            ),
+            "compile_count": self._compile_count,
+            "versions": sorted(set(self._builders) | set(self._async_builders)),
+        }
+
+
+# Singleton registry
+_graph_registry = None
+
+
+def get_graph_registry() -> ChatGraphRegistry:
+    """Get or create the ChatGraphRegistry singleton."""
+    global _graph_registry
+    if _graph_registry is None:
+        _graph_registry = ChatGraphRegistry()
+    return _graph_registry
+
+
+def get_chat_graph():
+    """Get the shared compiled synchronous chat graph for this worker."""
+    return get_graph_registry().get_graph()
+
+
+async def get_async_chat_graph():
+    """Get the shared compiled async chat graph for this worker."""
+    return await get_graph_registry().aget_graph()
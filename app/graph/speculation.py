@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, Any, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from app.config.settings import SPECULATIVE_MAX_WORKERS
+from app.graph.deadline import get_budget, optional_timeout, generate_timeout, call_with_timeout, \
+    acall_with_timeout, TurnBudget
+from app.graph.nodes import _build_classifier_messages, _build_response_inputs, get_response_chain, \
+    DEFAULT_CLASSIFICATION
+from app.graph.state import State, AmbiguityClassification
+from app.services.llm_clients import get_structured_model
+
+logger = logging.getLogger(__name__)
+
+# Thread pool used by the sync graph to run the speculative answer
+_executor = None
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Get or create the thread pool for speculative generation."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_WORKERS, thread_name_prefix="speculative")
+    return _executor
+
+
+def _record(outcome: str) -> None:
+    """Count a speculation outcome: useful, wasted or failed."""
+    with _stats_lock:
+        _stats["started"] += 1
+        _stats[outcome] += 1
+
+
+def get_speculation_stats() -> Dict[str, Any]:
+    """
+    Get the speculative generation counters.
+
+    Returns:
+        Dictionary with started, useful, wasted and failed speculations and the useful ratio
+    """
+    with _stats_lock:
+        started = _stats["started"]
+        return {
+            "started": started,
+            "useful": _stats["useful"],
+            "wasted": _stats["wasted"],
+            "failed": _stats["failed"],
+            "useful_ratio": round(_stats["useful"] / started, 4) if started else 0.0,
+        }
+
+
+def _classify(state: State, budget: TurnBudget) -> Dict[str, Any]:
+    """Classify the query within the turn budget; without time for it the query is not ambiguous."""
+    if not budget.allows("classify_ambiguity"):
+        return dict(DEFAULT_CLASSIFICATION)
+    structured_llm = get_structured_model("classify_ambiguity", AmbiguityClassification)
+    try:
+        return call_with_timeout(optional_timeout(budget), structured_llm.invoke, _build_classifier_messages(state))
+    except TimeoutError:
+        budget.degrade("classify_ambiguity", "timeout")
+        return dict(DEFAULT_CLASSIFICATION)
+
+
+async def _aclassify(state: State, budget: TurnBudget) -> Dict[str, Any]:
+    """Async version of _classify."""
+    if not budget.allows("classify_ambiguity"):
+        return dict(DEFAULT_CLASSIFICATION)
+    structured_llm = get_structured_model("classify_ambiguity", AmbiguityClassification)
+    try:
+        return await acall_with_timeout(
+            optional_timeout(budget), structured_llm.ainvoke(_build_classifier_messages(state))
+        )
+    except TimeoutError:
+        budget.degrade("classify_ambiguity", "timeout")
+        return dict(DEFAULT_CLASSIFICATION)
+
+
+def classify_ambiguity_speculative(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """
+    Clasifica la ambigüedad mientras genera la respuesta en paralelo.
+
+    If the query turns out to be ambiguous, the speculative answer is discarded
+    (a running thread cannot be interrupted); otherwise generate_response reuses it.
+    A speculative answer not ready within the turn budget is given up on as failed.
+    """
+    budget = get_budget(config)
+    # The worker thread runs in a copy of this context (admission client, trace ID, callbacks)
+    context = contextvars.copy_context()
+    generation = _get_executor().submit(context.run, get_response_chain().invoke, _build_response_inputs(state))
+
+    try:
+        classification = _classify(state, budget)
+    except Exception:
+        generation.cancel()
+        _record("wasted")
+        raise
+
+    if classification["is_ambiguous"]:
+        generation.cancel()
+        _record("wasted")
+        return {"ambiguity_classification": classification, "speculative_answer": None}
+
+    try:
+        answer = generation.result(timeout=generate_timeout(budget))
+    except FuturesTimeoutError:
+        budget.degrade("speculative_answer", "timeout")
+        _record("failed")
+        answer = None
+    except Exception as e:
+        # generate_response will try again without speculation
+        logger.warning(f"Speculative generation failed: {str(e)}")
+        _record("failed")
+        answer = None
+    else:
+        _record("useful")
+
+    return {"ambiguity_classification": classification, "speculative_answer": answer}
+
+
+async def aclassify_ambiguity_speculative(state: State, config: Optional[RunnableConfig] = None) -> dict:
+    """
+    Async version of classify_ambiguity_speculative.
+    The speculative answer task is cancelled as soon as the query is classified as ambiguous.
+    """
+    budget = get_budget(config)
+    generation = asyncio.create_task(get_response_chain().ainvoke(_build_response_inputs(state)))
+
+    try:
+        classification = await _aclassify(state, budget)
+    except Exception:
+        generation.cancel()
+        _record("wasted")
+        raise
+
+    if classification["is_ambiguous"]:
+        generation.cancel()
+        _record("wasted")
+        return {"ambiguity_classification": classification, "speculative_answer": None}
+
+    try:
+        answer = await acall_with_timeout(generate_timeout(budget), generation)
+    except TimeoutError:
+        budget.degrade("speculative_answer", "timeout")
+        _record("failed")
+        answer = None
+    except Exception as e:
+        logger.warning(f"Speculative generation failed: {str(e)}")
+        _record("failed")
+        answer = None
+    else:
+        _record("useful")
+
+    return {"ambiguity_classification": classification, "speculative_answer": answer}
@@ -6,6 +6,7 @@ from langchain_core.messages import AIMessage, HumanMessage, BaseMessage
 from langchain_core.documents import Document
 from typing import List, Optional, TypedDict, Annotated
 
+from langgraph.channels import UntrackedValue
 from langgraph.graph import add_messages
 class AmbiguityClassification(TypedDict):
     is_ambiguous: Optional[bool]  # For tracking whether the user's input is ambiguous
@@ -19,12 +20,17 @@ class VehicleInfo(TypedDict):
     service_type: Optional[str]  # tipo de servicio (primera vez, renovación)
     tariff_type: Optional[str]  # categoría tarifaria
 
+# Los campos UntrackedValue solo viven durante el turno: nunca se guardan en los checkpoints
 class State(TypedDict):
     input: str
+    intent: Optional[str]  # trivial intent detected by the local pre-classifier (None for normal queries)
     messages: Annotated[List[BaseMessage], add_messages]
-    context: str
+    context: Annotated[str, UntrackedValue]  # retrieved context of this turn (not checkpointed)
     answer: str
-    documents: Optional[List[Document]]  # For storing retrieved documents
+    # answer generated in parallel with the ambiguity classification (not checkpointed)
+    speculative_answer: Annotated[Optional[str], UntrackedValue]
+    cache_hit: Optional[bool]  # whether the answer of this turn came from the semantic answer cache
+    documents: Annotated[Optional[List[Document]], UntrackedValue]  # retrieved documents (not checkpointed)
     web_search: Optional[str]  # For deciding whether to perform a web search
     summary: Optional[str]  # For storing the summary of the conversation
     ambiguity_classification: AmbiguityClassification
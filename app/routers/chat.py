@@ -1,10 +1,25 @@
+import json
 import logging
-from typing import Optional, List, Dict, Any
-from fastapi import APIRouter, HTTPException
+from contextlib import aclosing
+from typing import Optional, List, Dict, Any, AsyncIterator
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from pydantic import BaseModel, Field
 
-from app.services.chat_service import process_message, get_chat_history
+from app.services.admission import AdmissionError, get_admission_controller, current_client
+from app.config.settings import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, BATCH_MAX_ITEMS, \
+    BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY, TRACE_ID_HEADER, LLM_NODES, LLM_HEDGING, LLM_HEDGE_NODES
+from app.services.batch_service import aprocess_batch
+from app.services.metrics import trace_id, new_trace_id
+from app.services.model_router import get_model_router
+from app.services.hedging import get_hedging_policy
+from app.services.llm_clients import get_node_model_settings
+from app.services.chat_service import get_chat_history
+from app.services.answer_cache import get_answer_cache
+from app.services.summary_jobs import get_summary_job_queue
+from app.services.turn_scheduler import get_turn_scheduler, TurnQueueFullError, StreamSlot
 
 router = APIRouter(
     prefix="/chat",
@@ -19,6 +34,8 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="The user's message")
     thread_id: str = Field(..., description="Unique identifier for the conversation thread")
     reset_thread: bool = Field(False, description="Whether to reset the thread and start a new conversation")
+    deadline_ms: Optional[int] = Field(None, gt=0,
+                                       description="Time budget of the turn in ms (capped by TURN_DEADLINE_MS)")
 
 
 class ChatResponse(BaseModel):
@@ -26,16 +43,32 @@ class ChatResponse(BaseModel):
     message: str = Field(..., description="The original user message")
     answer: str = Field(..., description="The assistant's response")
     error: Optional[str] = Field(None, description="Error message if an error occurred")
+    degradations: List[str] = Field(default_factory=list,
+                                    description="Stages skipped or cut short to meet the deadline (stage:reason)")
+
+
+class BatchItem(BaseModel):
+    thread_id: str = Field(..., description="Conversation thread of the message")
+    message: str = Field(..., description="The user's message")
+    id: Optional[str] = Field(None, description="Optional client identifier echoed in the result")
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    concurrency: int = Field(BATCH_DEFAULT_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY,
+                             description="Maximum number of turns running at the same time")
 
 
 class ChatHistoryItem(BaseModel):
     role: str = Field(..., description="The role of the message sender (human or ai)")
     content: str = Field(..., description="The content of the message")
+    seq: Optional[int] = Field(None, description="Position of the message in the thread")
 
 
 class ChatHistoryResponse(BaseModel):
     thread_id: str = Field(..., description="The thread ID")
     messages: List[ChatHistoryItem] = Field(default_factory=list, description="List of messages in the conversation")
+    next_cursor: Optional[int] = Field(None, description="Cursor for the previous (older) page, if any")
 
 
 @router.post("/message", response_model=ChatResponse)
@@ -51,47 +84,244 @@ async def chat_message(request: ChatRequest) -> Dict[str, Any]:
     """
     try:
         logger.info(f"Processing chat message for thread: {request.thread_id}")
-        result = process_message(
-            message=request.message,
+        # Turns of the same thread are serialized; queued fragments may be merged
+        result = await get_turn_scheduler().submit(
             thread_id=request.thread_id,
-            reset_thread=request.reset_thread
+            message=request.message,
+            reset_thread=request.reset_thread,
+            deadline_ms=request.deadline_ms
         )
 
         return result
 
+    except TurnQueueFullError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=429, detail=str(e))
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
     except Exception as e:
         print(e)
         logger.error(f"Error in chat_message endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _sse_events(request: ChatRequest, slot: StreamSlot) -> AsyncIterator[str]:
+    """Format the chat stream events as Server-Sent Events."""
+    async for event in get_turn_scheduler().stream(
+            slot,
+            message=request.message,
+            reset_thread=request.reset_thread,
+            deadline_ms=request.deadline_ms
+    ):
+        yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    Send a message to the chat assistant and stream the response as Server-Sent Events.
+
+    Emits "node" events as graph nodes finish, "token" events with answer chunks,
+    a single "clarification" event when the assistant asks for more information,
+    and a final "end" event once the turn has been checkpointed.
+
+    Args:
+        request: The chat request containing the message and thread ID
+
+    Returns:
+        A text/event-stream response
+    """
+    logger.info(f"Streaming chat message for thread: {request.thread_id}")
+    try:
+        # Reject before the response starts if the thread already has too many turns waiting
+        slot = get_turn_scheduler().reserve_stream(request.thread_id)
+    except TurnQueueFullError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=429, detail=str(e))
+
+    return StreamingResponse(
+        _sse_events(request, slot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # The slot is not given back by the stream if the client left before it started
+        background=BackgroundTask(slot.release)
+    )
+
+
+async def _ndjson_results(request: BatchRequest) -> AsyncIterator[str]:
+    """Format the batch results as newline-delimited JSON."""
+    items = [item.model_dump() for item in request.items]
+    async for result in aprocess_batch(items, concurrency=request.concurrency):
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+
+
+@router.post("/batch")
+async def chat_batch(request: BatchRequest) -> StreamingResponse:
+    """
+    Run many messages through the chat assistant with bounded concurrency.
+
+    Results are streamed as NDJSON in completion order, one line per item with its
+    answer or error and timings, followed by a summary line with "done": true.
+    Messages of the same thread are processed in order.
+
+    Args:
+        request: The items and the concurrency
+
+    Returns:
+        An application/x-ndjson response
+    """
+    logger.info(f"Processing chat batch of {len(request.items)} items (concurrency {request.concurrency})")
+    return StreamingResponse(_ndjson_results(request), media_type="application/x-ndjson")
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    WebSocket version of /chat/stream.
+
+    Each received JSON message must match ChatRequest; the events of that turn are
+    sent back as JSON messages, ending with an "end" or "error" event.
+    """
+    await websocket.accept()
+    # HTTP middleware does not run for WebSockets; identify the client and trace here
+    current_client.set(
+        websocket.headers.get("X-Client-Id") or (websocket.client.host if websocket.client else "anonymous")
+    )
+    trace_id.set(new_trace_id(websocket.headers.get(TRACE_ID_HEADER)))
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                request = ChatRequest(**payload)
+            except Exception as e:
+                await websocket.send_json({"event": "error", "error": f"Invalid request: {str(e)}"})
+                continue
+
+            logger.info(f"Streaming chat message over WebSocket for thread: {request.thread_id}")
+            scheduler = get_turn_scheduler()
+            try:
+                slot = scheduler.reserve_stream(request.thread_id)
+            except TurnQueueFullError as e:
+                await websocket.send_json({"event": "error", "thread_id": request.thread_id, "error": str(e)})
+                continue
+
+            # Closed right away if the client disconnects, so the thread's lock and the slot are released
+            async with aclosing(scheduler.stream(
+                    slot,
+                    message=request.message,
+                    reset_thread=request.reset_thread,
+                    deadline_ms=request.deadline_ms
+            )) as events:
+                try:
+                    async for event in events:
+                        await websocket.send_json(event)
+                finally:
+                    slot.release()
+
+    except WebSocketDisconnect:
+        logger.info("Chat WebSocket disconnected")
+
+
 @router.get("/history/{thread_id}", response_model=ChatHistoryResponse)
-async def chat_history(thread_id: str) -> Dict[str, Any]:
+async def chat_history(
+        thread_id: str,
+        cursor: Optional[int] = Query(None, description="next_cursor of the previous page, for older messages"),
+        limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE)
+) -> Dict[str, Any]:
     """
-    Get the chat history for a specific thread.
+    Get the chat history for a specific thread, newest page first.
 
     Args:
         thread_id: The thread ID to retrieve history for
+        cursor: Cursor returned by the previous page
+        limit: Maximum number of messages in the page
 
     Returns:
-        The chat history response with messages
+        The chat history response with messages in chronological order
     """
     try:
         logger.info(f"Retrieving chat history for thread: {thread_id}")
-        history = await get_chat_history(thread_id)
+        history = await get_chat_history(thread_id, cursor=cursor, limit=limit)
 
         # Convert to the response format
         history_items = [
-            ChatHistoryItem(role=item["role"], content=item["content"])
-            for item in history
+            ChatHistoryItem(role=item["role"], content=item["content"], seq=item.get("seq"))
+            for item in history["messages"]
         ]
 
         return {
             "thread_id": thread_id,
-            "messages": history_items
+            "messages": history_items,
+            "next_cursor": history["next_cursor"]
         }
 
     except Exception as e:
         logger.error(f"Error in chat_history endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/summary-jobs")
+async def summary_jobs() -> Dict[str, Any]:
+    """
+    Inspect the background summarization queue.
+
+    Returns:
+        Counters, pending and running jobs and the most recent finished jobs
+    """
+    return get_summary_job_queue().status()
+
+
+@router.get("/turns")
+async def turn_scheduler_status() -> Dict[str, Any]:
+    """
+    Inspect the per-thread turn scheduler.
+
+    Returns:
+        Settings, counters (turns, coalesced and rejected messages) and the threads with waiting turns
+    """
+    return get_turn_scheduler().status()
+
+
+@router.get("/admission")
+async def admission_stats() -> Dict[str, Any]:
+    """
+    Inspect the model admission controller.
+
+    Returns:
+        Admitted, queued and shed chat model calls, queue depth per client and bucket levels,
+        and the same for the embeddings calls under "embeddings"
+    """
+    return {**get_admission_controller().stats(), "embeddings": get_admission_controller("embeddings").stats()}
+
+
+@router.get("/models")
+async def model_routing() -> Dict[str, Any]:
+    """
+    Inspect the model routing.
+
+    Returns:
+        The fallback chain, latency target and hedging of each node, the recent latency
+        and error rate of each model, and the hedging stats
+    """
+    model_router = get_model_router()
+    nodes = {}
+    for node in LLM_NODES:
+        settings = get_node_model_settings(node)
+        nodes[node] = {
+            "models": settings["models"],
+            "latency_target_ms": settings["latency_target_ms"],
+            "next_order": model_router.order(settings["models"], settings["latency_target_ms"]),
+            "hedged": LLM_HEDGING and node in LLM_HEDGE_NODES,
+        }
+    return {"nodes": nodes, **model_router.stats(), "hedging": get_hedging_policy().stats()}
+
+
+@router.get("/answer-cache/stats")
+async def answer_cache_stats() -> Dict[str, Any]:
+    """
+    Get the semantic answer cache counters.
+
+    Returns:
+        Hit rate, saved tokens, saved time and lookup latency
+    """
+    return get_answer_cache().stats()
@@ -1,9 +1,16 @@
+import asyncio
+import json
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.services.document_service import DocumentService
+from app.config.settings import BULK_MAX_BYTES
+from app.services.admission import AdmissionError
+from app.services.bulk_ingest import BulkUploadError, expand_uploads, aingest_files
+from app.services.document_service import DocumentService, get_document_service as get_shared_document_service
+from app.services.embedding_cache import get_query_embedding_cache
 
 router = APIRouter(
     prefix="/documents",
@@ -16,8 +23,7 @@ logger = logging.getLogger(__name__)
 # Dependency for document service
 def get_document_service():
     try:
-        service = DocumentService()
-        return service
+        return get_shared_document_service()
     except Exception as e:
         logger.error(f"Error initializing document service: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Could not initialize document service: {str(e)}")
@@ -36,6 +42,7 @@ class DocumentResponse(BaseModel):
     drive_file_id: Optional[str] = None
     filename: str
     content_length: int
+    chunks: Optional[int] = None
     metadata: Dict[str, Any]
 
 
@@ -49,6 +56,7 @@ class SearchResult(BaseModel):
     score: float
     content: str
     metadata: Dict[str, Any]
+    chunks: List[Dict[str, Any]] = Field(default_factory=list)  # matching chunks of the document
 
 
 class SearchResponse(BaseModel):
@@ -57,6 +65,16 @@ class SearchResponse(BaseModel):
     count: int
 
 
+def _parse_metadata(metadata_json: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse the optional metadata JSON form field."""
+    if not metadata_json:
+        return None
+    try:
+        return json.loads(metadata_json)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid metadata JSON")
+
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
         file: UploadFile = File(...),
@@ -80,13 +98,7 @@ async def upload_document(
         file_content = await file.read()
 
         # Parse metadata if provided
-        metadata = None
-        if metadata_json:
-            import json
-            try:
-                metadata = json.loads(metadata_json)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=400, detail="Invalid metadata JSON")
+        metadata = _parse_metadata(metadata_json)
 
         # Process the document
         result = await document_service.upload_document(
@@ -102,11 +114,54 @@ async def upload_document(
 
         return result
 
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
     except Exception as e:
         logger.error(f"Error uploading document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _ndjson_results(files: List[Dict[str, Any]], metadata: Optional[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Format the bulk upload results as newline-delimited JSON."""
+    async for result in aingest_files(files, metadata):
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+
+
+@router.post("/bulk")
+async def bulk_upload(
+        files: List[UploadFile] = File(...),
+        metadata_json: Optional[str] = Form(None),
+        document_service: DocumentService = Depends(get_document_service)
+) -> StreamingResponse:
+    """
+    Upload many documents, or zip archives of documents, for processing and indexing.
+
+    Results are streamed as NDJSON in completion order, one line per file (archives
+    count their members) with its document ID or error, followed by a summary line
+    with "done": true. Files of unsupported types are skipped.
+
+    Args:
+        files: The document files and zip archives to upload
+        metadata_json: Optional JSON string with additional metadata for every document
+
+    Returns:
+        An application/x-ndjson response
+    """
+    metadata = _parse_metadata(metadata_json)
+    if sum(file.size or 0 for file in files) > BULK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload too large (limit {BULK_MAX_BYTES} bytes)")
+
+    uploads = [(file.filename, await file.read(), file.content_type) for file in files]
+    try:
+        # Archives are decompressed off the event loop
+        items = await asyncio.to_thread(expand_uploads, uploads)
+    except BulkUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    logger.info(f"Processing bulk upload of {len(items)} files from {len(uploads)} uploads")
+    return StreamingResponse(_ndjson_results(items, metadata), media_type="application/x-ndjson")
+
+
 @router.post("/search", response_model=SearchResponse)
 async def search_documents(
         search_query: SearchQuery,
@@ -122,7 +177,7 @@ async def search_documents(
         List of relevant documents
     """
     try:
-        results = document_service.search_documents(search_query.query, search_query.limit)
+        results = await document_service.asearch_documents(search_query.query, search_query.limit)
 
         return {
             "results": results,
@@ -130,11 +185,24 @@ async def search_documents(
             "count": len(results)
         }
 
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
     except Exception as e:
         logger.error(f"Error searching documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/embedding-cache/stats")
+async def embedding_cache_stats() -> Dict[str, Any]:
+    """
+    Get the query embedding cache counters.
+
+    Returns:
+        Hits per tier, misses, hit rate and size in bytes
+    """
+    return get_query_embedding_cache().stats()
+
+
 @router.delete("/{document_id}")
 async def delete_document(
         document_id: str,
@@ -150,7 +218,7 @@ async def delete_document(
         Success status
     """
     try:
-        success = document_service.delete_document(document_id)
+        success = await document_service.adelete_document(document_id)
 
         if not success:
             raise HTTPException(status_code=404, detail="Document not found or could not be deleted")
@@ -0,0 +1,404 @@
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque, Counter
+from typing import Dict, Any, Deque, Optional
+
+from langchain_core.messages import BaseMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from app.config.settings import (
+    API_WORKERS,
+    ADMISSION_ENABLED,
+    LLM_RATE_LIMIT_RPM,
+    LLM_RATE_LIMIT_TPM,
+    EMBEDDING_RATE_LIMIT_RPM,
+    EMBEDDING_RATE_LIMIT_TPM,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_CLIENT_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_COMPLETION_TOKENS
+)
+from app.util.context_assembler import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Client on whose behalf model calls are made; set per request by the API middleware
+current_client: contextvars.ContextVar[str] = contextvars.ContextVar("admission_client", default="anonymous")
+
+
+class AdmissionError(Exception):
+    """A model call was not admitted. Routers answer with status_code and Retry-After."""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class RateLimitedError(AdmissionError):
+    """The client already has too many model calls waiting."""
+    status_code = 429
+
+
+class OverloadedError(AdmissionError):
+    """The service cannot admit the call within the queue deadline."""
+    status_code = 503
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per minute. A capacity of 0 means unlimited."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (after refill)."""
+        if self.unlimited or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+def _worker_share(per_minute: int, workers: int) -> int:
+    """A worker's share of a deployment-wide limit; never 0 (unlimited) for a set limit."""
+    if per_minute <= 0:
+        return per_minute
+    return max(1, per_minute // max(1, workers))
+
+
+class _Waiter:
+    """A model call waiting for admission."""
+
+    def __init__(self, client: str, tokens: int):
+        self.client = client
+        self.tokens = tokens
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Admission control in front of the model calls of one kind (chat or embeddings).
+
+    Calls take one request from a requests-per-minute bucket and their estimated tokens
+    from a tokens-per-minute bucket. When the buckets are empty, async calls wait in a
+    queue per client and are admitted round-robin across clients, so a burst from one
+    client does not starve the others. Calls are shed instead of queued when:
+    - the client already has client_queue_size calls waiting (RateLimitedError, 429)
+    - the global queue is full, or the buckets cannot admit the call before the queue
+      deadline (OverloadedError, 503)
+
+    Sync calls (the sync graph) wait on the same buckets without fair queuing.
+
+    The buckets are per process: rpm and tpm are the limits of the whole deployment, and
+    each of the workers processes gets rpm / workers and tpm / workers. Calls are charged
+    their estimated tokens when admitted; the estimate is not reconciled with the usage
+    the API reports afterwards.
+    """
+
+    def __init__(self,
+                 rpm: int = LLM_RATE_LIMIT_RPM,
+                 tpm: int = LLM_RATE_LIMIT_TPM,
+                 queue_size: int = ADMISSION_QUEUE_SIZE,
+                 client_queue_size: int = ADMISSION_CLIENT_QUEUE_SIZE,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT,
+                 workers: int = API_WORKERS):
+        self.queue_size = queue_size
+        self.client_queue_size = client_queue_size
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(_worker_share(rpm, workers))
+        self._tokens = TokenBucket(_worker_share(tpm, workers))
+
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._order: Deque[str] = deque()
+        self._queued = 0
+        self._queued_tokens = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._stats = Counter()
+
+    def _cap(self, tokens: int) -> int:
+        """A call larger than the whole bucket could never be admitted; charge at most the capacity."""
+        return int(min(tokens, self._tokens.capacity)) if not self._tokens.unlimited else tokens
+
+    def _try_take(self, tokens: int) -> float:
+        """Take one request and the tokens if available; otherwise return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+            if wait == 0:
+                if not self._requests.unlimited:
+                    self._requests.level -= 1
+                if not self._tokens.unlimited:
+                    self._tokens.level -= tokens
+            return wait
+
+    def _expected_wait(self, tokens: int) -> float:
+        """Seconds until the calls already queued plus this one could be admitted."""
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            return max(
+                self._requests.wait_time(self._queued + 1),
+                self._tokens.wait_time(self._queued_tokens + tokens)
+            )
+
+    def _record_admitted(self, waited: float) -> None:
+        with self._lock:
+            self._stats["admitted"] += 1
+            if waited > 0:
+                self._stats["queued"] += 1
+                self._stats["wait_ms_total"] += waited * 1000
+
+    def _shed(self, error: AdmissionError, outcome: str) -> AdmissionError:
+        with self._lock:
+            self._stats[outcome] += 1
+        logger.warning(f"Model call shed ({outcome}): {str(error)}")
+        return error
+
+    # Async fair queue
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """Remove a waiter from its client's queue."""
+        queue = self._queues.get(waiter.client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._queued -= 1
+        self._queued_tokens -= waiter.tokens
+        if not queue:
+            del self._queues[waiter.client]
+            self._order.remove(waiter.client)
+
+    async def _dispatch(self) -> None:
+        """Admit queued calls round-robin across clients as the buckets refill."""
+        while self._order:
+            client = self._order[0]
+            waiter = self._queues[client][0]
+
+            wait = self._try_take(waiter.tokens)
+            if wait > 0:
+                # Re-check after a while: the head may time out and leave meanwhile
+                await asyncio.sleep(min(wait, 0.5))
+                continue
+
+            self._remove(waiter)
+            if client in self._queues:
+                # Next client's turn
+                self._order.rotate(-1)
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+        self._dispatcher = None
+
+    async def aacquire(self, tokens: int, client: Optional[str] = None) -> None:
+        """
+        Wait until a model call may be sent.
+
+        Args:
+            tokens: Estimated prompt and completion tokens of the call
+            client: Client on whose behalf the call is made (defaults to current_client)
+
+        Raises:
+            RateLimitedError: If the client already has too many calls waiting
+            OverloadedError: If the call cannot be admitted before the queue deadline
+        """
+        tokens = self._cap(tokens)
+        client = client or current_client.get()
+
+        # Fast path: nobody is waiting and the buckets have room
+        if not self._queued and self._try_take(tokens) == 0:
+            self._record_admitted(0)
+            return
+
+        if len(self._queues.get(client, ())) >= self.client_queue_size:
+            raise self._shed(RateLimitedError(
+                f"Too many model calls waiting for client {client}", retry_after=self._expected_wait(tokens)
+            ), "rejected_client")
+        if self._queued >= self.queue_size:
+            raise self._shed(OverloadedError(
+                "Model call queue is full", retry_after=self._expected_wait(tokens)
+            ), "rejected_overload")
+        expected_wait = self._expected_wait(tokens)
+        if expected_wait > self.timeout:
+            # Waiting would only end in a timeout; fail now so the client can retry later
+            raise self._shed(OverloadedError(
+                f"Model rate limit reached, expected wait {expected_wait:.1f}s", retry_after=expected_wait
+            ), "rejected_overload")
+
+        waiter = _Waiter(client, tokens)
+        if client not in self._queues:
+            self._queues[client] = deque()
+            self._order.append(client)
+        self._queues[client].append(waiter)
+        self._queued += 1
+        self._queued_tokens += tokens
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            raise self._shed(OverloadedError(
+                f"Model call not admitted within {self.timeout}s", retry_after=self.timeout
+            ), "timed_out")
+        except asyncio.CancelledError:
+            self._remove(waiter)
+            raise
+
+        self._record_admitted(time.monotonic() - waiter.enqueued_at)
+
+    async def apace(self, tokens: int) -> None:
+        """
+        Wait as long as it takes for the buckets to admit a background call (document ingestion).
+
+        Paced calls are neither queued nor shed and have no deadline; they yield to the queued
+        calls, taking from the buckets only while nobody is waiting.
+
+        Args:
+            tokens: Estimated tokens of the call
+        """
+        tokens = self._cap(tokens)
+        started = None
+        while True:
+            wait = 0.05 if self._queued else self._try_take(tokens)
+            if wait == 0:
+                self._record_admitted(time.monotonic() - started if started is not None else 0)
+                return
+            started = started or time.monotonic()
+            await asyncio.sleep(min(wait, 0.5))
+
+    @property
+    def tokens_per_minute(self) -> int:
+        """This worker's token bucket capacity (0 when unlimited)."""
+        return 0 if self._tokens.unlimited else int(self._tokens.capacity)
+
+    def acquire(self, tokens: int) -> None:
+        """Sync version of aacquire, waiting on the buckets without fair queuing."""
+        tokens = self._cap(tokens)
+        started = time.monotonic()
+        while True:
+            wait = self._try_take(tokens)
+            if wait == 0:
+                self._record_admitted(time.monotonic() - started)
+                return
+            if time.monotonic() - started + wait > self.timeout:
+                raise self._shed(OverloadedError(
+                    f"Model call not admitted within {self.timeout}s", retry_after=wait
+                ), "timed_out")
+            time.sleep(min(wait, 0.5))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the admission counters and current state.
+
+        Returns:
+            Dictionary with admitted, queued and shed calls, average queue wait,
+            queue depth per client and bucket levels
+        """
+        with self._lock:
+            queued = self._stats["queued"]
+            return {
+                "enabled": ADMISSION_ENABLED,
+                "admitted": self._stats["admitted"],
+                "queued": queued,
+                "avg_wait_ms": round(self._stats["wait_ms_total"] / queued, 2) if queued else 0.0,
+                "rejected_client": self._stats["rejected_client"],
+                "rejected_overload": self._stats["rejected_overload"],
+                "timed_out": self._stats["timed_out"],
+                "queue_depth": self._queued,
+                "queue_by_client": {client: len(queue) for client, queue in self._queues.items()},
+                "requests_available": None if self._requests.unlimited else round(self._requests.level, 1),
+                "tokens_available": None if self._tokens.unlimited else round(self._tokens.level),
+            }
+
+
+def estimate_tokens(model_input: Any) -> int:
+    """
+    Estimate the tokens of a chat model call from its input, plus the expected completion.
+
+    Args:
+        model_input: A prompt value, a list of messages or a string
+
+    Returns:
+        Estimated prompt and completion tokens
+    """
+    if isinstance(model_input, PromptValue):
+        model_input = model_input.to_messages()
+    if isinstance(model_input, str):
+        prompt_tokens = count_tokens(model_input)
+    else:
+        # ~4 tokens of per-message overhead
+        prompt_tokens = sum(
+            count_tokens(message.content if isinstance(message, BaseMessage) else str(message)) + 4
+            for message in model_input
+        )
+    return prompt_tokens + ADMISSION_COMPLETION_TOKENS
+
+
+def admission_gate() -> Runnable:
+    """
+    Runnable that waits for admission and passes its input through unchanged.
+    Put in front of a chat model: admission_gate() | model.
+    """
+    def admit(model_input):
+        if ADMISSION_ENABLED:
+            get_admission_controller().acquire(estimate_tokens(model_input))
+        return model_input
+
+    async def aadmit(model_input):
+        if ADMISSION_ENABLED:
+            await get_admission_controller().aacquire(estimate_tokens(model_input))
+        return model_input
+
+    return RunnableLambda(admit, afunc=aadmit, name="admission_gate")
+
+
+# Rate limits of each kind of model call; the provider limits chat and embeddings models separately
+ADMISSION_LIMITS = {
+    "chat": (LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM),
+    "embeddings": (EMBEDDING_RATE_LIMIT_RPM, EMBEDDING_RATE_LIMIT_TPM),
+}
+
+# Singleton controllers, one per kind of model call
+_admission_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(kind: str = "chat") -> AdmissionController:
+    """
+    Get or create the AdmissionController singleton of a kind of model call.
+
+    Args:
+        kind: "chat" (chat model calls) or "embeddings" (query and document embeddings)
+
+    Returns:
+        The controller, with the buckets of that kind's rate limits
+    """
+    controller = _admission_controllers.get(kind)
+    if controller is None:
+        rpm, tpm = ADMISSION_LIMITS[kind]
+        controller = _admission_controllers.setdefault(kind, AdmissionController(rpm=rpm, tpm=tpm))
+    return controller
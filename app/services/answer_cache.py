@@ -0,0 +1,424 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, Counter
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from uuid import uuid4
+
+import numpy as np
+from sqlalchemy import select, update, delete
+
+from app.config.settings import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_DB_ENABLED,
+    ANSWER_CACHE_DB_CANDIDATES,
+    ANSWER_CACHE_GENERATION_CHECK
+)
+from app.database.engine import SessionLocal, AsyncSessionLocal
+from app.database.models import AnswerCacheEntry, AnswerCacheGeneration
+
+logger = logging.getLogger(__name__)
+
+VEHICLE_INFO_FIELDS = ["vehicle_type", "plant_location", "service_type", "tariff_type"]
+
+
+def vehicle_key(vehicle_info: Optional[dict]) -> str:
+    """Normalize vehicle info into a cache partition key, e.g. "plant_location=sjl|vehicle_type=taxi"."""
+    vehicle_info = vehicle_info or {}
+    parts = [
+        f"{field}={str(vehicle_info[field]).strip().lower()}"
+        for field in VEHICLE_INFO_FIELDS
+        if vehicle_info.get(field)
+    ]
+    return "|".join(parts)
+
+
+def _normalize_vector(vector: List[float]) -> np.ndarray:
+    """Convert an embedding to a unit float32 vector, so the dot product is the cosine similarity."""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers keyed by query embedding similarity and normalized vehicle info.
+
+    Two tiers: an in-process LRU with TTL, backed by the answer_cache table in Postgres that
+    is shared by all workers. Entries carry the corpus generation they were created in; when
+    documents are uploaded or deleted the generation is bumped and older entries are dropped.
+    Workers notice a bumped generation within ANSWER_CACHE_GENERATION_CHECK seconds.
+    """
+
+    def __init__(self,
+                 threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                 ttl: int = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 use_db: bool = ANSWER_CACHE_DB_ENABLED):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.use_db = use_db
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[str, Dict[str, None]] = {}
+        self._generation = 0
+        self._generation_checked_at = 0.0
+        self._stats = Counter()
+
+    # In-process tier
+
+    def _local_lookup(self, key: str, vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Find the most similar live entry in the vehicle bucket."""
+        with self._lock:
+            now = time.time()
+            bucket = self._buckets.get(key, {})
+            expired = [entry_id for entry_id in bucket if self._entries[entry_id]["expires_at"] <= now]
+            for entry_id in expired:
+                self._remove(entry_id)
+
+            entry_ids = list(self._buckets.get(key, {}))
+            if not entry_ids:
+                return None
+
+            matrix = np.stack([self._entries[entry_id]["vector"] for entry_id in entry_ids])
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id = entry_ids[best]
+            self._entries.move_to_end(entry_id)
+            return {**self._entries[entry_id], "similarity": float(similarities[best])}
+
+    def _local_store(self, entry: Dict[str, Any]) -> None:
+        """Add an entry, evicting the least recently used ones beyond max_entries."""
+        with self._lock:
+            if entry["generation"] != self._generation:
+                return
+            self._entries[entry["id"]] = entry
+            self._buckets.setdefault(entry["vehicle_key"], {})[entry["id"]] = None
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self._stats["evictions"] += 1
+
+    def _remove(self, entry_id: str) -> None:
+        """Remove an entry. Must be called with the lock held."""
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets.get(entry["vehicle_key"], {})
+        bucket.pop(entry_id, None)
+        if not bucket:
+            self._buckets.pop(entry["vehicle_key"], None)
+
+    def _set_generation(self, generation: int) -> None:
+        """Adopt a corpus generation, dropping local entries from other generations."""
+        with self._lock:
+            self._generation_checked_at = time.time()
+            if generation != self._generation:
+                self._generation = generation
+                self._entries.clear()
+                self._buckets.clear()
+
+    def _generation_is_stale(self) -> bool:
+        """Whether the corpus generation should be read again from Postgres."""
+        return self.use_db and time.time() - self._generation_checked_at > ANSWER_CACHE_GENERATION_CHECK
+
+    # Postgres tier
+
+    def _build_entry(self, query: str, vector: np.ndarray, key: str, answer: str,
+                     tokens: int, generation_ms: float) -> Dict[str, Any]:
+        """Build a new cache entry for the current generation."""
+        return {
+            "id": str(uuid4()),
+            "generation": self._generation,
+            "vehicle_key": key,
+            "query": query,
+            "vector": vector,
+            "answer": answer,
+            "tokens": tokens,
+            "generation_ms": generation_ms,
+            "expires_at": time.time() + self.ttl,
+        }
+
+    @staticmethod
+    def _to_row(entry: Dict[str, Any]) -> AnswerCacheEntry:
+        """Convert a cache entry into an answer_cache row."""
+        return AnswerCacheEntry(
+            id=entry["id"],
+            generation=entry["generation"],
+            vehicle_key=entry["vehicle_key"],
+            query=entry["query"],
+            embedding=entry["vector"].tobytes(),
+            answer=entry["answer"],
+            tokens=entry["tokens"],
+            generation_ms=entry["generation_ms"],
+            expires_at=datetime.utcfromtimestamp(entry["expires_at"]),
+        )
+
+    def _lookup_statement(self, key: str):
+        """Select the most recent live rows of the vehicle bucket."""
+        return (
+            select(AnswerCacheEntry)
+            .where(AnswerCacheEntry.generation == self._generation)
+            .where(AnswerCacheEntry.vehicle_key == key)
+            .where(AnswerCacheEntry.expires_at > datetime.utcnow())
+            .order_by(AnswerCacheEntry.created_at.desc())
+            .limit(ANSWER_CACHE_DB_CANDIDATES)
+        )
+
+    def _best_row(self, rows: List[AnswerCacheEntry], vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Pick the most similar row above the threshold and convert it to a cache entry."""
+        if not rows:
+            return None
+
+        matrix = np.stack([np.frombuffer(row.embedding, dtype=np.float32) for row in rows])
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+
+        row = rows[best]
+        return {
+            "id": row.id,
+            "generation": row.generation,
+            "vehicle_key": row.vehicle_key,
+            "query": row.query,
+            "vector": matrix[best],
+            "answer": row.answer,
+            "tokens": row.tokens,
+            "generation_ms": row.generation_ms,
+            "expires_at": (row.expires_at - datetime(1970, 1, 1)).total_seconds(),
+            "similarity": float(similarities[best]),
+        }
+
+    # Public API
+
+    def _record_lookup(self, hit: Optional[Dict[str, Any]], tier: Optional[str], started: float) -> None:
+        """Update hit/miss, saved tokens and latency counters."""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["lookup_ms_total"] += elapsed_ms
+            if hit is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+                self._stats[f"hits_{tier}"] += 1
+                self._stats["saved_tokens"] += hit["tokens"]
+                self._stats["saved_ms"] += max(hit["generation_ms"] - elapsed_ms, 0)
+
+    def lookup(self, query: str, vector: List[float], vehicle_info: Optional[dict]) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a query.
+
+        Args:
+            query: The user's query
+            vector: The query embedding
+            vehicle_info: The vehicle info known for the thread
+
+        Returns:
+            The cached entry (with "answer" and "similarity") or None
+        """
+        started = time.perf_counter()
+        key = vehicle_key(vehicle_info)
+        normalized = _normalize_vector(vector)
+        hit, tier = None, None
+
+        try:
+            if self._generation_is_stale():
+                with SessionLocal() as session:
+                    self._set_generation(self._read_generation(session.execute(self._generation_statement())))
+
+            hit = self._local_lookup(key, normalized)
+            tier = "memory"
+            if hit is None and self.use_db:
+                with SessionLocal() as session:
+                    rows = session.execute(self._lookup_statement(key)).scalars().all()
+                hit = self._best_row(rows, normalized)
+                tier = "db"
+                if hit is not None:
+                    self._local_store(hit)
+        except Exception as e:
+            logger.error(f"Error looking up answer cache: {str(e)}")
+
+        self._record_lookup(hit, tier, started)
+        return hit
+
+    async def alookup(self, query: str, vector: List[float], vehicle_info: Optional[dict]) -> Optional[Dict[str, Any]]:
+        """Async version of lookup."""
+        started = time.perf_counter()
+        key = vehicle_key(vehicle_info)
+        normalized = _normalize_vector(vector)
+        hit, tier = None, None
+
+        try:
+            if self._generation_is_stale():
+                async with AsyncSessionLocal() as session:
+                    self._set_generation(self._read_generation(await session.execute(self._generation_statement())))
+
+            hit = self._local_lookup(key, normalized)
+            tier = "memory"
+            if hit is None and self.use_db:
+                async with AsyncSessionLocal() as session:
+                    rows = (await session.execute(self._lookup_statement(key))).scalars().all()
+                hit = self._best_row(rows, normalized)
+                tier = "db"
+                if hit is not None:
+                    self._local_store(hit)
+        except Exception as e:
+            logger.error(f"Error looking up answer cache: {str(e)}")
+
+        self._record_lookup(hit, tier, started)
+        return hit
+
+    def store(self, query: str, vector: List[float], vehicle_info: Optional[dict], answer: str,
+              tokens: int = 0, generation_ms: float = 0.0) -> None:
+        """
+        Store a generated answer in both tiers.
+
+        Args:
+            query: The user's query
+            vector: The query embedding
+            vehicle_info: The vehicle info known for the thread
+            answer: The generated answer
+            tokens: Estimated prompt and completion tokens the answer cost
+            generation_ms: Time it took to generate the answer
+        """
+        entry = self._build_entry(query, _normalize_vector(vector), vehicle_key(vehicle_info), answer,
+                                  tokens, generation_ms)
+        self._local_store(entry)
+        with self._lock:
+            self._stats["stores"] += 1
+
+        if self.use_db:
+            try:
+                with SessionLocal() as session:
+                    session.add(self._to_row(entry))
+                    session.commit()
+            except Exception as e:
+                logger.error(f"Error storing answer cache entry: {str(e)}")
+
+    async def astore(self, query: str, vector: List[float], vehicle_info: Optional[dict], answer: str,
+                     tokens: int = 0, generation_ms: float = 0.0) -> None:
+        """Async version of store."""
+        entry = self._build_entry(query, _normalize_vector(vector), vehicle_key(vehicle_info), answer,
+                                  tokens, generation_ms)
+        self._local_store(entry)
+        with self._lock:
+            self._stats["stores"] += 1
+
+        if self.use_db:
+            try:
+                async with AsyncSessionLocal() as session:
+                    session.add(self._to_row(entry))
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"Error storing answer cache entry: {str(e)}")
+
+    @staticmethod
+    def _generation_statement():
+        """Select the current corpus generation."""
+        return select(AnswerCacheGeneration.generation).where(AnswerCacheGeneration.id == 1)
+
+    @staticmethod
+    def _read_generation(result) -> int:
+        """Read the generation from a query result (0 if the row does not exist yet)."""
+        generation = result.scalar_one_or_none()
+        return generation or 0
+
+    def invalidate(self) -> None:
+        """Drop every cached answer, in this worker and in Postgres. Called when the corpus changes."""
+        generation = self._generation + 1
+        if self.use_db:
+            try:
+                with SessionLocal() as session:
+                    result = session.execute(
+                        update(AnswerCacheGeneration)
+                        .where(AnswerCacheGeneration.id == 1)
+                        .values(generation=AnswerCacheGeneration.generation + 1)
+                        .returning(AnswerCacheGeneration.generation)
+                    )
+                    generation = result.scalar_one_or_none()
+                    if generation is None:
+                        generation = 1
+                        session.add(AnswerCacheGeneration(id=1, generation=generation))
+                    session.execute(delete(AnswerCacheEntry).where(AnswerCacheEntry.generation < generation))
+                    session.commit()
+            except Exception as e:
+                logger.error(f"Error invalidating answer cache in Postgres: {str(e)}")
+
+        self._set_generation(generation)
+        with self._lock:
+            self._stats["invalidations"] += 1
+        logger.info(f"Answer cache invalidated (generation {generation})")
+
+    async def ainvalidate(self) -> None:
+        """Async version of invalidate."""
+        generation = self._generation + 1
+        if self.use_db:
+            try:
+                async with AsyncSessionLocal() as session:
+                    result = await session.execute(
+                        update(AnswerCacheGeneration)
+                        .where(AnswerCacheGeneration.id == 1)
+                        .values(generation=AnswerCacheGeneration.generation + 1)
+                        .returning(AnswerCacheGeneration.generation)
+                    )
+                    generation = result.scalar_one_or_none()
+                    if generation is None:
+                        generation = 1
+                        session.add(AnswerCacheGeneration(id=1, generation=generation))
+                    await session.execute(delete(AnswerCacheEntry).where(AnswerCacheEntry.generation < generation))
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"Error invalidating answer cache in Postgres: {str(e)}")
+
+        self._set_generation(generation)
+        with self._lock:
+            self._stats["invalidations"] += 1
+        logger.info(f"Answer cache invalidated (generation {generation})")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dictionary with hits, misses, hit rate, saved tokens, latencies and size
+        """
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "generation": self._generation,
+                "entries": len(self._entries),
+                "lookups": lookups,
+                "hits": self._stats["hits"],
+                "hits_memory": self._stats["hits_memory"],
+                "hits_db": self._stats["hits_db"],
+                "misses": self._stats["misses"],
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "stores": self._stats["stores"],
+                "evictions": self._stats["evictions"],
+                "invalidations": self._stats["invalidations"],
+                "saved_tokens": self._stats["saved_tokens"],
+                "saved_ms": round(self._stats["saved_ms"], 2),
+                "avg_lookup_ms": round(self._stats["lookup_ms_total"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Singleton cache
+_answer_cache = None
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Get or create the SemanticAnswerCache singleton."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = SemanticAnswerCache()
+    return _answer_cache
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, AsyncIterator, Optional
+
+from app.config.settings import BATCH_DEFAULT_CONCURRENCY
+from app.services.admission import AdmissionError
+from app.services.turn_scheduler import get_turn_scheduler, TurnQueueFullError
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_item(index: int, item: Dict[str, Any], semaphore: asyncio.Semaphore,
+                    batch_started: float) -> Dict[str, Any]:
+    """Run one batch item through the turn scheduler and time it."""
+    async with semaphore:
+        started = time.perf_counter()
+        result = {"index": index, "id": item.get("id"), "thread_id": item["thread_id"], "message": item["message"]}
+        try:
+            # Never merged with other messages: each item is evaluated on its own
+            turn = await get_turn_scheduler().submit(item["thread_id"], item["message"], coalesce=False)
+            result["answer"] = turn.get("answer", "")
+            result["error"] = turn.get("error")
+            result["degradations"] = turn.get("degradations", [])
+        except (AdmissionError, TurnQueueFullError) as e:
+            result["answer"] = None
+            result["error"] = str(e)
+            result["status_code"] = getattr(e, "status_code", 429)
+        except Exception as e:
+            logger.error(f"Error processing batch item {index}: {str(e)}")
+            result["answer"] = None
+            result["error"] = str(e) or "Unknown error"
+
+        finished = time.perf_counter()
+        result["status"] = "error" if result["error"] else "ok"
+        result["started_ms"] = round((started - batch_started) * 1000, 2)
+        result["duration_ms"] = round((finished - started) * 1000, 2)
+        return result
+
+
+async def aprocess_batch(
+        items: List[Dict[str, Any]],
+        concurrency: int = BATCH_DEFAULT_CONCURRENCY
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run many chat messages through the graph with bounded concurrency.
+
+    Items of the same thread run in their original order, one at a time, because each turn
+    builds on the previous checkpoint; different threads run in parallel, at most concurrency
+    turns at once. Turns still go through the per-thread scheduler, so they are serialized
+    with live traffic on the same threads.
+
+    Args:
+        items: Dictionaries with thread_id, message and an optional client id
+        concurrency: Maximum number of turns running at the same time
+
+    Yields:
+        One result per item in completion order (index, id, thread_id, message, answer,
+        status, error, degradations, started_ms, duration_ms), then a final summary with done=True
+    """
+    batch_started = time.perf_counter()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results: asyncio.Queue = asyncio.Queue()
+
+    threads: "OrderedDict[str, List[int]]" = OrderedDict()
+    for index, item in enumerate(items):
+        threads.setdefault(item["thread_id"], []).append(index)
+
+    async def run_thread(indexes: List[int]) -> None:
+        for index in indexes:
+            await results.put(await _run_item(index, items[index], semaphore, batch_started))
+
+    tasks = [asyncio.create_task(run_thread(indexes)) for indexes in threads.values()]
+    logger.info(f"Batch of {len(items)} items over {len(threads)} threads started (concurrency {concurrency})")
+
+    errors = 0
+    try:
+        for _ in range(len(items)):
+            result = await results.get()
+            errors += result["status"] == "error"
+            yield result
+    finally:
+        # The client went away: stop the items that have not started yet
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    duration_ms = round((time.perf_counter() - batch_started) * 1000, 2)
+    logger.info(f"Batch of {len(items)} items finished in {duration_ms} ms ({errors} errors)")
+    yield {
+        "done": True,
+        "total": len(items),
+        "errors": errors,
+        "duration_ms": duration_ms,
+        "items_per_second": round(len(items) / (duration_ms / 1000), 2) if duration_ms else None,
+    }
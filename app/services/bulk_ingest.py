@@ -0,0 +1,314 @@
+import asyncio
+import io
+import logging
+import mimetypes
+import multiprocessing
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+from uuid import uuid4
+
+from app.config.settings import (
+    BULK_EXTRACTION_WORKERS,
+    BULK_MAX_FILES,
+    BULK_MAX_BYTES,
+    INGEST_EMBEDDING_BATCH_SIZE,
+    INGEST_EMBEDDING_CONCURRENCY
+)
+from app.services.answer_cache import get_answer_cache
+from app.services.document_service import get_document_service, chunk_point
+from app.util.chunker import extract_chunks
+from app.util.text_extractor import TextExtractor, TextExtractionError
+
+logger = logging.getLogger(__name__)
+
+ZIP_MIME_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+# Process pool for the text extraction of bulk uploads
+_extraction_pool = None
+
+
+class BulkUploadError(Exception):
+    """Raised when a bulk upload is over the limits or has an unreadable archive."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def get_extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Get or create the extraction process pool.
+
+    Workers are spawned rather than forked, so they do not inherit the server's threads
+    and open connections. With BULK_EXTRACTION_WORKERS=0 there is no pool and files are
+    extracted in the default thread pool.
+    """
+    global _extraction_pool
+    if _extraction_pool is None and BULK_EXTRACTION_WORKERS > 0:
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=BULK_EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Extraction process pool started ({BULK_EXTRACTION_WORKERS} workers)")
+    return _extraction_pool
+
+
+def close_extraction_pool() -> None:
+    """Shut the extraction process pool down. Called on application shutdown."""
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+        logger.info("Extraction process pool closed")
+
+
+def _guess_mime_type(file_name: str, mime_type: Optional[str] = None) -> str:
+    """The declared type, or the one of the file extension when the client did not know it."""
+    if mime_type and mime_type != "application/octet-stream":
+        return mime_type
+    return mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+
+def _is_hidden(path: str) -> bool:
+    """Archive members that are not documents: hidden files and macOS resource forks."""
+    return any(part.startswith(".") or part == "__MACOSX" for part in path.split("/"))
+
+
+def expand_uploads(
+        uploads: List[Tuple[str, bytes, Optional[str]]],
+        max_files: int = BULK_MAX_FILES,
+        max_bytes: int = BULK_MAX_BYTES
+) -> List[Dict[str, Any]]:
+    """
+    List the files of a bulk upload, replacing zip archives by their members.
+
+    Args:
+        uploads: (file name, content, declared MIME type) of each uploaded file
+        max_files: Maximum number of files after expanding the archives
+        max_bytes: Maximum total size after expanding the archives
+
+    Returns:
+        Dictionaries with the filename, content, mime_type and archive (None for files
+        uploaded directly) of each file
+
+    Raises:
+        BulkUploadError: If an archive cannot be read or the upload is over the limits
+    """
+    files = []
+    total_bytes = 0
+
+    def add(file_name: str, size: int, read, mime_type: str, archive: Optional[str]) -> None:
+        nonlocal total_bytes
+        total_bytes += size
+        if len(files) >= max_files:
+            raise BulkUploadError(f"Too many files (limit {max_files})", status_code=413)
+        if total_bytes > max_bytes:
+            raise BulkUploadError(f"Upload too large (limit {max_bytes} bytes)", status_code=413)
+        files.append({"filename": file_name, "content": read(), "mime_type": mime_type, "archive": archive})
+
+    for file_name, content, mime_type in uploads:
+        mime_type = _guess_mime_type(file_name, mime_type)
+        if mime_type not in ZIP_MIME_TYPES:
+            add(file_name, len(content), lambda: content, mime_type, None)
+            continue
+
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or _is_hidden(info.filename):
+                        continue
+                    # The declared size is checked before decompressing; reads stop at it
+                    add(info.filename, info.file_size, lambda: archive.read(info),
+                        _guess_mime_type(info.filename), file_name)
+        except zipfile.BadZipFile as e:
+            raise BulkUploadError(f"Invalid zip archive {file_name}: {str(e)}")
+
+    return files
+
+
+async def aingest_files(
+        files: List[Dict[str, Any]],
+        metadata: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Index many documents, streaming one result per file.
+
+    Files are extracted and chunked in parallel in the extraction process pool. The chunks
+    of all the files go through shared batches: each batch of INGEST_EMBEDDING_BATCH_SIZE
+    chunks is embedded with one call and upserted with one request (up to
+    INGEST_EMBEDDING_CONCURRENCY batches at a time), so small files do not each pay for
+    their own calls. A file is reported once all its chunks are stored; when a batch
+    fails, its files are reported as errors and the chunks they already stored are deleted.
+
+    Args:
+        files: Files as returned by expand_uploads
+        metadata: Additional metadata stored with every document
+
+    Yields:
+        One result per file in completion order (index, filename, archive, mime_type, status,
+        document_id, chunks, content_length, error, finished_ms), then a final summary with done=True
+    """
+    service = get_document_service()
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    started = time.perf_counter()
+    results: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, INGEST_EMBEDDING_CONCURRENCY))
+    buffer: List[Tuple[Dict[str, Any], int, Dict[str, Any]]] = []
+    batch_tasks: List[asyncio.Task] = []
+
+    states = [
+        {
+            "result": {
+                "index": index,
+                "filename": file["filename"],
+                "archive": file["archive"],
+                "mime_type": file["mime_type"],
+                "document_id": None,
+                "chunks": 0,
+                "content_length": 0,
+                "error": None,
+            },
+            "metadata": {
+                "name": file["filename"],
+                "mimeType": file["mime_type"],
+                "uploadTime": datetime.utcnow().isoformat(),
+                **({"archive": file["archive"]} if file["archive"] else {}),
+                **(metadata or {})
+            },
+            "finished": False,
+            "remaining": 0,
+            "stored": 0,
+        }
+        for index, file in enumerate(files)
+    ]
+
+    def finish(state: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        """Report a file, once."""
+        if state["finished"]:
+            return
+        state["finished"] = True
+        result = state["result"]
+        result["status"] = status
+        result["error"] = error
+        result["finished_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        results.put_nowait(result)
+
+    async def store_batch(batch: List[Tuple[Dict[str, Any], int, Dict[str, Any]]]) -> None:
+        """Embed and upsert a batch of chunks of one or more files."""
+        async with semaphore:
+            batch = [item for item in batch if not item[0]["finished"]]
+            if not batch:
+                return
+            try:
+                vectors = await service.aembed_documents([chunk["text"] for _, _, chunk in batch])
+                await service.aupsert_points([
+                    chunk_point(state["result"]["document_id"], chunk_index, state["result"]["chunks"], chunk,
+                                vector, state["metadata"])
+                    for (state, chunk_index, chunk), vector in zip(batch, vectors)
+                ])
+            except Exception as e:
+                logger.error(f"Error storing a bulk upload batch of {len(batch)} chunks: {str(e)}")
+                for state, _, _ in batch:
+                    finish(state, "error", str(e) or "Unknown error")
+                return
+
+            for state, _, _ in batch:
+                state["stored"] += 1
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    finish(state, "ok")
+
+    async def extract(state: Dict[str, Any], file: Dict[str, Any]) -> None:
+        """Extract and chunk a file, queueing its chunks for the next batches."""
+        try:
+            extracted = await loop.run_in_executor(pool, extract_chunks, file["content"], file["mime_type"])
+        except BrokenProcessPool as e:
+            # A worker died (out of memory on a huge file, for instance); the next upload gets a new pool
+            if pool is _extraction_pool:
+                close_extraction_pool()
+            finish(state, "error", f"Text extraction failed: {str(e)}")
+            return
+        except TextExtractionError as e:
+            # Corrupt file or missing extraction library: nothing of the file is indexed
+            finish(state, "error", str(e))
+            return
+        except Exception as e:
+            logger.error(f"Error extracting text from {file['filename']}: {str(e)}")
+            finish(state, "error", f"Text extraction failed: {str(e)}")
+            return
+
+        chunks = extracted["chunks"]
+        if not chunks:
+            finish(state, "error", "No text content could be extracted from this document")
+            return
+
+        state["result"].update(
+            document_id=str(uuid4()), chunks=len(chunks), content_length=extracted["content_length"]
+        )
+        state["remaining"] = len(chunks)
+        for chunk_index, chunk in enumerate(chunks):
+            buffer.append((state, chunk_index, chunk))
+            if len(buffer) >= INGEST_EMBEDDING_BATCH_SIZE:
+                batch_tasks.append(asyncio.create_task(store_batch(buffer[:])))
+                buffer.clear()
+
+    async def run() -> None:
+        try:
+            extractions = []
+            for state, file in zip(states, files):
+                if TextExtractor.is_supported(file["mime_type"]):
+                    extractions.append(extract(state, file))
+                else:
+                    finish(state, "skipped", f"Unsupported file type: {file['mime_type']}")
+            await asyncio.gather(*extractions)
+
+            if buffer:
+                batch_tasks.append(asyncio.create_task(store_batch(buffer[:])))
+                buffer.clear()
+            await asyncio.gather(*batch_tasks)
+        finally:
+            for task in batch_tasks:
+                task.cancel()
+            for state in states:
+                finish(state, "error", "Not processed")
+
+    runner = asyncio.create_task(run())
+    logger.info(f"Bulk upload of {len(files)} files started")
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    try:
+        for _ in range(len(states)):
+            result = await results.get()
+            counts[result["status"]] += 1
+            yield result
+    finally:
+        # If the client went away, the files not finished yet are abandoned
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+
+        # Chunks of the files that failed halfway are not left behind
+        failed = [state for state in states if state["result"].get("status") != "ok" and state["stored"]]
+        await asyncio.gather(*(
+            service.adelete_document(state["result"]["document_id"], invalidate_cache=False) for state in failed
+        ))
+        if failed or any(state["result"].get("status") == "ok" for state in states):
+            # Cached answers may be based on the previous corpus; invalidated once for the whole upload
+            await get_answer_cache().ainvalidate()
+
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(f"Bulk upload of {len(files)} files finished in {duration_ms} ms "
+                f"({counts['ok']} indexed, {counts['error']} errors, {counts['skipped']} skipped)")
+    yield {
+        "done": True,
+        "total": len(files),
+        "indexed": counts["ok"],
+        "errors": counts["error"],
+        "skipped": counts["skipped"],
+        "chunks": sum(state["result"]["chunks"] for state in states if state["result"]["status"] == "ok"),
+        "duration_ms": duration_ms,
+        "files_per_second": round(len(files) / (duration_ms / 1000), 2) if duration_ms else None,
+    }
@@ -1,18 +1,94 @@
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 import traceback
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 
-from app.database.postgres import get_postgres_saver, get_async_postgres_saver
-from app.graph.chat_graph import create_chat_graph
+from app.config.settings import SUMMARY_IN_BACKGROUND, SUMMARY_MESSAGE_THRESHOLD, MESSAGE_LOG_ENABLED, \
+    HISTORY_PAGE_SIZE
+from app.graph.deadline import TurnBudget, new_turn_budget
+from app.graph.registry import get_chat_graph, get_async_chat_graph
+from app.services.admission import AdmissionError
+from app.services.message_log import append_messages, aappend_messages, aget_messages
+from app.services.summary_jobs import get_summary_job_queue
+from app.util.prompt import DEADLINE_ANSWER
 
 logger = logging.getLogger(__name__)
 
 
+def _build_config(thread_id: str, reset_thread: bool = False, budget: Optional[TurnBudget] = None) -> Dict[str, Any]:
+    """Build the graph configuration for a thread, with the turn's time budget for the nodes."""
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "reset_thread": reset_thread,
+            "budget": budget if budget is not None else new_turn_budget()
+        }
+    }
+
+
+def _build_initial_state(message: str) -> Dict[str, Any]:
+    """Prepare the initial state for a new turn."""
+    return {
+        "input": message,
+        "messages": [],
+        "answer": "",
+        "cache_hit": None,
+        "web_search": "No"
+        # summary is not reset: it is carried over from previous turns
+        # context, documents and speculative_answer are per-turn channels, empty at the start of each turn
+    }
+
+
+def _build_result(thread_id: str, message: str, result: Dict[str, Any], budget: TurnBudget) -> Dict[str, Any]:
+    """Build the response payload from the final graph state."""
+    logger.info(f"Final state keys: {result.keys()}")
+    return {
+        "thread_id": thread_id,
+        "message": message,
+        "answer": result.get("answer", "I encountered an error generating a response."),
+        "degradations": list(budget.degradations)
+    }
+
+
+def _log_turn(thread_id: str, message: str, answer: str) -> None:
+    """Append the turn to the message log; a failure here never fails the turn."""
+    if not MESSAGE_LOG_ENABLED or not answer:
+        return
+    try:
+        append_messages(thread_id, [("human", message), ("ai", answer)])
+    except Exception as e:
+        logger.error(f"Error writing message log for thread {thread_id}: {str(e)}")
+
+
+async def _alog_turn(thread_id: str, message: str, answer: str) -> None:
+    """Async version of _log_turn."""
+    if not MESSAGE_LOG_ENABLED or not answer:
+        return
+    try:
+        await aappend_messages(thread_id, [("human", message), ("ai", answer)])
+    except Exception as e:
+        logger.error(f"Error writing message log for thread {thread_id}: {str(e)}")
+
+
+def _build_error_result(thread_id: str, message: str, error: Exception) -> Dict[str, Any]:
+    """Build the response payload for a failed turn."""
+    error_detail = str(error) if str(error) else "Unknown error (empty exception message)"
+    stack_trace = traceback.format_exc()
+    logger.error(f"Error processing message: {error_detail}")
+    logger.error(f"Stack trace: {stack_trace}")
+    return {
+        "thread_id": thread_id,
+        "message": message,
+        "answer": f"I'm sorry, I encountered an error. Technical details: {error_detail}",
+        "error": error_detail
+    }
+
+
 def process_message(
         message: str,
         thread_id: str,
-        reset_thread: bool = False
+        reset_thread: bool = False,
+        budget: Optional[TurnBudget] = None
 ) -> Dict[str, Any]:
     """
     Process a chat message using the LangGraph workflow.
@@ -21,38 +97,24 @@ def process_message(
         message: The user's message
         thread_id: A unique identifier for this conversation thread
         reset_thread: Whether to reset the thread and start a new conversation
+        budget: Time budget of the turn (defaults to TURN_DEADLINE_MS from now)
 
     Returns:
-        dict: The result containing the answer and updated state
+        dict: The result containing the answer, the degraded stages and updated state
     """
+    budget = budget if budget is not None else new_turn_budget()
     try:
-        # Create the chat graph
-        logger.info(f"Creating chat graph for thread {thread_id}")
-        graph = create_chat_graph()
-        logger.info(f"Chat graph created successfully for thread {thread_id}")
+        # Get the shared compiled chat graph
+        graph = get_chat_graph()
 
         # Set up configuration with the thread_id
-        config = {
-            "configurable": {
-                "thread_id": thread_id,
-                "reset_thread": reset_thread
-            }
-        }
+        config = _build_config(thread_id, reset_thread, budget)
         logger.info(f"Configuration set for thread {thread_id}: {config}")
 
         # Prepare the initial state
-        initial_state = {
-            "input": message,
-            "messages": [],
-            "context": "",
-            "answer": "",
-            "documents": [],
-            "web_search": "No",
-            "summary": ""  # Make sure all expected state fields are initialized
-        }
+        initial_state = _build_initial_state(message)
         logger.info(f"Initial state prepared for thread {thread_id}")
 
-        # Use ainvoke instead of invoke since retrieve_context is async
         logger.info(f"Invoking graph for thread {thread_id}")
         try:
             result = graph.invoke(initial_state, config)
@@ -62,29 +124,187 @@ def process_message(
             logger.error(f"Graph execution traceback: {traceback.format_exc()}")
             raise graph_error
 
-        logger.info(f"Final state keys: {result.keys()}")
-        return {
-            "thread_id": thread_id,
-            "message": message,
-            "answer": result.get("answer", "I encountered an error generating a response.")
-        }
+        _log_turn(thread_id, message, result.get("answer", ""))
+        return _build_result(thread_id, message, result, budget)
 
+    except AdmissionError:
+        # Not admitted by the model rate limiter; the routers answer 429/503
+        raise
+    except Exception as e:
+        return _build_error_result(thread_id, message, e)
+
+
+async def aprocess_message(
+        message: str,
+        thread_id: str,
+        reset_thread: bool = False,
+        budget: Optional[TurnBudget] = None
+) -> Dict[str, Any]:
+    """
+    Process a chat message with the async graph, without blocking the event loop.
+
+    Args:
+        message: The user's message
+        thread_id: A unique identifier for this conversation thread
+        reset_thread: Whether to reset the thread and start a new conversation
+        budget: Time budget of the turn (defaults to TURN_DEADLINE_MS from now)
+
+    Returns:
+        dict: The result containing the answer, the degraded stages and updated state
+    """
+    budget = budget if budget is not None else new_turn_budget()
+    try:
+        graph = await get_async_chat_graph()
+
+        config = _build_config(thread_id, reset_thread, budget)
+        initial_state = _build_initial_state(message)
+
+        logger.info(f"Invoking async graph for thread {thread_id}")
+        try:
+            result = await graph.ainvoke(initial_state, config)
+            logger.info(f"Graph execution completed for thread {thread_id}")
+        except Exception as graph_error:
+            logger.error(f"Error during graph execution: {str(graph_error)}")
+            logger.error(f"Graph execution traceback: {traceback.format_exc()}")
+            raise graph_error
+
+        if SUMMARY_IN_BACKGROUND and len(result.get("messages", [])) > SUMMARY_MESSAGE_THRESHOLD:
+            get_summary_job_queue().schedule(thread_id)
+
+        await _alog_turn(thread_id, message, result.get("answer", ""))
+        return _build_result(thread_id, message, result, budget)
+
+    except AdmissionError:
+        # Not admitted by the model rate limiter; the routers answer 429/503
+        raise
+    except Exception as e:
+        return _build_error_result(thread_id, message, e)
+
+
+# Node whose LLM tokens are streamed to the client
+STREAMED_NODE = "generate_response"
+
+
+async def astream_message(
+        message: str,
+        thread_id: str,
+        reset_thread: bool = False,
+        budget: Optional[TurnBudget] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Process a chat message with the async graph, yielding events as they are produced.
+
+    Events are dictionaries with an "event" key:
+    - "node": a graph node finished (includes "node")
+    - "token": a chunk of the answer produced by generate_response (includes "content")
+    - "clarification": the clarification question from ask_clarification (includes "answer")
+    - "end": the turn finished and was checkpointed (includes "answer" and "degradations")
+    - "error": the turn failed (includes "error")
+
+    Args:
+        message: The user's message
+        thread_id: A unique identifier for this conversation thread
+        reset_thread: Whether to reset the thread and start a new conversation
+        budget: Time budget of the turn (defaults to TURN_DEADLINE_MS from now)
+
+    Yields:
+        Event dictionaries
+    """
+    budget = budget if budget is not None else new_turn_budget()
+    answer = ""
+    streamed_tokens = False
+    try:
+        graph = await get_async_chat_graph()
+
+        config = _build_config(thread_id, reset_thread, budget)
+        initial_state = _build_initial_state(message)
+
+        logger.info(f"Streaming async graph for thread {thread_id}")
+        async for mode, chunk in graph.astream(initial_state, config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                # Only LLM chunks; the full messages written to state are streamed in this mode too
+                if (isinstance(message_chunk, AIMessageChunk)
+                        and metadata.get("langgraph_node") == STREAMED_NODE
+                        and message_chunk.content):
+                    streamed_tokens = True
+                    yield {"event": "token", "content": message_chunk.content}
+                continue
+
+            for node, update in chunk.items():
+                yield {"event": "node", "node": node}
+                if not isinstance(update, dict):
+                    continue
+                if node == "ask_clarification":
+                    answer = update.get("answer", "")
+                    yield {"event": "clarification", "answer": answer}
+                elif node in ("quick_response", "check_answer_cache") and update.get("answer"):
+                    # Canned and cached answers are not produced by an LLM, so send them as a single token
+                    answer = update.get("answer", "")
+                    yield {"event": "token", "content": answer}
+                elif "answer" in update:
+                    answer = update["answer"]
+                    if node == STREAMED_NODE and not streamed_tokens:
+                        # Speculative answers are generated before generate_response runs
+                        yield {"event": "token", "content": answer}
+                    elif node == STREAMED_NODE and answer == DEADLINE_ANSWER:
+                        # The generation was cut short by the deadline after some tokens were sent
+                        yield {"event": "token", "content": f"\n\n{answer}"}
+
+        # The stream only finishes after the final checkpoint has been written
+        logger.info(f"Graph streaming completed for thread {thread_id}")
+        await _alog_turn(thread_id, message, answer)
+        if SUMMARY_IN_BACKGROUND:
+            # The job checks the message count against the checkpoint itself
+            get_summary_job_queue().schedule(thread_id)
+        yield {"event": "end", "thread_id": thread_id, "message": message, "answer": answer,
+               "degradations": list(budget.degradations)}
+
+    except AdmissionError as e:
+        yield {"event": "error", "thread_id": thread_id, "error": str(e), "status_code": e.status_code,
+               "retry_after": e.headers["Retry-After"]}
     except Exception as e:
         error_detail = str(e) if str(e) else "Unknown error (empty exception message)"
-        stack_trace = traceback.format_exc()
-        logger.error(f"Error processing message: {error_detail}")
-        logger.error(f"Stack trace: {stack_trace}")
-        return {
-            "thread_id": thread_id,
-            "message": message,
-            "answer": f"I'm sorry, I encountered an error. Technical details: {error_detail}",
-            "error": error_detail
-        }
+        logger.error(f"Error streaming message: {error_detail}")
+        logger.error(f"Stack trace: {traceback.format_exc()}")
+        yield {"event": "error", "thread_id": thread_id, "error": error_detail}
 
 
-async def get_chat_history(thread_id: str) -> List[Dict[str, Any]]:
+async def get_chat_history(
+        thread_id: str,
+        cursor: Optional[int] = None,
+        limit: int = HISTORY_PAGE_SIZE
+) -> Dict[str, Any]:
     """
-    Retrieve the chat history for a given thread.
+    Retrieve a page of the chat history for a given thread from the message log.
+
+    Threads with no logged messages (e.g. from before the log existed) fall back to
+    the messages stored in the latest checkpoint, returned as a single page.
+
+    Args:
+        thread_id: The thread ID
+        cursor: next_cursor of the previous page, to get older messages (None for the newest)
+        limit: Maximum number of messages
+
+    Returns:
+        Dictionary with the messages (role, content, seq) in chronological order and
+        next_cursor (None when there are no older messages)
+    """
+    if MESSAGE_LOG_ENABLED:
+        try:
+            page = await aget_messages(thread_id, before=cursor, limit=limit)
+            if page["messages"] or cursor is not None:
+                logger.info(f"Retrieved {len(page['messages'])} logged messages for thread {thread_id}")
+                return page
+        except Exception as e:
+            logger.error(f"Error reading message log for thread {thread_id}: {str(e)}")
+
+    return {"messages": await _get_checkpoint_history(thread_id), "next_cursor": None}
+
+
+async def _get_checkpoint_history(thread_id: str) -> List[Dict[str, Any]]:
+    """
+    Retrieve the chat history for a given thread from its latest checkpoint.
 
     Args:
         thread_id: The thread ID
@@ -93,21 +313,15 @@ async def get_chat_history(thread_id: str) -> List[Dict[str, Any]]:
         List of message objects with role and content
     """
     try:
-        # Create the chat graph to access its API
-        logger.info(f"Creating chat graph for thread {thread_id}")
-        graph = create_chat_graph()
+        # Get the shared compiled async chat graph to access its API
+        graph = await get_async_chat_graph()
 
         # Create a configuration for the thread
         config = {"configurable": {"thread_id": thread_id}}
 
-        # Check if the graph has state for this thread
-        if not graph.exists(config):
-            logger.info(f"No state exists for thread {thread_id}")
-            return []
-
-        # Use graph.get_state() to retrieve the state properly
+        # Use graph.aget_state() to retrieve the state properly
         try:
-            state_snapshot = graph.get_state(config)
+            state_snapshot = await graph.aget_state(config)
             logger.info(f"Retrieved state snapshot for thread {thread_id}")
         except Exception as e:
             logger.error(f"Error retrieving state from graph: {str(e)}")
@@ -1,6 +1,8 @@
+import asyncio
 import io
 import logging
 import os
+import uuid
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple, BinaryIO
 from uuid import uuid4
@@ -8,15 +10,27 @@ from uuid import uuid4
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2 import service_account
-from langchain_openai import OpenAIEmbeddings
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
 
-from app.config.settings import QDRANT_URL, QDRANT_API_KEY, OPENAI_API_KEY
-from app.util.text_extractor import TextExtractor
+from app.config.settings import QDRANT_URL, QDRANT_API_KEY, OPENAI_API_KEY, QUERY_EMBEDDING_CACHE_ENABLED, \
+    ADMISSION_ENABLED, INGEST_EMBEDDING_BATCH_SIZE, INGEST_EMBEDDING_CONCURRENCY, INGEST_UPSERT_BATCH_SIZE, \
+    SEARCH_CHUNKS_PER_DOCUMENT
+from app.services.admission import get_admission_controller
+from app.services.answer_cache import get_answer_cache
+from app.services.embedding_cache import get_query_embedding_cache
+from app.services.llm_clients import get_embeddings
+from app.services.metrics import track, EMBEDDING_DURATION, EMBEDDING_IN_FLIGHT, EMBEDDING_ERRORS, \
+    EMBEDDING_TOKENS, QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS
+from app.util.chunker import extract_chunks, CHUNK_SEPARATOR
+from app.util.text_extractor import TextExtractionError
+from app.util.context_assembler import count_tokens
 
 logger = logging.getLogger(__name__)
 
+# Size for text-embedding-3-small
+VECTORS_CONFIG = models.VectorParams(size=1536, distance=models.Distance.COSINE)
+
 
 class DocumentService:
     """
@@ -25,16 +39,28 @@ class DocumentService:
     - Processing text content
     - Creating vector embeddings
     - Storing in Qdrant
+
+    Documents are stored as chunks: one point per chunk, with the document_id and
+    chunk_index in its payload. Documents indexed before chunking are a single point
+    without document_id, whose point ID is the document ID; search and delete handle both.
     """
 
     def __init__(self):
         """Initialize the service with the necessary clients."""
         try:
             # Initialize Qdrant client
-            self.qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+            self.in_memory = QDRANT_URL == ":memory:"
+            if self.in_memory:
+                # Local in-process Qdrant (benchmarks, development). The sync and async
+                # clients each hold their own in-memory collections, so the async writes go to both.
+                self.qdrant_client = QdrantClient(location=":memory:")
+                self.async_qdrant_client = AsyncQdrantClient(location=":memory:")
+            else:
+                self.qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+                self.async_qdrant_client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
 
-            # Initialize OpenAI embeddings
-            self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+            # Shared OpenAI embeddings client (pooled HTTP connections)
+            self.embeddings = get_embeddings()
 
             # Initialize Google Drive service
             self.drive_service = self._initialize_drive_service()
@@ -42,8 +68,9 @@ class DocumentService:
             # Collection name for Qdrant
             self.collection_name = "chat_docs"
 
-            # Ensure collection exists
+            # Ensure collection exists (in the async in-memory store, on first use)
             self._ensure_collection_exists()
+            self._async_collection_ready = not self.in_memory
 
             logger.info("DocumentService initialized successfully")
         except Exception as e:
@@ -77,18 +104,37 @@ class DocumentService:
                 # Create the collection with the appropriate vector size for the embeddings model
                 self.qdrant_client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=models.VectorParams(
-                        size=1536,  # Size for text-embedding-3-small
-                        distance=models.Distance.COSINE
-                    )
+                    vectors_config=VECTORS_CONFIG
                 )
                 logger.info(f"Created Qdrant collection: {self.collection_name}")
             else:
                 logger.info(f"Qdrant collection already exists: {self.collection_name}")
+
+            # Index the document_id of the chunks for deletes (payload indexes do nothing in the local Qdrant)
+            if not self.in_memory:
+                payload_schema = self.qdrant_client.get_collection(self.collection_name).payload_schema or {}
+                if "document_id" not in payload_schema:
+                    self.qdrant_client.create_payload_index(
+                        collection_name=self.collection_name,
+                        field_name="document_id",
+                        field_schema=models.PayloadSchemaType.KEYWORD
+                    )
+                    logger.info(f"Created document_id payload index on {self.collection_name}")
         except Exception as e:
             logger.error(f"Error ensuring Qdrant collection exists: {str(e)}")
             raise
 
+    async def _aensure_collection_exists(self) -> None:
+        """Create the collection in the async client's own in-memory store, the first time it is used."""
+        if self._async_collection_ready:
+            return
+        if not await self.async_qdrant_client.collection_exists(self.collection_name):
+            await self.async_qdrant_client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VECTORS_CONFIG
+            )
+        self._async_collection_ready = True
+
     async def upload_document(self, file_name: str, file_content: bytes, mime_type: str,
                               folder_id: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> Dict[
         str, Any]:
@@ -96,8 +142,9 @@ class DocumentService:
         Process a document by:
         1. Optionally uploading to Google Drive (if folder_id is provided)
         2. Extracting text content
-        3. Creating embeddings
-        4. Storing in Qdrant
+        3. Splitting it into chunks
+        4. Creating the embeddings of the chunks, in batches
+        5. Storing the chunks in Qdrant, in batches
 
         Args:
             file_name: Name of the file
@@ -118,19 +165,24 @@ class DocumentService:
                 logger.info(
                     f"Document uploaded to Google Drive: {drive_metadata.get('name')} (ID: {drive_metadata.get('id')})")
 
-            # Extract text content from the document
-            text_content = TextExtractor.extract_text_content(file_content, mime_type)
+            # Extract text content from the document and split it into chunks (CPU-bound, off the event loop)
+            try:
+                extracted = await asyncio.to_thread(extract_chunks, file_content, mime_type)
+            except TextExtractionError as e:
+                logger.warning(f"Could not extract text from document {file_name}: {str(e)}")
+                return {"error": str(e)}
+            chunks = extracted["chunks"]
 
             # Skip empty documents
-            if not text_content.strip():
+            if not chunks:
                 logger.warning(f"No text content extracted from document: {file_name}")
                 return {"error": "No text content could be extracted from this document"}
 
-            # Create vector embedding
-            vector = await self.embeddings.aembed_query(text_content)
+            # Create the vector embeddings of the chunks
+            vectors = await self.aembed_documents([chunk["text"] for chunk in chunks])
 
-            # Generate a unique ID for the document in Qdrant
-            point_id = str(uuid4())
+            # Generate a unique ID for the document
+            document_id = str(uuid4())
 
             # Combine all metadata
             combined_metadata = {
@@ -142,26 +194,23 @@ class DocumentService:
             }
 
             # Store in Qdrant
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name,
-                points=[models.PointStruct(
-                    id=point_id,
-                    vector=vector,
-                    payload={
-                        "content": text_content,
-                        "metadata": combined_metadata,
-                        "type": "document"
-                    }
-                )]
-            )
+            points = [
+                chunk_point(document_id, index, len(chunks), chunk, vector, combined_metadata)
+                for index, (chunk, vector) in enumerate(zip(chunks, vectors))
+            ]
+            await self.aupsert_points(points)
+
+            logger.info(f"Document processed and stored in Qdrant with ID: {document_id} ({len(chunks)} chunks)")
 
-            logger.info(f"Document processed and stored in Qdrant with ID: {point_id}")
+            # Cached answers may be based on the previous corpus
+            await get_answer_cache().ainvalidate()
 
             return {
-                "document_id": point_id,
+                "document_id": document_id,
                 "drive_file_id": drive_metadata.get("id") if drive_metadata else None,
                 "filename": file_name,
-                "content_length": len(text_content),
+                "content_length": extracted["content_length"],
+                "chunks": len(chunks),
                 "metadata": combined_metadata
             }
 
@@ -189,48 +238,219 @@ class DocumentService:
 
         return file
 
+    def _embed(self, text: str) -> List[float]:
+        """Call the embeddings model once admission control lets the call through."""
+        tokens = count_tokens(text)
+        if ADMISSION_ENABLED:
+            get_admission_controller("embeddings").acquire(tokens)
+        EMBEDDING_TOKENS.labels(operation="query").inc(tokens)
+        with track(EMBEDDING_DURATION, EMBEDDING_IN_FLIGHT, EMBEDDING_ERRORS, operation="query"):
+            return self.embeddings.embed_query(text)
+
+    async def _aembed(self, text: str) -> List[float]:
+        """Async version of _embed."""
+        tokens = count_tokens(text)
+        if ADMISSION_ENABLED:
+            await get_admission_controller("embeddings").aacquire(tokens)
+        EMBEDDING_TOKENS.labels(operation="query").inc(tokens)
+        with track(EMBEDDING_DURATION, EMBEDDING_IN_FLIGHT, EMBEDDING_ERRORS, operation="query"):
+            return await self.embeddings.aembed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Create the embeddings of document chunks, up to INGEST_EMBEDDING_BATCH_SIZE chunks per call
+        and up to INGEST_EMBEDDING_CONCURRENCY calls at a time.
+
+        Calls are paced on the embeddings rate limits rather than queued, so a large document
+        waits for the buckets instead of being shed. A batch also holds at most the token
+        bucket divided by INGEST_EMBEDDING_CONCURRENCY, so the batches in flight always fit
+        in the bucket.
+
+        Args:
+            texts: Texts of the chunks
+
+        Returns:
+            The vectors, in the order of the texts
+        """
+        semaphore = asyncio.Semaphore(INGEST_EMBEDDING_CONCURRENCY)
+        controller = get_admission_controller("embeddings")
+        max_tokens = controller.tokens_per_minute // max(1, INGEST_EMBEDDING_CONCURRENCY) if ADMISSION_ENABLED else 0
+
+        async def embed_batch(batch: List[str], tokens: int) -> List[List[float]]:
+            async with semaphore:
+                if ADMISSION_ENABLED:
+                    await controller.apace(tokens)
+                EMBEDDING_TOKENS.labels(operation="documents").inc(tokens)
+                with track(EMBEDDING_DURATION, EMBEDDING_IN_FLIGHT, EMBEDDING_ERRORS, operation="documents"):
+                    return await self.embeddings.aembed_documents(batch)
+
+        batches = _embedding_batches(texts, INGEST_EMBEDDING_BATCH_SIZE, max_tokens)
+        results = await asyncio.gather(*(embed_batch(batch, tokens) for batch, tokens in batches))
+        return [vector for vectors in results for vector in vectors]
+
+    def upsert_points(self, points: List[models.PointStruct]) -> None:
+        """Store points in Qdrant, INGEST_UPSERT_BATCH_SIZE points per request."""
+        for i in range(0, len(points), INGEST_UPSERT_BATCH_SIZE):
+            with track(QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS, operation="upsert"):
+                self.qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=points[i:i + INGEST_UPSERT_BATCH_SIZE]
+                )
+
+    async def aupsert_points(self, points: List[models.PointStruct]) -> None:
+        """Async version of upsert_points, using the async Qdrant client."""
+        await self._aensure_collection_exists()
+        for i in range(0, len(points), INGEST_UPSERT_BATCH_SIZE):
+            with track(QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS, operation="upsert"):
+                await self.async_qdrant_client.upsert(
+                    collection_name=self.collection_name,
+                    points=points[i:i + INGEST_UPSERT_BATCH_SIZE]
+                )
+        if self.in_memory:
+            # The sync client's store is searched by the sync graph
+            self.qdrant_client.upsert(collection_name=self.collection_name, points=points)
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Create the embedding of a search query, reusing the cached vector
+        for repeated (normalized-identical) queries.
+
+        Args:
+            query: The query text
+
+        Returns:
+            The query vector
+        """
+        if not QUERY_EMBEDDING_CACHE_ENABLED:
+            return self._embed(query)
+
+        cache = get_query_embedding_cache()
+        vector = cache.get(query)
+        if vector is None:
+            vector = self._embed(query)
+            cache.put(query, vector)
+        return vector
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async version of embed_query."""
+        if not QUERY_EMBEDDING_CACHE_ENABLED:
+            return await self._aembed(query)
+
+        cache = get_query_embedding_cache()
+        vector = await cache.aget(query)
+        if vector is None:
+            vector = await self._aembed(query)
+            await cache.aput(query, vector)
+        return vector
+
     def search_documents(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
         Search for documents in Qdrant that are relevant to the query.
 
+        Chunks are fetched and grouped by document: each result holds the best
+        SEARCH_CHUNKS_PER_DOCUMENT matching chunks of a document, in reading order.
+
         Args:
             query: The search query
-            limit: Maximum number of results to return
+            limit: Maximum number of documents to return
 
         Returns:
             List of document data including content and metadata
         """
         try:
             # Create query embedding
-            query_vector = self.embeddings.embed_query(query)
+            query_vector = self.embed_query(query)
 
             # Search in Qdrant
-            search_results = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=query_vector,
-                limit=limit
-            )
+            with track(QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS, operation="search"):
+                search_results = self.qdrant_client.query_points(
+                    collection_name=self.collection_name,
+                    query=query_vector,
+                    limit=limit * SEARCH_CHUNKS_PER_DOCUMENT
+                ).points
+
+            return self._format_search_results(search_results, limit)
+
+        except Exception as e:
+            logger.error(f"Error searching documents: {str(e)}")
+            raise
+
+    async def asearch_documents(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Async version of search_documents, using the async embeddings and Qdrant clients.
+
+        Args:
+            query: The search query
+            limit: Maximum number of results to return
+
+        Returns:
+            List of document data including content and metadata
+        """
+        try:
+            query_vector = await self.aembed_query(query)
+            await self._aensure_collection_exists()
 
-            # Format the results
-            documents = []
-            for result in search_results:
-                payload = result.payload
-                documents.append({
-                    "id": result.id,
-                    "score": result.score,
-                    "content": payload.get("content", ""),
-                    "metadata": payload.get("metadata", {})
-                })
+            with track(QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS, operation="search"):
+                search_results = (await self.async_qdrant_client.query_points(
+                    collection_name=self.collection_name,
+                    query=query_vector,
+                    limit=limit * SEARCH_CHUNKS_PER_DOCUMENT
+                )).points
 
-            return documents
+            return self._format_search_results(search_results, limit)
 
         except Exception as e:
             logger.error(f"Error searching documents: {str(e)}")
             raise
 
+    @staticmethod
+    def _format_search_results(search_results, limit: int) -> List[Dict[str, Any]]:
+        """
+        Group Qdrant search results by document into document dictionaries.
+
+        Args:
+            search_results: Scored chunk points, best first
+            limit: Maximum number of documents
+
+        Returns:
+            The documents by best chunk score, each with the content of its matching chunks
+            in reading order and the position of those chunks
+        """
+        groups: Dict[str, List[Any]] = {}
+        for result in search_results:
+            # Points indexed before chunking are whole documents whose point ID is the document ID
+            document_id = str(result.payload.get("document_id", result.id))
+            if document_id not in groups:
+                if len(groups) >= limit:
+                    continue
+                groups[document_id] = []
+            if len(groups[document_id]) < SEARCH_CHUNKS_PER_DOCUMENT:
+                groups[document_id].append(result)
+
+        documents = []
+        for document_id, results in groups.items():
+            chunks = sorted(results, key=lambda result: result.payload.get("chunk_index", 0))
+            documents.append({
+                "id": document_id,
+                "score": results[0].score,
+                "content": CHUNK_SEPARATOR.join(chunk.payload.get("content", "") for chunk in chunks),
+                "metadata": results[0].payload.get("metadata", {}),
+                "chunks": [
+                    {
+                        "chunk_index": chunk.payload.get("chunk_index", 0),
+                        "page": chunk.payload.get("page"),
+                        "section": chunk.payload.get("section"),
+                        "score": chunk.score
+                    }
+                    for chunk in chunks
+                ]
+            })
+
+        return documents
+
     def delete_document(self, document_id: str) -> bool:
         """
-        Delete a document from the vector store.
+        Delete a document, with all its chunks, from the vector store.
 
         Args:
             document_id: The ID of the document to delete
@@ -239,14 +459,143 @@ class DocumentService:
             True if the deletion was successful
         """
         try:
-            self.qdrant_client.delete(
-                collection_name=self.collection_name,
-                points_selector=models.PointIdsList(
-                    points=[document_id]
+            with track(QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS, operation="delete"):
+                self.qdrant_client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=_document_selector(document_id)
                 )
-            )
             logger.info(f"Document deleted from Qdrant: {document_id}")
+
+            # Cached answers may be based on the deleted document
+            get_answer_cache().invalidate()
             return True
         except Exception as e:
             logger.error(f"Error deleting document {document_id}: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    async def adelete_document(self, document_id: str, invalidate_cache: bool = True) -> bool:
+        """
+        Async version of delete_document, using the async Qdrant client.
+
+        Args:
+            document_id: The ID of the document to delete
+            invalidate_cache: Whether to invalidate the answer cache (callers deleting many
+                documents invalidate it once themselves)
+
+        Returns:
+            True if the deletion was successful
+        """
+        try:
+            await self._aensure_collection_exists()
+            with track(QDRANT_DURATION, QDRANT_IN_FLIGHT, QDRANT_ERRORS, operation="delete"):
+                await self.async_qdrant_client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=_document_selector(document_id)
+                )
+            if self.in_memory:
+                self.qdrant_client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=_document_selector(document_id)
+                )
+            logger.info(f"Document deleted from Qdrant: {document_id}")
+
+            if invalidate_cache:
+                # Cached answers may be based on the deleted document
+                await get_answer_cache().ainvalidate()
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting document {document_id}: {str(e)}")
+            return False
+
+
+def chunk_point_id(document_id: str, chunk_index: int) -> str:
+    """Point ID of a chunk: stable, so indexing a document again overwrites its chunks."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{document_id}/{chunk_index}"))
+
+
+def chunk_point(document_id: str, chunk_index: int, chunk_count: int, chunk: Dict[str, Any], vector: List[float],
+                metadata: Dict[str, Any]) -> models.PointStruct:
+    """
+    Build the Qdrant point of a document chunk.
+
+    Args:
+        document_id: ID of the document
+        chunk_index: Position of the chunk in the document
+        chunk_count: Number of chunks of the document
+        chunk: The chunk, as returned by chunk_document
+        vector: The chunk's embedding
+        metadata: Metadata of the document
+
+    Returns:
+        The point, with the chunk's text and position in its payload
+    """
+    return models.PointStruct(
+        id=chunk_point_id(document_id, chunk_index),
+        vector=vector,
+        payload={
+            "content": chunk["text"],
+            "metadata": metadata,
+            "type": "document",
+            "document_id": document_id,
+            "chunk_index": chunk_index,
+            "chunk_count": chunk_count,
+            "page": chunk["page"],
+            "section": chunk["section"]
+        }
+    )
+
+
+def _embedding_batches(texts: List[str], max_texts: int, max_tokens: int = 0) -> List[Tuple[List[str], int]]:
+    """
+    Group texts into embedding calls of at most max_texts texts and max_tokens tokens
+    (0 = no token limit); a text over max_tokens gets a call of its own.
+
+    Returns:
+        (texts, tokens) of each call, in order
+    """
+    batches = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_texts or (max_tokens and batch_tokens + tokens > max_tokens)):
+            batches.append((batch, batch_tokens))
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append((batch, batch_tokens))
+    return batches
+
+
+def _document_selector(document_id: str) -> models.FilterSelector:
+    """Select all the chunks of a document."""
+    conditions = [models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id))]
+    # Documents indexed before chunking are a single point with the document ID
+    if _is_uuid(document_id):
+        conditions.append(models.HasIdCondition(has_id=[document_id]))
+    return models.FilterSelector(filter=models.Filter(should=conditions))
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+
+# Singleton document service
+_document_service = None
+
+
+def get_document_service() -> DocumentService:
+    """Get or create a DocumentService singleton."""
+    global _document_service
+    if _document_service is None:
+        try:
+            _document_service = DocumentService()
+        except Exception as e:
+            logger.error(f"Error initializing document service: {str(e)}")
+            raise
+    return _document_service
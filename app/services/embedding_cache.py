@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict, Counter
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config.settings import (
+    EMBEDDING_MODEL,
+    QUERY_EMBEDDING_CACHE_ENABLED,
+    QUERY_EMBEDDING_CACHE_MAX_BYTES,
+    QUERY_EMBEDDING_CACHE_DB_ENABLED
+)
+from app.database.engine import SessionLocal, AsyncSessionLocal
+from app.database.models import QueryEmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-entry overhead of the key, the OrderedDict slot and the array header
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for caching: unicode NFC, lowercase and collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", query).lower().split())
+
+
+def cache_key(query: str, model: str = EMBEDDING_MODEL) -> str:
+    """Hash of the model name and the normalized query."""
+    return hashlib.sha256(f"{model}\n{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """
+    Cache of query embeddings keyed by normalized query text and embedding model.
+
+    An in-process LRU bounded by max_bytes, backed by the query_embedding_cache table
+    so that the vectors survive restarts and are shared by all workers. Vectors are
+    kept as float32 in both tiers.
+    """
+
+    def __init__(self,
+                 model: str = EMBEDDING_MODEL,
+                 max_bytes: int = QUERY_EMBEDDING_CACHE_MAX_BYTES,
+                 use_db: bool = QUERY_EMBEDDING_CACHE_DB_ENABLED):
+        self.model = model
+        self.max_bytes = max_bytes
+        self.use_db = use_db
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._stats = Counter()
+
+    def _local_get(self, key: str) -> Optional[np.ndarray]:
+        """Get a vector from the LRU, marking it as recently used."""
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def _local_put(self, key: str, vector: np.ndarray) -> None:
+        """Add a vector to the LRU, evicting the least recently used ones beyond max_bytes."""
+        size = vector.nbytes + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + ENTRY_OVERHEAD_BYTES
+                self._stats["evictions"] += 1
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _row_statement(self, key: str):
+        return select(QueryEmbeddingCacheEntry.embedding).where(QueryEmbeddingCacheEntry.key == key)
+
+    def _insert_statement(self, key: str, query: str, vector: np.ndarray):
+        # Another worker may have stored the same query meanwhile
+        return insert(QueryEmbeddingCacheEntry).values(
+            key=key,
+            model=self.model,
+            query=normalize_query(query),
+            embedding=vector.tobytes()
+        ).on_conflict_do_nothing(index_elements=["key"])
+
+    def get(self, query: str) -> Optional[List[float]]:
+        """
+        Get the cached embedding of a query.
+
+        Args:
+            query: The query text
+
+        Returns:
+            The query vector, or None if it is not cached
+        """
+        key = cache_key(query, self.model)
+        vector = self._local_get(key)
+        if vector is not None:
+            self._count("hits_memory")
+            return vector.tolist()
+
+        if self.use_db:
+            try:
+                with SessionLocal() as session:
+                    embedding = session.execute(self._row_statement(key)).scalar_one_or_none()
+                if embedding is not None:
+                    vector = np.frombuffer(embedding, dtype=np.float32)
+                    self._local_put(key, vector)
+                    self._count("hits_db")
+                    return vector.tolist()
+            except Exception as e:
+                logger.error(f"Error reading query embedding cache: {str(e)}")
+
+        self._count("misses")
+        return None
+
+    async def aget(self, query: str) -> Optional[List[float]]:
+        """Async version of get."""
+        key = cache_key(query, self.model)
+        vector = self._local_get(key)
+        if vector is not None:
+            self._count("hits_memory")
+            return vector.tolist()
+
+        if self.use_db:
+            try:
+                async with AsyncSessionLocal() as session:
+                    embedding = (await session.execute(self._row_statement(key))).scalar_one_or_none()
+                if embedding is not None:
+                    vector = np.frombuffer(embedding, dtype=np.float32)
+                    self._local_put(key, vector)
+                    self._count("hits_db")
+                    return vector.tolist()
+            except Exception as e:
+                logger.error(f"Error reading query embedding cache: {str(e)}")
+
+        self._count("misses")
+        return None
+
+    def put(self, query: str, vector: List[float]) -> None:
+        """
+        Store the embedding of a query in both tiers.
+
+        Args:
+            query: The query text
+            vector: The query vector returned by the embeddings model
+        """
+        key = cache_key(query, self.model)
+        array = np.asarray(vector, dtype=np.float32)
+        self._local_put(key, array)
+        self._count("stores")
+
+        if self.use_db:
+            try:
+                with SessionLocal() as session:
+                    session.execute(self._insert_statement(key, query, array))
+                    session.commit()
+            except Exception as e:
+                logger.error(f"Error storing query embedding: {str(e)}")
+
+    async def aput(self, query: str, vector: List[float]) -> None:
+        """Async version of put."""
+        key = cache_key(query, self.model)
+        array = np.asarray(vector, dtype=np.float32)
+        self._local_put(key, array)
+        self._count("stores")
+
+        if self.use_db:
+            try:
+                async with AsyncSessionLocal() as session:
+                    await session.execute(self._insert_statement(key, query, array))
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"Error storing query embedding: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dictionary with hits per tier, misses, hit rate, size in entries and bytes, and evictions
+        """
+        with self._lock:
+            hits = self._stats["hits_memory"] + self._stats["hits_db"]
+            lookups = hits + self._stats["misses"]
+            return {
+                "enabled": QUERY_EMBEDDING_CACHE_ENABLED,
+                "model": self.model,
+                "lookups": lookups,
+                "hits": hits,
+                "hits_memory": self._stats["hits_memory"],
+                "hits_db": self._stats["hits_db"],
+                "misses": self._stats["misses"],
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "stores": self._stats["stores"],
+                "evictions": self._stats["evictions"],
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Singleton cache
+_query_embedding_cache = None
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Get or create the QueryEmbeddingCache singleton."""
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        _query_embedding_cache = QueryEmbeddingCache()
+    return _query_embedding_cache
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Any, Deque, Optional
+
+import numpy as np
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from app.config.settings import (
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY_MS,
+    LLM_HEDGE_BUDGET,
+    LLM_HEDGE_WINDOW,
+    LLM_HEDGE_MIN_SAMPLES
+)
+from app.services.metrics import LLM_HEDGES
+
+logger = logging.getLogger(__name__)
+
+
+class HedgingPolicy:
+    """
+    Decides when a node's model call gets a duplicate (hedge) request.
+
+    The hedge delay is the percentile latency of the node's recent calls, so only the
+    slowest calls are hedged. The budget caps the share of recent calls that were hedged:
+    when the provider is slow for everyone, hedging would only double the load.
+    """
+
+    def __init__(
+            self,
+            percentile: float = LLM_HEDGE_PERCENTILE,
+            min_delay_ms: float = LLM_HEDGE_MIN_DELAY_MS,
+            budget: float = LLM_HEDGE_BUDGET,
+            window: int = LLM_HEDGE_WINDOW,
+            min_samples: int = LLM_HEDGE_MIN_SAMPLES
+    ):
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        # Latency in seconds of the recent calls per node, and whether each one was hedged
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._hedged: Dict[str, Deque[bool]] = {}
+        self._outcomes: Dict[str, Counter] = {}
+
+    def delay(self, node: str) -> Optional[float]:
+        """
+        Get the time to wait before hedging a call of the node.
+
+        Returns:
+            The delay in seconds, or None until min_samples calls have been observed
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(node, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(float(np.percentile(latencies, self.percentile)), self.min_delay_ms / 1000)
+
+    def try_hedge(self, node: str) -> bool:
+        """Check the budget and, if it allows it, count a hedge for the node."""
+        with self._lock:
+            hedged = self._hedged.setdefault(node, deque(maxlen=self.window))
+            if sum(hedged) + 1 > self.budget * max(len(hedged), 1):
+                return False
+            hedged.append(True)
+            return True
+
+    def record(self, node: str, seconds: float, hedged: bool) -> None:
+        """Record the latency of a finished call (hedged calls are already counted by try_hedge)."""
+        with self._lock:
+            self._latencies.setdefault(node, deque(maxlen=self.window)).append(seconds)
+            if not hedged:
+                self._hedged.setdefault(node, deque(maxlen=self.window)).append(False)
+
+    def count(self, node: str, outcome: str) -> None:
+        """Count a hedge outcome of the node: won, lost, failed or suppressed."""
+        with self._lock:
+            self._outcomes.setdefault(node, Counter())[outcome] += 1
+        LLM_HEDGES.labels(node=node, outcome=outcome).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hedging settings and, per node, the current delay, the share of recent
+        calls hedged and the hedge outcomes.
+
+        Returns:
+            Dictionary with the settings and the stats per node
+        """
+        with self._lock:
+            hedged = {node: list(values) for node, values in self._hedged.items()}
+            outcomes = {node: dict(counts) for node, counts in self._outcomes.items()}
+        nodes = {}
+        for node, values in hedged.items():
+            delay = self.delay(node)
+            counts = outcomes.get(node, {})
+            sent = counts.get("won", 0) + counts.get("lost", 0) + counts.get("failed", 0)
+            nodes[node] = {
+                "recent_calls": len(values),
+                "hedged_ratio": round(sum(values) / len(values), 4) if values else 0.0,
+                "delay_ms": round(delay * 1000, 1) if delay is not None else None,
+                "hedges": sent,
+                "won": counts.get("won", 0),
+                "win_ratio": round(counts.get("won", 0) / sent, 4) if sent else 0.0,
+                "suppressed": counts.get("suppressed", 0),
+            }
+        return {
+            "percentile": self.percentile,
+            "min_delay_ms": self.min_delay_ms,
+            "budget": self.budget,
+            "window": self.window,
+            "nodes": nodes,
+        }
+
+
+# Singleton policy
+_hedging_policy = None
+
+
+def get_hedging_policy() -> HedgingPolicy:
+    """Get or create the HedgingPolicy singleton."""
+    global _hedging_policy
+    if _hedging_policy is None:
+        _hedging_policy = HedgingPolicy()
+    return _hedging_policy
+
+
+def hedged_model(node: str, runnable: Runnable) -> Runnable:
+    """
+    Build a runnable that sends a duplicate of a slow async call and keeps the first
+    successful answer, cancelling the other one.
+
+    Only for idempotent calls whose output is not streamed to the client. Sync calls
+    are not hedged, since a losing call in a thread could not be cancelled.
+
+    Args:
+        node: Name of the graph node
+        runnable: The node's model runnable (admission gate included, so hedges are admitted too)
+
+    Returns:
+        The hedging runnable
+    """
+    policy = get_hedging_policy()
+
+    def invoke(model_input: Any, config: RunnableConfig) -> Any:
+        return runnable.invoke(model_input, config)
+
+    async def ainvoke(model_input: Any, config: RunnableConfig) -> Any:
+        started = time.perf_counter()
+        delay = policy.delay(node)
+        primary = asyncio.ensure_future(runnable.ainvoke(model_input, config))
+        try:
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+            if delay is None or primary.done():
+                result = await primary
+                policy.record(node, time.perf_counter() - started, hedged=False)
+                return result
+            if not policy.try_hedge(node):
+                policy.count(node, "suppressed")
+                result = await primary
+                policy.record(node, time.perf_counter() - started, hedged=False)
+                return result
+
+            hedge = asyncio.ensure_future(runnable.ainvoke(model_input, config))
+            result = await _first_success(policy, node, primary, hedge)
+            policy.record(node, time.perf_counter() - started, hedged=True)
+            return result
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"hedge_{node}")
+
+
+async def _first_success(policy: HedgingPolicy, node: str, primary: asyncio.Future, hedge: asyncio.Future) -> Any:
+    """Wait for the first of two calls to succeed, cancelling the other one."""
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    policy.count(node, "won" if task is hedge else "lost")
+                    return task.result()
+                error = task.exception()
+        policy.count(node, "failed")
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
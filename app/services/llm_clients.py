@@ -0,0 +1,270 @@
+import logging
+from typing import Dict, Any, Callable, Optional, Tuple, Type
+
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from app.config.settings import (
+    LLM_MODEL,
+    LLM_NODE_SETTINGS,
+    LLM_REQUEST_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_FALLBACK_MAX_RETRIES,
+    EMBEDDING_MODEL,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HEDGING,
+    LLM_HEDGE_NODES
+)
+from app.services.admission import admission_gate
+from app.services.hedging import hedged_model
+from app.services.metrics import model_callbacks
+from app.services.model_router import routed_model
+
+logger = logging.getLogger(__name__)
+
+# Singleton instances
+_http_client = None
+_async_http_client = None
+_embeddings = None
+_base_models: Dict[Tuple[str, Optional[float], int], BaseChatModel] = {}
+_model_overrides: Dict[str, BaseChatModel] = {}
+_chat_models: Dict[str, Runnable] = {}
+_structured_models: Dict[Tuple[str, str], Runnable] = {}
+
+
+def _http_limits() -> httpx.Limits:
+    """Connection limits shared by the sync and async HTTP clients."""
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Get or create the long-lived synchronous HTTP client used by the OpenAI clients.
+    Connections are kept alive and reused across calls.
+    """
+    global _http_client
+
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_http_limits(), timeout=LLM_REQUEST_TIMEOUT)
+        logger.info("LLM HTTP client initialized")
+
+    return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Get or create the long-lived asynchronous HTTP client used by the OpenAI clients.
+    Connections are kept alive and reused across calls.
+    """
+    global _async_http_client
+
+    if _async_http_client is None:
+        _async_http_client = httpx.AsyncClient(limits=_http_limits(), timeout=LLM_REQUEST_TIMEOUT)
+        logger.info("Async LLM HTTP client initialized")
+
+    return _async_http_client
+
+
+def get_node_model_settings(node: str) -> Dict[str, Any]:
+    """
+    Get the model settings configured for a graph node.
+
+    Args:
+        node: Name of the graph node
+
+    Returns:
+        Dictionary with the model name, the ordered fallback chain (models),
+        the optional temperature and the latency target
+    """
+    return LLM_NODE_SETTINGS.get(
+        node, {"model": LLM_MODEL, "models": [LLM_MODEL], "temperature": None, "latency_target_ms": 0}
+    )
+
+
+def _get_base_model(model_name: str, temperature: Optional[float] = None,
+                    max_retries: int = LLM_MAX_RETRIES) -> BaseChatModel:
+    """Get or create the ChatOpenAI instance for a model name and settings (shared across nodes)."""
+    override = _model_overrides.get(model_name)
+    if override is not None:
+        return override
+
+    key = (model_name, temperature, max_retries)
+    model = _base_models.get(key)
+    if model is None:
+        kwargs = {
+            "model": model_name,
+            "request_timeout": LLM_REQUEST_TIMEOUT,
+            "max_retries": max_retries,
+            "http_client": get_http_client(),
+            "http_async_client": get_async_http_client(),
+        }
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+
+        model = _base_models.setdefault(key, ChatOpenAI(**kwargs))
+        logger.info(f"Chat model {model_name} initialized (temperature {temperature}, max_retries {max_retries})")
+
+    return model
+
+
+def get_model_for_node(node: str, model_name: str) -> BaseChatModel:
+    """
+    Get a specific model with a node's settings, without admission control or routing.
+    Used by the offline model comparison harness.
+
+    Args:
+        node: Name of the graph node (for the temperature)
+        model_name: The model to use
+
+    Returns:
+        The chat model
+    """
+    return _get_base_model(model_name, get_node_model_settings(node).get("temperature"))
+
+
+def _with_metrics(node: str, model_name: str, runnable: Runnable) -> Runnable:
+    """Attach the model metrics callbacks of a node and model to a runnable."""
+    callbacks = model_callbacks(node, model_name)
+    return runnable.with_config(callbacks=callbacks) if callbacks else runnable
+
+
+def _routed(node: str, build: Callable[[BaseChatModel], Runnable]) -> Runnable:
+    """
+    Build a node's model runnable: one candidate per model of its fallback chain, each
+    instrumented for metrics, routed by the ModelRouter.
+
+    Args:
+        node: Name of the graph node
+        build: Turns a base chat model into the candidate runnable (e.g. with_structured_output)
+    """
+    settings = get_node_model_settings(node)
+    models = settings["models"]
+    candidates = {}
+    for i, model_name in enumerate(models):
+        # A model's own retries only delay the fallback; the last model keeps the usual retries
+        max_retries = LLM_MAX_RETRIES if i == len(models) - 1 else LLM_FALLBACK_MAX_RETRIES
+        base = _get_base_model(model_name, settings.get("temperature"), max_retries)
+        candidates[model_name] = _with_metrics(node, model_name, build(base))
+    return routed_model(node, candidates, settings.get("latency_target_ms", 0))
+
+
+def _gated(node: str, routed: Runnable) -> Runnable:
+    """Put a node's routed models behind the admission gate, hedging the whole call when enabled for the node."""
+    runnable = admission_gate() | routed
+    if LLM_HEDGING and node in LLM_HEDGE_NODES:
+        return hedged_model(node, runnable)
+    return runnable
+
+
+def get_chat_model(node: str) -> Runnable:
+    """
+    Get or create the chat model used by a graph node.
+
+    Args:
+        node: Name of the graph node
+
+    Returns:
+        The node's ChatOpenAI instance(s) (sharing the pooled HTTP clients), routed over its
+        fallback chain, behind the admission control gate, optionally hedged and instrumented
+        for metrics
+    """
+    model = _chat_models.get(node)
+    if model is None:
+        model = _chat_models.setdefault(node, _gated(node, _routed(node, lambda base: base)))
+
+    return model
+
+
+def get_structured_model(node: str, schema: Type) -> Runnable:
+    """
+    Get or create the structured-output runnable for a node and output schema.
+
+    Args:
+        node: Name of the graph node
+        schema: The output schema (e.g. VehicleInfo, AmbiguityClassification)
+
+    Returns:
+        The chat model(s) bound with with_structured_output(schema), routed over the node's
+        fallback chain, behind the admission control gate, optionally hedged and instrumented
+        for metrics
+    """
+    key = (node, schema.__name__)
+    runnable = _structured_models.get(key)
+    if runnable is None:
+        runnable = _structured_models.setdefault(
+            key, _gated(node, _routed(node, lambda base: base.with_structured_output(schema)))
+        )
+
+    return runnable
+
+
+def get_embeddings() -> Embeddings:
+    """
+    Get or create the OpenAI embeddings client.
+    This is a singleton pattern to ensure we only have one instance.
+    """
+    global _embeddings
+
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(
+            model=EMBEDDING_MODEL,
+            request_timeout=LLM_REQUEST_TIMEOUT,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client()
+        )
+        logger.info(f"Embeddings client {EMBEDDING_MODEL} initialized")
+
+    return _embeddings
+
+
+def override_models(chat_models: Dict[str, BaseChatModel], embeddings: Optional[Embeddings] = None) -> None:
+    """
+    Replace the OpenAI models with other implementations, e.g. the stand-in models of
+    the benchmarks. Must be called before the graphs and DocumentService are created.
+
+    Args:
+        chat_models: Chat model per model name (as used in the nodes' fallback chains)
+        embeddings: Optional embeddings model
+    """
+    global _embeddings
+
+    _model_overrides.update(chat_models)
+    _chat_models.clear()
+    _structured_models.clear()
+    if embeddings is not None:
+        _embeddings = embeddings
+    logger.info(f"Models overridden: {', '.join(chat_models)}")
+
+
+async def close_llm_clients() -> None:
+    """
+    Close the pooled HTTP clients and drop the cached models.
+    Called on application shutdown.
+    """
+    global _http_client, _async_http_client, _embeddings
+
+    try:
+        if _http_client is not None:
+            _http_client.close()
+        if _async_http_client is not None:
+            await _async_http_client.aclose()
+        logger.info("LLM HTTP clients closed")
+    except Exception as e:
+        logger.error(f"Error closing LLM HTTP clients: {str(e)}")
+
+    _http_client = None
+    _async_http_client = None
+    _embeddings = None
+    _base_models.clear()
+    _chat_models.clear()
+    _structured_models.clear()
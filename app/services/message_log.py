@@ -0,0 +1,103 @@
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+
+from app.config.settings import HISTORY_PAGE_SIZE
+from app.database.engine import SessionLocal, AsyncSessionLocal
+from app.database.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Attempts to append when another worker took the same seq numbers
+APPEND_ATTEMPTS = 3
+
+
+def _last_seq_statement(thread_id: str):
+    return select(func.coalesce(func.max(ChatMessage.seq), 0)).where(ChatMessage.thread_id == thread_id)
+
+
+def _page_statement(thread_id: str, before: Optional[int], limit: int):
+    """Newest messages first, one more than requested to know whether older ones exist."""
+    statement = select(ChatMessage.seq, ChatMessage.role, ChatMessage.content, ChatMessage.created_at) \
+        .where(ChatMessage.thread_id == thread_id)
+    if before is not None:
+        statement = statement.where(ChatMessage.seq < before)
+    return statement.order_by(ChatMessage.seq.desc()).limit(limit + 1)
+
+
+def _build_rows(thread_id: str, last_seq: int, messages: List[Tuple[str, str]]) -> List[ChatMessage]:
+    return [
+        ChatMessage(thread_id=thread_id, seq=last_seq + i, role=role, content=content)
+        for i, (role, content) in enumerate(messages, 1)
+    ]
+
+
+def _build_page(rows, limit: int) -> Dict[str, Any]:
+    """Return the page in chronological order, with the cursor for the previous page."""
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])[::-1]
+    return {
+        "messages": [
+            {"seq": row.seq, "role": row.role, "content": row.content, "created_at": row.created_at}
+            for row in rows
+        ],
+        "next_cursor": rows[0].seq if has_more and rows else None,
+    }
+
+
+def append_messages(thread_id: str, messages: List[Tuple[str, str]]) -> None:
+    """
+    Append the messages of a turn to the thread's log.
+
+    Args:
+        thread_id: The conversation thread
+        messages: (role, content) pairs in order, e.g. [("human", ...), ("ai", ...)]
+    """
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            with SessionLocal() as session:
+                last_seq = session.execute(_last_seq_statement(thread_id)).scalar_one()
+                session.add_all(_build_rows(thread_id, last_seq, messages))
+                session.commit()
+            return
+        except IntegrityError:
+            # Same seq written concurrently; read the new max and try again
+            logger.warning(f"Message log seq conflict for thread {thread_id} (attempt {attempt + 1})")
+    logger.error(f"Could not append messages to the log of thread {thread_id}")
+
+
+async def aappend_messages(thread_id: str, messages: List[Tuple[str, str]]) -> None:
+    """Async version of append_messages."""
+    for attempt in range(APPEND_ATTEMPTS):
+        try:
+            async with AsyncSessionLocal() as session:
+                last_seq = (await session.execute(_last_seq_statement(thread_id))).scalar_one()
+                session.add_all(_build_rows(thread_id, last_seq, messages))
+                await session.commit()
+            return
+        except IntegrityError:
+            logger.warning(f"Message log seq conflict for thread {thread_id} (attempt {attempt + 1})")
+    logger.error(f"Could not append messages to the log of thread {thread_id}")
+
+
+async def aget_messages(thread_id: str, before: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Read a page of a thread's messages with a single indexed query.
+
+    Pages go backwards in time: the first page holds the newest messages, and next_cursor
+    is passed as before to get the previous ones.
+
+    Args:
+        thread_id: The conversation thread
+        before: Only messages with a lower seq (None for the newest page)
+        limit: Maximum number of messages
+
+    Returns:
+        Dictionary with the messages in chronological order and next_cursor
+        (None when there are no older messages)
+    """
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(_page_statement(thread_id, before, limit))).all()
+    return _build_page(rows, limit)
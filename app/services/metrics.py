@@ -0,0 +1,407 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Imported first: it loads the .env, which may set PROMETHEUS_MULTIPROC_DIR for prometheus_client
+from app.config.settings import METRICS_ENABLED, PROMETHEUS_MULTIPROC_DIR
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CollectorRegistry, generate_latest, \
+        CONTENT_TYPE_LATEST, multiprocess
+    from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Trace id of the current request, added to every log record by TraceIdFilter
+trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+# Latency buckets in seconds, from pool acquires (ms) to slow LLM completions (tens of seconds)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+_enabled = PROMETHEUS_AVAILABLE and METRICS_ENABLED
+# The workers write their metrics to files in PROMETHEUS_MULTIPROC_DIR, aggregated at scrape time
+_multiprocess = _enabled and bool(PROMETHEUS_MULTIPROC_DIR)
+
+
+class _NoopMetric:
+    """Stand-in used when metrics are disabled or prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+def _histogram(name: str, documentation: str, labels: List[str]):
+    return Histogram(name, documentation, labels, buckets=LATENCY_BUCKETS) if _enabled else _NoopMetric()
+
+
+def _counter(name: str, documentation: str, labels: List[str]):
+    return Counter(name, documentation, labels) if _enabled else _NoopMetric()
+
+
+def _gauge(name: str, documentation: str, labels: List[str]):
+    # The gauges count calls in flight: summed over the live workers in multiprocess mode
+    return Gauge(name, documentation, labels, multiprocess_mode="livesum") if _enabled else _NoopMetric()
+
+
+# HTTP requests
+HTTP_DURATION = _histogram("http_request_duration_seconds", "Time until the response starts",
+                           ["method", "route", "status"])
+
+# Graph nodes
+NODE_DURATION = _histogram("chat_node_duration_seconds", "Duration of a chat graph node", ["node"])
+NODE_IN_FLIGHT = _gauge("chat_node_in_flight", "Chat graph nodes currently running", ["node"])
+NODE_ERRORS = _counter("chat_node_errors_total", "Chat graph nodes that raised", ["node"])
+DEGRADATIONS = _counter("chat_degradations_total", "Graph stages skipped or cut short by the turn deadline",
+                        ["stage", "reason"])
+
+# Chat models
+LLM_DURATION = _histogram("llm_request_duration_seconds", "Duration of a chat model call", ["node", "model"])
+LLM_FIRST_TOKEN = _histogram("llm_time_to_first_token_seconds", "Time to the first streamed token", ["node", "model"])
+LLM_IN_FLIGHT = _gauge("llm_requests_in_flight", "Chat model calls currently running", ["node"])
+LLM_ERRORS = _counter("llm_request_errors_total", "Chat model calls that failed", ["node", "model"])
+LLM_TOKENS = _counter("llm_tokens_total", "Tokens used by chat model calls", ["node", "model", "type"])
+LLM_FALLBACKS = _counter("llm_fallbacks_total", "Failed model calls retried on the next model of the chain",
+                         ["node", "model"])
+LLM_HEDGES = _counter("llm_hedges_total", "Duplicate model calls sent for slow calls, by outcome "
+                      "(won, lost, failed) or suppressed by the hedging budget", ["node", "outcome"])
+
+# Embeddings
+EMBEDDING_DURATION = _histogram("embedding_request_duration_seconds", "Duration of an embeddings call", ["operation"])
+EMBEDDING_IN_FLIGHT = _gauge("embedding_requests_in_flight", "Embeddings calls currently running", ["operation"])
+EMBEDDING_ERRORS = _counter("embedding_request_errors_total", "Embeddings calls that failed", ["operation"])
+EMBEDDING_TOKENS = _counter("embedding_tokens_total", "Tokens sent to the embeddings model", ["operation"])
+
+# Qdrant
+QDRANT_DURATION = _histogram("qdrant_request_duration_seconds", "Duration of a Qdrant call", ["operation"])
+QDRANT_IN_FLIGHT = _gauge("qdrant_requests_in_flight", "Qdrant calls currently running", ["operation"])
+QDRANT_ERRORS = _counter("qdrant_request_errors_total", "Qdrant calls that failed", ["operation"])
+
+# Postgres pools and checkpoints
+DB_POOL_ACQUIRE = _histogram("db_pool_acquire_seconds", "Wait for a connection from the pool", ["pool"])
+DB_POOL_HOLD = _histogram("db_pool_connection_hold_seconds", "Time a connection is held out of the pool", ["pool"])
+CHECKPOINT_DURATION = _histogram("checkpoint_operation_duration_seconds", "Duration of a checkpointer call",
+                                 ["operation"])
+CHECKPOINT_ERRORS = _counter("checkpoint_operation_errors_total", "Checkpointer calls that failed", ["operation"])
+
+
+@contextmanager
+def track(histogram, in_flight=None, errors=None, **labels) -> Iterator[None]:
+    """
+    Time the enclosed block (sync or containing awaits) into a histogram.
+
+    Args:
+        histogram: Histogram observed with the duration in seconds
+        in_flight: Optional gauge incremented while the block runs
+        errors: Optional counter incremented if the block raises
+        **labels: Label values, shared by the three metrics
+    """
+    if in_flight is not None:
+        in_flight.labels(**labels).inc()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if errors is not None:
+            errors.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - started)
+        if in_flight is not None:
+            in_flight.labels(**labels).dec()
+
+
+def instrument_node(name: str, node: Callable) -> Callable:
+    """
+    Wrap a graph node so its duration, concurrency and errors are recorded.
+
+    Args:
+        name: Node name, used as the label
+        node: The node function (sync or async)
+
+    Returns:
+        A function of the same kind as node
+    """
+    if not _enabled:
+        return node
+
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_node(state, *args, **kwargs):
+            with track(NODE_DURATION, NODE_IN_FLIGHT, NODE_ERRORS, node=name):
+                return await node(state, *args, **kwargs)
+        return async_node
+
+    @functools.wraps(node)
+    def sync_node(state, *args, **kwargs):
+        with track(NODE_DURATION, NODE_IN_FLIGHT, NODE_ERRORS, node=name):
+            return node(state, *args, **kwargs)
+    return sync_node
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    """Prompt and completion tokens of a model response, from the message usage or the provider output."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class ModelMetricsHandler(BaseCallbackHandler):
+    """Callback handler recording duration, time to first token, tokens and errors of a node's model calls."""
+
+    # Run in the caller's thread/loop, so timings are not skewed by the callback executor
+    run_inline = True
+
+    def __init__(self, node: str, model: str):
+        self.node = node
+        self.model = model
+        self._started: Dict[UUID, float] = {}
+        self._first_token: Dict[UUID, bool] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+        LLM_IN_FLIGHT.labels(node=self.node).inc()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.get(run_id)
+        if started is not None and run_id not in self._first_token:
+            self._first_token[run_id] = True
+            LLM_FIRST_TOKEN.labels(node=self.node, model=self.model).observe(time.perf_counter() - started)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._finish(run_id)
+        if started is None:
+            return
+        LLM_DURATION.labels(node=self.node, model=self.model).observe(time.perf_counter() - started)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        LLM_TOKENS.labels(node=self.node, model=self.model, type="prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(node=self.node, model=self.model, type="completion").inc(completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Cancelled calls (hedging losers, deadlines) are not provider errors
+        if self._finish(run_id) is not None and not isinstance(error, asyncio.CancelledError):
+            LLM_ERRORS.labels(node=self.node, model=self.model).inc()
+
+    def _finish(self, run_id: UUID) -> Optional[float]:
+        self._first_token.pop(run_id, None)
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            LLM_IN_FLIGHT.labels(node=self.node).dec()
+        return started
+
+
+_model_handlers: Dict[Tuple[str, str], ModelMetricsHandler] = {}
+
+
+def model_callbacks(node: str, model: str) -> List[BaseCallbackHandler]:
+    """
+    Get the callbacks to attach to a node's chat model.
+
+    Args:
+        node: Name of the graph node
+        model: Model name, used as the label
+
+    Returns:
+        A list with the node's ModelMetricsHandler, or an empty list when metrics are disabled
+    """
+    if not _enabled:
+        return []
+    handler = _model_handlers.get((node, model))
+    if handler is None:
+        handler = _model_handlers.setdefault((node, model), ModelMetricsHandler(node, model))
+    return [handler]
+
+
+class ServiceStatsCollector:
+    """
+    Exports the pool utilization and the counters kept by the services, read at scrape time.
+
+    These live in the memory of each worker, so in multiprocess mode they are those of the
+    worker serving the scrape, labelled with its worker id (the process id).
+    """
+
+    def __init__(self, worker: Optional[str] = None):
+        self.worker = worker
+
+    def describe(self):
+        # Nothing to describe up front; avoids a collect() (and its imports) at registration
+        return []
+
+    def collect(self):
+        for family in self._families():
+            if self.worker is not None:
+                family.samples = [sample._replace(labels={**sample.labels, "worker": self.worker})
+                                  for sample in family.samples]
+            yield family
+
+    def _families(self):
+        yield from self._pool_metrics()
+        try:
+            yield from self._service_metrics()
+        except Exception as e:
+            logger.error(f"Error collecting service metrics: {str(e)}")
+
+    @staticmethod
+    def _pool_metrics():
+        from app.database.postgres import pool_stats
+
+        gauges = {
+            "pool_size": GaugeMetricFamily("db_pool_size", "Connections currently open", labels=["pool"]),
+            "pool_available": GaugeMetricFamily("db_pool_available", "Idle connections in the pool", labels=["pool"]),
+            "pool_max": GaugeMetricFamily("db_pool_max_size", "Maximum connections of the pool", labels=["pool"]),
+            "requests_waiting": GaugeMetricFamily("db_pool_requests_waiting", "Clients waiting for a connection",
+                                                  labels=["pool"]),
+        }
+        utilization = GaugeMetricFamily("db_pool_utilization", "Share of the maximum connections in use",
+                                        labels=["pool"])
+        for pool, stats in pool_stats().items():
+            for key, gauge in gauges.items():
+                gauge.add_metric([pool], stats.get(key, 0))
+            in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+            utilization.add_metric([pool], in_use / stats["pool_max"] if stats.get("pool_max") else 0.0)
+        yield from gauges.values()
+        yield utilization
+
+    @staticmethod
+    def _service_metrics():
+        from app.graph.speculation import get_speculation_stats
+        from app.services.admission import get_admission_controller
+        from app.services.answer_cache import get_answer_cache
+        from app.services.embedding_cache import get_query_embedding_cache
+        from app.services.summary_jobs import get_summary_job_queue
+        from app.services.turn_scheduler import get_turn_scheduler
+
+        def counters(name: str, documentation: str, label: str, values: Dict[str, Any]):
+            family = CounterMetricFamily(name, documentation, labels=[label])
+            for key, value in values.items():
+                family.add_metric([key], value)
+            return family
+
+        answer_cache = get_answer_cache().stats()
+        yield counters("answer_cache_lookups", "Semantic answer cache lookups", "result", {
+            "hit_memory": answer_cache["hits_memory"],
+            "hit_db": answer_cache["hits_db"],
+            "miss": answer_cache["misses"],
+        })
+        yield CounterMetricFamily("answer_cache_saved_tokens", "Tokens saved by answer cache hits",
+                                  value=answer_cache["saved_tokens"])
+        yield GaugeMetricFamily("answer_cache_entries", "Entries in the answer cache", value=answer_cache["entries"])
+
+        embedding_cache = get_query_embedding_cache().stats()
+        yield counters("query_embedding_cache_lookups", "Query embedding cache lookups", "result", {
+            "hit_memory": embedding_cache["hits_memory"],
+            "hit_db": embedding_cache["hits_db"],
+            "miss": embedding_cache["misses"],
+        })
+        yield GaugeMetricFamily("query_embedding_cache_bytes", "Bytes held by the query embedding cache",
+                                value=embedding_cache["bytes"])
+
+        admission_calls = CounterMetricFamily("admission_calls", "Model calls by admission outcome",
+                                              labels=["kind", "outcome"])
+        admission_queue = GaugeMetricFamily("admission_queue_depth", "Model calls waiting for admission",
+                                            labels=["kind"])
+        for kind in ("chat", "embeddings"):
+            admission = get_admission_controller(kind).stats()
+            for outcome in ("admitted", "rejected_client", "rejected_overload", "timed_out"):
+                admission_calls.add_metric([kind, outcome], admission[outcome])
+            admission_queue.add_metric([kind], admission["queue_depth"])
+        yield admission_calls
+        yield admission_queue
+
+        turns = get_turn_scheduler().status()
+        yield counters("turn_scheduler_messages", "Messages handled by the turn scheduler", "outcome",
+                       turns["counts"])
+        yield GaugeMetricFamily("turn_scheduler_active_threads", "Threads with a running or waiting turn",
+                                value=turns["active_threads"])
+
+        summary_jobs = get_summary_job_queue().status()
+        yield counters("summary_jobs", "Background summary jobs by outcome", "outcome", summary_jobs["counts"])
+        yield GaugeMetricFamily("summary_jobs_queue_size", "Summary jobs waiting", value=summary_jobs["queue_size"])
+
+        speculation = get_speculation_stats()
+        yield counters("speculative_generations", "Speculative answers by outcome", "outcome",
+                       {outcome: speculation[outcome] for outcome in ("useful", "wasted", "failed")})
+
+
+_registry = REGISTRY
+if _multiprocess:
+    # Scrapes read every worker's metrics from the shared files, plus this worker's service stats
+    _registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(_registry)
+    _registry.register(ServiceStatsCollector(worker=str(os.getpid())))
+elif _enabled:
+    REGISTRY.register(ServiceStatsCollector())
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Render the metrics in the Prometheus text format.
+
+    Returns:
+        The body and its content type
+
+    Raises:
+        RuntimeError: If metrics are disabled or prometheus_client is not installed
+    """
+    if not _enabled:
+        raise RuntimeError("Metrics are disabled" if PROMETHEUS_AVAILABLE else "prometheus_client is not installed")
+    return generate_latest(_registry), CONTENT_TYPE_LATEST
+
+
+def close_metrics() -> None:
+    """
+    Drop the in-flight gauges of this worker from the shared metric files, so a stopped
+    worker's calls are not counted as running. Called on application shutdown.
+    """
+    if _multiprocess:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def new_trace_id(incoming: Optional[str] = None) -> str:
+    """Use the caller's trace id if it sent one (truncated), otherwise generate one."""
+    return incoming[:64] if incoming else uuid.uuid4().hex[:16]
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to log records as %(trace_id)s."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id.get()
+        return True
+
+
+def install_trace_id_logging() -> None:
+    """Add TraceIdFilter to the handlers of the root logger."""
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
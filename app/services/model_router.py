@@ -0,0 +1,212 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Deque, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from app.config.settings import (
+    LLM_ROUTING,
+    LLM_ROUTING_WINDOW,
+    LLM_ROUTING_MIN_CALLS,
+    LLM_ROUTING_MAX_ERROR_RATE
+)
+from app.services.admission import AdmissionError
+from app.services.metrics import LLM_FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Recent calls kept per model, whatever their age
+MAX_SAMPLES = 500
+
+
+class ModelRouter:
+    """
+    Orders the fallback chain of a node for each call, from the recent latency and
+    error rate observed for each model.
+
+    - "ordered" routing keeps the chain order; models with a recent error rate above
+      max_error_rate are moved to the end.
+    - "latency" routing additionally moves to the front the first model (in chain order)
+      whose recent p90 latency meets the node's latency target. A model with fewer than
+      min_calls recent calls is assumed to meet it, so it gets traffic and stats.
+
+    Stats only cover the last window seconds, so a model that was moved to the end
+    comes back once its failures age out.
+    """
+
+    def __init__(
+            self,
+            mode: str = LLM_ROUTING,
+            window: float = LLM_ROUTING_WINDOW,
+            min_calls: int = LLM_ROUTING_MIN_CALLS,
+            max_error_rate: float = LLM_ROUTING_MAX_ERROR_RATE
+    ):
+        self.mode = mode
+        self.window = window
+        self.min_calls = min_calls
+        self.max_error_rate = max_error_rate
+        self._lock = threading.Lock()
+        # (timestamp, seconds, ok) per model
+        self._samples: Dict[str, Deque[Tuple[float, float, bool]]] = {}
+
+    def record(self, model: str, seconds: float, ok: bool) -> None:
+        """Record the outcome of a call to a model."""
+        with self._lock:
+            samples = self._samples.setdefault(model, deque(maxlen=MAX_SAMPLES))
+            samples.append((time.monotonic(), seconds, ok))
+
+    def _recent(self, model: str) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            samples = self._samples.get(model)
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            return list(samples or ())
+
+    def model_stats(self, model: str) -> Dict[str, Any]:
+        """
+        Get the recent stats of a model.
+
+        Returns:
+            Dictionary with calls, errors, error_rate and the p50/p90 latency of successful calls
+        """
+        samples = self._recent(model)
+        latencies = [seconds * 1000 for _, seconds, ok in samples if ok]
+        errors = sum(1 for _, _, ok in samples if not ok)
+        p50, p90 = np.percentile(latencies, [50, 90]) if latencies else (None, None)
+        return {
+            "calls": len(samples),
+            "errors": errors,
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            "p50_ms": round(float(p50), 1) if p50 is not None else None,
+            "p90_ms": round(float(p90), 1) if p90 is not None else None,
+        }
+
+    def _healthy(self, stats: Dict[str, Any]) -> bool:
+        return stats["calls"] < self.min_calls or stats["error_rate"] <= self.max_error_rate
+
+    def _meets_target(self, stats: Dict[str, Any], target_ms: float) -> bool:
+        if stats["calls"] < self.min_calls or stats["p90_ms"] is None:
+            return True
+        return stats["p90_ms"] <= target_ms
+
+    def order(self, models: List[str], latency_target_ms: float = 0) -> List[str]:
+        """
+        Order a fallback chain for the next call.
+
+        Args:
+            models: The node's models, in configured order
+            latency_target_ms: The node's latency target (0 = none)
+
+        Returns:
+            The models in the order they should be tried
+        """
+        if len(models) < 2:
+            return list(models)
+
+        stats = {model: self.model_stats(model) for model in models}
+        healthy = [model for model in models if self._healthy(stats[model])]
+        unhealthy = [model for model in models if model not in healthy]
+
+        if self.mode == "latency" and latency_target_ms > 0 and healthy:
+            fast = [model for model in healthy if self._meets_target(stats[model], latency_target_ms)]
+            if fast:
+                healthy.remove(fast[0])
+                healthy.insert(0, fast[0])
+            else:
+                # Nothing meets the target: fastest first
+                healthy.sort(key=lambda model: stats[model]["p90_ms"])
+
+        return healthy + unhealthy
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the routing settings and the recent stats of every model used so far.
+
+        Returns:
+            Dictionary with the mode, window and stats per model
+        """
+        with self._lock:
+            models = list(self._samples)
+        return {
+            "mode": self.mode,
+            "window_seconds": self.window,
+            "min_calls": self.min_calls,
+            "max_error_rate": self.max_error_rate,
+            "models": {model: self.model_stats(model) for model in models},
+        }
+
+
+# Singleton router
+_model_router = None
+
+
+def get_model_router() -> ModelRouter:
+    """Get or create the ModelRouter singleton."""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter()
+    return _model_router
+
+
+def routed_model(node: str, candidates: Dict[str, Runnable], latency_target_ms: float = 0) -> Runnable:
+    """
+    Build a runnable that calls the node's models in the order chosen by the router,
+    moving on to the next one when a call fails.
+
+    Args:
+        node: Name of the graph node
+        candidates: Runnable per model name, in configured fallback order
+        latency_target_ms: The node's latency target (0 = none)
+
+    Returns:
+        The single candidate when there is only one, otherwise the routing runnable
+    """
+    if len(candidates) == 1:
+        return next(iter(candidates.values()))
+
+    router = get_model_router()
+    models = list(candidates)
+
+    def _attempt_failed(model: str, started: float, error: Exception, remaining: int) -> None:
+        router.record(model, time.perf_counter() - started, ok=False)
+        if remaining:
+            LLM_FALLBACKS.labels(node=node, model=model).inc()
+            logger.warning(f"Model {model} failed for node {node}, falling back: {str(error)}")
+
+    def invoke(model_input: Any, config: RunnableConfig) -> Any:
+        order = router.order(models, latency_target_ms)
+        for i, model in enumerate(order):
+            started = time.perf_counter()
+            try:
+                result = candidates[model].invoke(model_input, config)
+            except AdmissionError:
+                raise
+            except Exception as e:
+                _attempt_failed(model, started, e, remaining=len(order) - i - 1)
+                if i == len(order) - 1:
+                    raise
+                continue
+            router.record(model, time.perf_counter() - started, ok=True)
+            return result
+
+    async def ainvoke(model_input: Any, config: RunnableConfig) -> Any:
+        order = router.order(models, latency_target_ms)
+        for i, model in enumerate(order):
+            started = time.perf_counter()
+            try:
+                result = await candidates[model].ainvoke(model_input, config)
+            except AdmissionError:
+                raise
+            except Exception as e:
+                _attempt_failed(model, started, e, remaining=len(order) - i - 1)
+                if i == len(order) - 1:
+                    raise
+                continue
+            router.record(model, time.perf_counter() - started, ok=True)
+            return result
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"route_{node}")
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+import traceback
+from collections import deque
+from typing import Dict, Any, List, Optional
+from uuid import uuid4
+
+from app.config.settings import SUMMARY_MESSAGE_THRESHOLD, SUMMARY_WORKERS, SUMMARY_JOB_HISTORY
+from app.graph.nodes import asummarize_conversation
+from app.services.admission import current_client
+from app.services.thread_locks import get_thread_locks
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryJobQueue:
+    """
+    Background queue that summarizes conversations after the response was sent.
+
+    Each job loads the latest checkpoint of a thread, summarizes it and writes the new
+    summary plus the RemoveMessage trims back to the checkpoint. A thread is queued at
+    most once, and the per-thread lock shared with the turn scheduler guarantees a summary
+    never runs at the same time as another summary or a chat turn of the same thread.
+    """
+
+    def __init__(self, workers: int = SUMMARY_WORKERS, history_size: int = SUMMARY_JOB_HISTORY):
+        self._workers_count = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._history = deque(maxlen=history_size)
+        self._counts = {"scheduled": 0, "deduplicated": 0, "completed": 0, "skipped": 0, "failed": 0}
+
+    def _ensure_started(self) -> None:
+        """Start the worker tasks in the running event loop."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"summary-worker-{i}")
+                for i in range(self._workers_count)
+            ]
+            logger.info(f"Summary job queue started with {self._workers_count} workers")
+
+    def schedule(self, thread_id: str) -> bool:
+        """
+        Queue a summary job for a thread. Must be called from the event loop.
+
+        Args:
+            thread_id: The thread to summarize
+
+        Returns:
+            True if a job was queued, False if one was already pending for the thread
+        """
+        self._ensure_started()
+
+        if thread_id in self._pending:
+            self._counts["deduplicated"] += 1
+            return False
+
+        job = {
+            "job_id": str(uuid4()),
+            "thread_id": thread_id,
+            "status": "pending",
+            "enqueued_at": time.time(),
+        }
+        self._pending[thread_id] = job
+        self._counts["scheduled"] += 1
+        self._queue.put_nowait(job)
+        logger.info(f"Summary job {job['job_id']} scheduled for thread {thread_id}")
+        return True
+
+    async def _worker(self) -> None:
+        """Process summary jobs until cancelled."""
+        # Workers inherit the context of the request that started them; queue as their own client
+        current_client.set("summary-jobs")
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        """Run one job while holding the thread's lock."""
+        thread_id = job["thread_id"]
+
+        async with get_thread_locks().hold(thread_id):
+            # From here on a new turn may queue another job for this thread
+            self._pending.pop(thread_id, None)
+            self._running[thread_id] = job
+            job["status"] = "running"
+            job["started_at"] = time.time()
+
+            try:
+                summarized = await summarize_thread(thread_id)
+                job["status"] = "completed" if summarized else "skipped"
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                logger.error(f"Summary job {job['job_id']} failed for thread {thread_id}: {str(e)}")
+                logger.error(traceback.format_exc())
+            finally:
+                job["finished_at"] = time.time()
+                job["duration_ms"] = round((job["finished_at"] - job["started_at"]) * 1000, 2)
+                self._counts[job["status"]] += 1
+                self._running.pop(thread_id, None)
+                self._history.append(job)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Describe the queue for inspection.
+
+        Returns:
+            Dictionary with counters, pending and running jobs and the most recent finished jobs
+        """
+        return {
+            "workers": len(self._workers),
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "counts": dict(self._counts),
+            "pending": list(self._pending.values()),
+            "running": list(self._running.values()),
+            "recent": list(self._history)[::-1],
+        }
+
+    async def stop(self) -> None:
+        """Cancel the workers. Pending jobs are dropped."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Summary job queue stopped")
+
+
+async def summarize_thread(thread_id: str) -> bool:
+    """
+    Summarize a thread and write the summary and message trims to its checkpoint.
+
+    Args:
+        thread_id: The thread to summarize
+
+    Returns:
+        True if the thread was summarized, False if it was below the threshold
+    """
+    from app.graph.registry import get_async_chat_graph
+
+    graph = await get_async_chat_graph()
+    config = {"configurable": {"thread_id": thread_id}}
+
+    snapshot = await graph.aget_state(config)
+    values = snapshot.values or {}
+    if len(values.get("messages", [])) <= SUMMARY_MESSAGE_THRESHOLD:
+        return False
+
+    update = await asummarize_conversation(values)
+    # Written as if generate_response produced it, so the checkpoint has no pending nodes
+    await graph.aupdate_state(config, update, as_node="generate_response")
+    logger.info(f"Conversation summarized for thread {thread_id}")
+    return True
+
+
+# Singleton queue
+_summary_job_queue = None
+
+
+def get_summary_job_queue() -> SummaryJobQueue:
+    """Get or create the SummaryJobQueue singleton."""
+    global _summary_job_queue
+    if _summary_job_queue is None:
+        _summary_job_queue = SummaryJobQueue()
+    return _summary_job_queue
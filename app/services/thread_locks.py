@@ -0,0 +1,91 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, AsyncIterator, List
+
+from app.config.settings import THREAD_ADVISORY_LOCKS, THREAD_LOCK_RETRY_MS, THREAD_LOCK_RETRY_MAX_MS
+from app.database.postgres import get_async_lock_pool
+
+# First key of the two-key advisory locks of the threads (the second is the hash of the thread ID)
+THREAD_ADVISORY_LOCK_CLASS = 7301
+
+
+@asynccontextmanager
+async def _advisory_lock(thread_id: str) -> AsyncIterator[None]:
+    """
+    Hold the Postgres advisory lock of a thread, shared by all the workers.
+
+    A lock held by another worker is polled with pg_try_advisory_lock, backing off from
+    THREAD_LOCK_RETRY_MS to THREAD_LOCK_RETRY_MAX_MS; the connection goes back to the pool
+    between attempts, so only the holders keep one.
+    """
+    pool = await get_async_lock_pool()
+    delay = THREAD_LOCK_RETRY_MS / 1000
+    while True:
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT pg_try_advisory_lock(%s, hashtext(%s)) AS locked", (THREAD_ADVISORY_LOCK_CLASS, thread_id)
+            )
+            if (await cursor.fetchone())["locked"]:
+                try:
+                    yield
+                finally:
+                    # Also dropped when the connection goes back to the pool, if this is cancelled
+                    await conn.execute(
+                        "SELECT pg_advisory_unlock(%s, hashtext(%s))", (THREAD_ADVISORY_LOCK_CLASS, thread_id)
+                    )
+                return
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, THREAD_LOCK_RETRY_MAX_MS / 1000)
+
+
+class ThreadLocks:
+    """
+    Per-thread asyncio locks shared by everything that writes a thread's checkpoint
+    (chat turns and background summaries), so they never run at the same time.
+    A lock is dropped once nobody holds or waits for it.
+
+    With advisory=True, the holder of a thread's lock also takes the thread's Postgres
+    advisory lock, so the turns of a thread are serialized across workers as well.
+    """
+
+    def __init__(self, advisory: bool = THREAD_ADVISORY_LOCKS):
+        self.advisory = advisory
+        # thread_id -> [lock, holders and waiters]
+        self._locks: Dict[str, List] = {}
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the lock of a thread for the duration of the block."""
+        entry = self._locks.setdefault(thread_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if self.advisory:
+                    async with _advisory_lock(thread_id):
+                        yield
+                else:
+                    yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(thread_id, None)
+
+    def locked(self, thread_id: str) -> bool:
+        """Whether a thread's lock is currently held."""
+        entry = self._locks.get(thread_id)
+        return entry is not None and entry[0].locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+# Singleton locks
+_thread_locks = None
+
+
+def get_thread_locks() -> ThreadLocks:
+    """Get or create the ThreadLocks singleton."""
+    global _thread_locks
+    if _thread_locks is None:
+        _thread_locks = ThreadLocks()
+    return _thread_locks
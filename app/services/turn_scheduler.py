@@ -0,0 +1,248 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional, AsyncIterator, Set
+
+from app.config.settings import TURN_QUEUE_LIMIT, TURN_COALESCE, TURN_DEBOUNCE_MS
+from app.graph.deadline import new_turn_budget
+from app.services.chat_service import aprocess_message, astream_message
+from app.services.thread_locks import get_thread_locks
+
+logger = logging.getLogger(__name__)
+
+
+class TurnQueueFullError(Exception):
+    """Raised when a thread already has too many turns waiting."""
+
+    def __init__(self, thread_id: str, limit: int):
+        self.thread_id = thread_id
+        self.limit = limit
+        super().__init__(f"Too many pending messages for thread {thread_id} (limit {limit})")
+
+
+class _PendingTurn:
+    """
+    A turn waiting for its thread's lock; it can absorb messages until it starts.
+    Its time budget starts when the first message is submitted, so the wait counts against it.
+    """
+
+    def __init__(self, message: str, reset_thread: bool, coalesce: bool, deadline_ms: Optional[int] = None):
+        self.messages: List[str] = [message]
+        self.budget = new_turn_budget(deadline_ms)
+        self.reset_thread = reset_thread
+        self.coalesce = coalesce
+        self.started = False
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def accepts(self, reset_thread: bool) -> bool:
+        return self.coalesce and not self.started and not self.reset_thread and not reset_thread
+
+
+class StreamSlot:
+    """A queue slot reserved for a streamed turn; released once, whichever release comes first."""
+
+    def __init__(self, scheduler: "TurnScheduler", thread_id: str):
+        self.scheduler = scheduler
+        self.thread_id = thread_id
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self.thread_id)
+
+
+class TurnScheduler:
+    """
+    Serializes the chat turns of each thread.
+
+    Turns of the same thread run one at a time under the thread's lock, which is shared
+    with the background summary jobs, so they never load the same checkpoint concurrently.
+    Messages that arrive while an earlier turn of the thread is still waiting or running
+    are merged into the next pending turn (one graph run, one answer for all of them),
+    optionally waiting debounce_ms for more fragments. Past queue_limit waiting turns,
+    new messages are rejected with TurnQueueFullError.
+    """
+
+    def __init__(self,
+                 queue_limit: int = TURN_QUEUE_LIMIT,
+                 coalesce: bool = TURN_COALESCE,
+                 debounce_ms: int = TURN_DEBOUNCE_MS):
+        self.queue_limit = queue_limit
+        self.coalesce = coalesce
+        self.debounce_ms = debounce_ms
+
+        self._waiting: Dict[str, int] = {}
+        self._open_turns: Dict[str, _PendingTurn] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._counts = Counter()
+
+    def _reserve(self, thread_id: str) -> None:
+        """Count a new waiting turn for the thread, or reject it past the queue limit."""
+        if self._waiting.get(thread_id, 0) >= self.queue_limit:
+            self._counts["rejected"] += 1
+            raise TurnQueueFullError(thread_id, self.queue_limit)
+        self._waiting[thread_id] = self._waiting.get(thread_id, 0) + 1
+
+    def _release(self, thread_id: str) -> None:
+        """A waiting turn of the thread started (or gave up)."""
+        self._waiting[thread_id] -= 1
+        if not self._waiting[thread_id]:
+            del self._waiting[thread_id]
+
+    async def submit(
+            self,
+            thread_id: str,
+            message: str,
+            reset_thread: bool = False,
+            coalesce: Optional[bool] = None,
+            deadline_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Run a chat turn once the previous turns of the thread have finished.
+
+        Args:
+            thread_id: The conversation thread
+            message: The user's message
+            reset_thread: Whether to reset the thread and start a new conversation
+            coalesce: Whether the message may be merged with other queued messages
+                (defaults to the scheduler setting)
+            deadline_ms: Time budget of the turn, counted from now (capped by TURN_DEADLINE_MS);
+                merged messages share the budget of the turn they join
+
+        Returns:
+            The chat result; merged messages share the answer of the combined turn
+
+        Raises:
+            TurnQueueFullError: If the thread already has queue_limit turns waiting
+        """
+        coalesce = self.coalesce if coalesce is None else coalesce
+        self._counts["submitted"] += 1
+
+        pending = self._open_turns.get(thread_id)
+        if coalesce and pending is not None and pending.accepts(reset_thread):
+            pending.messages.append(message)
+            self._counts["coalesced"] += 1
+            logger.info(f"Message coalesced into pending turn for thread {thread_id} "
+                        f"({len(pending.messages)} messages)")
+        else:
+            self._reserve(thread_id)
+            pending = _PendingTurn(message, reset_thread, coalesce, deadline_ms)
+            if coalesce:
+                self._open_turns[thread_id] = pending
+            task = asyncio.create_task(self._run(thread_id, pending))
+            # The turn runs to completion even if the client disconnects
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        result = await asyncio.shield(pending.result)
+        return {**result, "message": message, "coalesced_messages": len(pending.messages)}
+
+    async def _run(self, thread_id: str, pending: _PendingTurn) -> None:
+        """Wait for the thread's lock and run the (possibly merged) turn."""
+        try:
+            if pending.coalesce and self.debounce_ms > 0:
+                await asyncio.sleep(self.debounce_ms / 1000)
+
+            async with get_thread_locks().hold(thread_id):
+                pending.started = True
+                if self._open_turns.get(thread_id) is pending:
+                    del self._open_turns[thread_id]
+                self._release(thread_id)
+
+                self._counts["turns"] += 1
+                result = await aprocess_message(
+                    message="\n".join(pending.messages),
+                    thread_id=thread_id,
+                    reset_thread=pending.reset_thread,
+                    budget=pending.budget
+                )
+            pending.result.set_result(result)
+        except Exception as e:
+            if not pending.started:
+                if self._open_turns.get(thread_id) is pending:
+                    del self._open_turns[thread_id]
+                self._release(thread_id)
+            pending.result.set_exception(e)
+
+    async def stream(
+            self,
+            slot: "StreamSlot",
+            message: str,
+            reset_thread: bool = False,
+            deadline_ms: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a chat turn once the previous turns of the thread have finished.
+        Streamed turns are never merged with other messages.
+
+        Args:
+            slot: The queue slot returned by reserve_stream, taken back when the turn starts
+            message: The user's message
+            reset_thread: Whether to reset the thread and start a new conversation
+            deadline_ms: Time budget of the turn, counted from now (capped by TURN_DEADLINE_MS)
+
+        Yields:
+            The events of astream_message
+        """
+        budget = new_turn_budget(deadline_ms)
+        try:
+            async with get_thread_locks().hold(slot.thread_id):
+                slot.release()
+                self._counts["turns"] += 1
+                async for event in astream_message(message, slot.thread_id, reset_thread, budget):
+                    yield event
+        finally:
+            slot.release()
+
+    def reserve_stream(self, thread_id: str) -> "StreamSlot":
+        """
+        Reserve a queue slot for a streamed turn, so that a full queue is reported
+        before the response starts.
+
+        The slot is taken back by stream when the turn starts; callers also release it
+        once the response is over, in case the stream never ran (client gone before the
+        response started).
+
+        Returns:
+            The slot, to pass to stream
+
+        Raises:
+            TurnQueueFullError: If the thread already has queue_limit turns waiting
+        """
+        self._counts["submitted"] += 1
+        self._reserve(thread_id)
+        return StreamSlot(self, thread_id)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Describe the scheduler for inspection.
+
+        Returns:
+            Dictionary with settings, counters and the threads with waiting turns
+        """
+        return {
+            "queue_limit": self.queue_limit,
+            "coalesce": self.coalesce,
+            "debounce_ms": self.debounce_ms,
+            "counts": {
+                "submitted": self._counts["submitted"],
+                "turns": self._counts["turns"],
+                "coalesced": self._counts["coalesced"],
+                "rejected": self._counts["rejected"],
+            },
+            "waiting": dict(self._waiting),
+            "active_threads": len(get_thread_locks()),
+        }
+
+
+# Singleton scheduler
+_turn_scheduler = None
+
+
+def get_turn_scheduler() -> TurnScheduler:
+    """Get or create the TurnScheduler singleton."""
+    global _turn_scheduler
+    if _turn_scheduler is None:
+        _turn_scheduler = TurnScheduler()
+    return _turn_scheduler
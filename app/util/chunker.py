@@ -0,0 +1,166 @@
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.config.settings import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.util.context_assembler import count_tokens, split_passages
+from app.util.text_extractor import TextExtractor
+
+logger = logging.getLogger(__name__)
+
+# Markdown headings; the DOCX extractor also writes its heading paragraphs this way
+HEADING_PATTERN = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+CHUNK_SEPARATOR = "\n\n"
+
+
+def _sections(text: str, heading: Optional[str]) -> List[Tuple[Optional[str], str]]:
+    """
+    Split a text at its headings.
+
+    Args:
+        text: The text of a page (or of the whole document)
+        heading: Heading in force at the start of the text (from a previous page)
+
+    Returns:
+        (heading, text) pairs; each section's text starts with its heading line
+    """
+    sections = []
+    start = 0
+    for match in HEADING_PATTERN.finditer(text):
+        if text[start:match.start()].strip():
+            sections.append((heading, text[start:match.start()]))
+        heading = match.group(2).strip()
+        start = match.start()
+    if text[start:].strip():
+        sections.append((heading, text[start:]))
+    return sections
+
+
+def _split_words(text: str, max_tokens: int) -> List[str]:
+    """Split a text without usable sentence breaks into pieces of at most max_tokens."""
+    pieces = []
+    current: List[str] = []
+    current_tokens = 0
+    words = []
+    for word in text.split():
+        word_tokens = count_tokens(word)
+        # A "word" longer than a chunk (a URL, a base64 string) is cut by characters
+        step = len(word) * max_tokens // word_tokens if word_tokens > max_tokens else len(word)
+        words.extend(word[i:i + max(step, 1)] for i in range(0, len(word), max(step, 1)))
+
+    for word in words:
+        word_tokens = count_tokens(f" {word}")
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _overlap(text: str, overlap_tokens: int) -> str:
+    """The trailing sentences of a chunk that fit in overlap_tokens."""
+    if overlap_tokens <= 0:
+        return ""
+    sentences = [sentence for sentence in re.split(r"(?<=[.!?;:])\s+|\n+", text) if sentence.strip()]
+    tail: List[str] = []
+    tokens = 0
+    for sentence in reversed(sentences):
+        sentence_tokens = count_tokens(sentence)
+        if tokens + sentence_tokens > overlap_tokens:
+            break
+        tail.insert(0, sentence)
+        tokens += sentence_tokens
+    return " ".join(tail)
+
+
+def _chunk_section(text: str, chunk_tokens: int, overlap_tokens: int) -> List[str]:
+    """Pack the paragraphs of a section into chunks of at most chunk_tokens."""
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for passage in split_passages(text, max_tokens=chunk_tokens):
+        pieces = [passage] if count_tokens(passage) <= chunk_tokens else _split_words(passage, chunk_tokens)
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > chunk_tokens:
+                chunk = CHUNK_SEPARATOR.join(current)
+                chunks.append(chunk)
+                tail = _overlap(chunk, overlap_tokens)
+                tail_tokens = count_tokens(tail)
+                # The overlap is dropped when it would push the next chunk over the limit
+                if tail and tail_tokens + piece_tokens <= chunk_tokens:
+                    current, current_tokens = [tail], tail_tokens
+                else:
+                    current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(CHUNK_SEPARATOR.join(current))
+    return chunks
+
+
+def chunk_document(
+        pages: List[str],
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[Dict[str, Any]]:
+    """
+    Split a document into chunks for embedding.
+
+    Chunks never cross a page or a heading: each page is split at its headings, and
+    the paragraphs of each section are packed into chunks of at most chunk_tokens.
+    Paragraphs that are too long are split on sentences (or words). Each chunk starts
+    with the last sentences of the previous chunk of the section, up to overlap_tokens.
+
+    Args:
+        pages: Text of each page (a single element for documents without pages)
+        chunk_tokens: Maximum tokens of a chunk
+        overlap_tokens: Tokens of the previous chunk repeated at the start of the next one
+
+    Returns:
+        List of chunks in reading order, each with its text, page (1-based, None for
+        documents without pages) and section heading (None before the first heading)
+    """
+    chunks = []
+    heading = None
+    for page_number, page in enumerate(pages, 1):
+        sections = _sections(page, heading)
+        for section, text in sections:
+            for chunk in _chunk_section(text, chunk_tokens, overlap_tokens):
+                chunks.append({
+                    "text": chunk,
+                    "page": page_number if len(pages) > 1 else None,
+                    "section": section,
+                })
+        # A section can go on in the next page
+        if sections:
+            heading = sections[-1][0]
+    return chunks
+
+
+def extract_chunks(file_content: bytes, mime_type: str) -> Dict[str, Any]:
+    """
+    Extract the text of a file, page by page for PDF files, and split it into chunks.
+
+    Also runs in the worker processes of the bulk upload, so it only takes and returns
+    picklable values.
+
+    Args:
+        file_content: Binary content of the file
+        mime_type: MIME type of the file
+
+    Returns:
+        Dictionary with the content_length of the extracted text and its chunks
+
+    Raises:
+        TextExtractionError: If the text of the file cannot be extracted
+    """
+    pages = TextExtractor.extract_pages(file_content, mime_type)
+    return {
+        "content_length": len("\n\n".join(pages)),
+        "chunks": chunk_document(pages),
+    }
@@ -0,0 +1,199 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from app.config.settings import CONTEXT_TOKEN_BUDGETS, CONTEXT_DEDUP_THRESHOLD, CONTEXT_PASSAGE_TOKENS, LLM_MODEL
+from app.util.intent_classifier import normalize_text
+
+# Optional import for exact token counts
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Same separators used by the original context format
+DOCUMENT_SEPARATOR = "\n\n---\n\n"
+PASSAGE_SEPARATOR = "\n[...]\n"
+
+# Frequent Spanish words that say nothing about relevance
+STOPWORDS = {
+    "a", "al", "algo", "como", "con", "cual", "cuales", "cuando", "cuanto", "de", "del", "donde", "el", "ella",
+    "en", "es", "esta", "este", "esto", "hay", "la", "las", "le", "lo", "los", "me", "mi", "mis", "muy", "no",
+    "o", "para", "pero", "por", "que", "quien", "se", "si", "sin", "sobre", "su", "sus", "te", "tengo", "tu",
+    "un", "una", "uno", "y", "ya", "yo", "quiero", "puedo", "necesito", "saber",
+}
+
+_encoding = None
+_encoding_unavailable = not TIKTOKEN_AVAILABLE
+
+
+def _get_encoding():
+    """Load the tokenizer for the configured model once; None if it cannot be loaded."""
+    global _encoding, _encoding_unavailable
+    if _encoding is None and not _encoding_unavailable:
+        try:
+            _encoding = tiktoken.encoding_for_model(LLM_MODEL)
+        except Exception:
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # Don't try again on every call (e.g. the encoding file cannot be downloaded)
+                _encoding_unavailable = True
+                logger.warning(f"Could not load tiktoken encoding, estimating token counts: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text with the local tokenizer.
+    Falls back to an estimate of 4 characters per token when tiktoken is not available.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_token_budget(node: str) -> int:
+    """Get the context token budget for a graph node (0 means unlimited)."""
+    return CONTEXT_TOKEN_BUDGETS.get(node, 0)
+
+
+def _terms(text: str) -> List[str]:
+    """Split a text into normalized terms without stopwords, truncated to a crude stem."""
+    return [word[:6] for word in normalize_text(text).split() if word not in STOPWORDS and len(word) > 1]
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    """Word shingles used to detect near-identical passages."""
+    words = normalize_text(text).split()
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: Set, b: Set) -> float:
+    """Jaccard similarity of two sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def split_passages(text: str, max_tokens: int = CONTEXT_PASSAGE_TOKENS) -> List[str]:
+    """
+    Split a document into passages: paragraphs, with long paragraphs split on sentences
+    so that each passage stays under max_tokens.
+    """
+    passages = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            passages.append(paragraph)
+            continue
+
+        current = ""
+        for sentence in re.split(r"(?<=[.!?;:])\s+|\n", paragraph):
+            candidate = f"{current} {sentence}".strip()
+            if current and count_tokens(candidate) > max_tokens:
+                passages.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            passages.append(current)
+    return passages
+
+
+def _format_context(sections: List[Tuple[str, List[str]]]) -> str:
+    """Format (title, passages) sections the same way as the full context."""
+    parts = [
+        f"Document {i}: {title}\n{PASSAGE_SEPARATOR.join(passages)}"
+        for i, (title, passages) in enumerate(sections, 1)
+    ]
+    return DOCUMENT_SEPARATOR.join(parts)
+
+
+def assemble_context(query: str, documents: List[Document], token_budget: Optional[int] = None) -> str:
+    """
+    Build the context text from the retrieved documents within a token budget.
+
+    If the documents fit in the budget they are used whole. Otherwise they are split
+    into passages, near-identical passages are dropped, and the passages with the
+    highest lexical overlap with the query are kept until the budget is used.
+
+    Args:
+        query: The user's query
+        documents: Retrieved documents, ordered by relevance
+        token_budget: Maximum tokens of context; None or 0 means unlimited
+
+    Returns:
+        The context text
+    """
+    if not documents:
+        return ""
+
+    titles = [doc.metadata.get("name", f"Document {i}") for i, doc in enumerate(documents, 1)]
+    full_context = _format_context([(title, [doc.page_content]) for title, doc in zip(titles, documents)])
+    if not token_budget or count_tokens(full_context) <= token_budget:
+        return full_context
+
+    # Split into passages, remembering where each one came from
+    candidates = []
+    for doc_index, doc in enumerate(documents):
+        for position, passage in enumerate(split_passages(doc.page_content)):
+            candidates.append((doc_index, position, passage))
+
+    # IDF over passages, so rare query terms weigh more than common ones
+    passage_terms = [set(_terms(passage)) for _, _, passage in candidates]
+    document_frequency = Counter(term for terms in passage_terms for term in terms)
+    query_terms = set(_terms(query))
+
+    def score(index: int) -> float:
+        doc_index = candidates[index][0]
+        overlap = sum(
+            math.log(1 + len(candidates) / document_frequency[term])
+            for term in query_terms & passage_terms[index]
+        )
+        # Retrieval order breaks ties between passages with the same overlap
+        return overlap + 0.01 / (1 + doc_index)
+
+    ranked = sorted(range(len(candidates)), key=score, reverse=True)
+
+    selected = []
+    selected_shingles = []
+    used_tokens = sum(count_tokens(f"Document {i}: {title}\n") for i, title in enumerate(titles, 1))
+    for index in ranked:
+        passage = candidates[index][2]
+        shingles = _shingles(passage)
+        if any(_jaccard(shingles, other) >= CONTEXT_DEDUP_THRESHOLD for other in selected_shingles):
+            continue
+
+        passage_tokens = count_tokens(passage) + count_tokens(PASSAGE_SEPARATOR)
+        if used_tokens + passage_tokens > token_budget:
+            continue
+
+        selected.append(index)
+        selected_shingles.append(shingles)
+        used_tokens += passage_tokens
+
+    # Keep documents in retrieval order and passages in reading order
+    sections = []
+    for doc_index, title in enumerate(titles):
+        positions = sorted(candidates[i][1:] for i in selected if candidates[i][0] == doc_index)
+        if positions:
+            sections.append((title, [passage for _, passage in positions]))
+
+    logger.info(f"Context compressed to {len(selected)} of {len(candidates)} passages ({used_tokens} tokens)")
+    return _format_context(sections)
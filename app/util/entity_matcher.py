@@ -0,0 +1,106 @@
+import re
+from typing import Dict, Optional, Tuple
+
+from app.util.intent_classifier import normalize_text
+
+# Known values for each VehicleInfo field, as (pattern on normalized text, canonical value)
+VEHICLE_TYPES = [
+    (r"movilidad escolar|transporte escolar|escolar", "escolar"),
+    (r"transporte (de )?(mercancias?|carga)|mercancias?|carga pesada|camion(es)?|furgon|trailer", "transporte de mercancías"),
+    (r"transporte (publico|de pasajeros|urbano)|omnibus|bus|combi|coaster|micro", "transporte público"),
+    (r"taxi|taxista", "taxi"),
+    (r"particular|uso (personal|privado|particular)|auto propio", "particular"),
+]
+
+PLANT_LOCATIONS = [
+    (r"sjl|san juan de lurigancho", "sjl"),
+    (r"trapiche", "trapiche"),
+    (r"carabayllo", "carabayllo"),
+]
+
+SERVICE_TYPES = [
+    (r"primera vez|por primera|primera revision|primera inspeccion|nunca (la )?(he|ha) pasado|vehiculo nuevo|auto nuevo", "primera vez"),
+    (r"renovacion|renovar|renuevo|periodica|ya (la )?(pase|paso|tengo)|vencid[oa]|otra vez", "renovación"),
+]
+
+# "M1", or "categoria m 1"; a bare "o 2" is too common in Spanish to accept without the prefix
+TARIFF_TYPE = re.compile(r"\b([mnlo])([1-3])\b|\bcategoria ([mnlo]) ([1-3])\b")
+
+# Words that show the user is talking about a field; if present and no value matched,
+# the matcher is inconclusive and the LLM extraction is needed
+FIELD_CUES = {
+    "vehicle_type": r"vehiculo|carro|auto|camioneta|unidad|moto|mototaxi|minivan|van",
+    "plant_location": r"planta|sede|local|distrito|zona|cerca|ubica",
+    "service_type": r"primera|renov|vez|periodic",
+    "tariff_type": r"categoria",
+}
+
+_VEHICLE_TYPES = [(re.compile(rf"\b(?:{pattern})\b"), value) for pattern, value in VEHICLE_TYPES]
+_PLANT_LOCATIONS = [(re.compile(rf"\b(?:{pattern})\b"), value) for pattern, value in PLANT_LOCATIONS]
+_SERVICE_TYPES = [(re.compile(rf"\b(?:{pattern})\b"), value) for pattern, value in SERVICE_TYPES]
+_FIELD_CUES = {field: re.compile(rf"\b(?:{pattern})") for field, pattern in FIELD_CUES.items()}
+
+
+def _first_match(patterns, text: str) -> Optional[str]:
+    """Return the canonical value of the first pattern found in the text."""
+    for pattern, value in patterns:
+        if pattern.search(text):
+            return value
+    return None
+
+
+def match_vehicle_info(text: str) -> Tuple[Dict[str, str], bool]:
+    """
+    Extract VehicleInfo fields from a single message with the local dictionaries.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        A tuple (values, conclusive): the fields found in the message, and whether
+        the matcher is confident nothing else relevant was mentioned
+    """
+    normalized = normalize_text(text)
+
+    values = {}
+    vehicle_type = _first_match(_VEHICLE_TYPES, normalized)
+    if vehicle_type:
+        values["vehicle_type"] = vehicle_type
+
+    plant_location = _first_match(_PLANT_LOCATIONS, normalized)
+    if plant_location:
+        values["plant_location"] = plant_location
+
+    service_type = _first_match(_SERVICE_TYPES, normalized)
+    if service_type:
+        values["service_type"] = service_type
+
+    tariff = TARIFF_TYPE.search(normalized)
+    if tariff:
+        letter, number = (tariff.group(1), tariff.group(2)) if tariff.group(1) else (tariff.group(3), tariff.group(4))
+        values["tariff_type"] = f"{letter.upper()}{number}"
+
+    # Inconclusive if the message talks about a field whose value we could not resolve
+    conclusive = not any(
+        field not in values and cue.search(normalized)
+        for field, cue in _FIELD_CUES.items()
+    )
+    return values, conclusive
+
+
+def merge_vehicle_info(current: Optional[dict], update: Optional[dict]) -> dict:
+    """
+    Merge newly extracted fields into the vehicle info already known.
+    Fields that are missing or null in the update keep their current value.
+    """
+    merged = {
+        "vehicle_type": None,
+        "plant_location": None,
+        "service_type": None,
+        "tariff_type": None,
+        **(current or {}),
+    }
+    for field, value in (update or {}).items():
+        if value:
+            merged[field] = value
+    return merged
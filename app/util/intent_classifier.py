@@ -0,0 +1,121 @@
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Trivial intents (same names used by AMBIGUITY_CLASSIFIER_PROMPT)
+GREETING = "SALUDO"
+THANKS = "AGRADECIMIENTO"
+GOODBYE = "DESPEDIDA"
+CONFIRMATION = "CONFIRMACION"
+
+# Messages longer than this are never considered trivial
+MAX_TRIVIAL_WORDS = 10
+
+# Spanish lexicon, written in normalized form (lowercase, no accents or punctuation)
+LEXICON = {
+    GREETING: [
+        r"hola", r"holi", r"holis", r"hey", r"alo", r"buenas", r"buen dia", r"buenos dias",
+        r"buenas tardes", r"buenas noches", r"saludos", r"que tal", r"como estas", r"como esta",
+        r"como va", r"que hay",
+    ],
+    THANKS: [
+        r"gracias", r"muchas gracias", r"muchisimas gracias", r"mil gracias", r"gracias totales",
+        r"te agradezco", r"le agradezco", r"muy amable", r"muy amables", r"por (todo|la ayuda|tu ayuda|su ayuda|la informacion|la info)",
+    ],
+    GOODBYE: [
+        r"adios", r"chau", r"chao", r"bye", r"hasta luego", r"hasta pronto", r"hasta manana",
+        r"nos vemos", r"cuidate", r"que (tengas|tenga) (un )?(buen|lindo|excelente) dia", r"eso es todo",
+        r"eso seria todo", r"nada mas",
+    ],
+    CONFIRMATION: [
+        r"si", r"sip", r"no", r"ok", r"okay", r"okey", r"oki", r"vale", r"claro", r"claro que si",
+        r"de acuerdo", r"perfecto", r"entendido", r"entiendo", r"listo", r"genial", r"excelente",
+        r"bueno", r"bien", r"muy bien", r"esta bien", r"correcto", r"exacto", r"dale", r"ya",
+    ],
+}
+
+# Filler words that may accompany trivial phrases ("hola martin", "ok amigo")
+FILLERS = [r"martin", r"amigo", r"amiga", r"senor", r"senorita", r"a todos", r"entonces", r"pues", r"y"]
+
+# When several intents appear in one message ("ok gracias, chau"), the first in this order wins
+INTENT_PRIORITY = [GOODBYE, THANKS, GREETING, CONFIRMATION]
+
+_PHRASE_PATTERNS = {
+    intent: re.compile(r"\b(?:" + "|".join(phrases) + r")\b")
+    for intent, phrases in LEXICON.items()
+}
+_ALL_PHRASES = [phrase for phrases in LEXICON.values() for phrase in phrases] + FILLERS
+# The whole message must be a sequence of known phrases
+_TRIVIAL_MESSAGE = re.compile(r"^(?:" + "|".join(_ALL_PHRASES) + r")(?: (?:" + "|".join(_ALL_PHRASES) + r"))*$")
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a message for lexicon matching: lowercase, strip accents, punctuation
+    and emojis, collapse elongated letters ("holaaa" -> "hola") and whitespace.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    text = re.sub(r"([a-z])\1{2,}", r"\1", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def classify_intent(text: str) -> Optional[str]:
+    """
+    Classify a message as a trivial intent using the local lexicon.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        One of GREETING, THANKS, GOODBYE or CONFIRMATION, or None if the message
+        is not trivial and needs the full pipeline
+    """
+    normalized = normalize_text(text)
+    if not normalized or len(normalized.split()) > MAX_TRIVIAL_WORDS:
+        return None
+
+    if not _TRIVIAL_MESSAGE.match(normalized):
+        return None
+
+    for intent in INTENT_PRIORITY:
+        if _PHRASE_PATTERNS[intent].search(normalized):
+            return intent
+
+    return None
+
+
+def record_intent(intent: Optional[str]) -> None:
+    """Count a classified message, and whether it took the fast path."""
+    with _stats_lock:
+        _stats["checked"] += 1
+        if intent is not None:
+            _stats["fast_path"] += 1
+            _stats[intent] += 1
+
+
+def get_intent_stats() -> Dict[str, Any]:
+    """
+    Get the intent pre-classifier counters.
+
+    Returns:
+        Dictionary with messages checked, fast path hits, hit ratio and hits per intent
+    """
+    with _stats_lock:
+        checked = _stats["checked"]
+        fast_path = _stats["fast_path"]
+        return {
+            "checked": checked,
+            "fast_path": fast_path,
+            "fast_path_ratio": round(fast_path / checked, 4) if checked else 0.0,
+            "by_intent": {intent: _stats[intent] for intent in LEXICON},
+        }
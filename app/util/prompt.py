@@ -178,4 +178,22 @@ AMBIGUITY_CLASSIFIER_PROMPT_v3 = """Analiza la consulta del usuario sobre revisi
 - "is_ambiguous": [true/false],
 - "ambiguity_category": [TIPO_VEHICULO/PRIMERA_VEZ_RENOVACION/DOCUMENTACION/CRONOGRAMA/PLANTAS_UBICACION/ESTADO_VEHICULO/PROCEDIMIENTO/NINGUNA],
 - "clarification_question": [pregunta_específica_o_string_vacío],
-"""
\ No newline at end of file
+"""
+# Respuestas para mensajes triviales (saludos, agradecimientos, despedidas, confirmaciones)
+QUICK_RESPONSES = {
+    "SALUDO": (
+        "¡Hola! Soy Martín, tu asistente de Revisiones Técnicas del Perú. ¿En qué te puedo ayudar hoy? "
+        "Puedo contarte sobre tarifas, requisitos, plantas de revisión y el proceso de inspección."
+    ),
+    "AGRADECIMIENTO": "¡No hay de qué! Estoy aquí para ayudarte. ¿Hay algo más que quieras saber sobre tu revisión técnica?",
+    "DESPEDIDA": (
+        "¡Hasta luego! Que tengas un excelente día. Si necesitas algo más sobre tu revisión técnica, aquí estaré."
+    ),
+    "CONFIRMACION": "¡Perfecto! ¿Hay algo más en lo que te pueda ayudar?",
+}
+
+# Respuesta cuando generate_response no termina dentro del plazo del turno
+DEADLINE_ANSWER = (
+    "Lo siento, en este momento estoy tardando más de lo normal en responder. "
+    "¿Podrías intentarlo de nuevo en unos instantes?"
+)
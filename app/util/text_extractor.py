@@ -29,9 +29,29 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+class TextExtractionError(Exception):
+    """Raised when the text of a file cannot be extracted."""
+
+
 class TextExtractor:
     """Utility class to extract text from different file types."""
 
+    # Types with a dedicated extractor (any text/* type is read as plain text too)
+    SUPPORTED_MIME_TYPES = {
+        'application/pdf',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'application/vnd.ms-powerpoint',
+        'application/xhtml+xml',
+        'application/json',
+    }
+
+    @staticmethod
+    def is_supported(mime_type: str) -> bool:
+        """Whether text can be extracted from files of this type (other types are decoded as plain text)."""
+        return mime_type in TextExtractor.SUPPORTED_MIME_TYPES or mime_type.startswith('text/')
+
     @staticmethod
     def extract_text_content(file_content: bytes, mime_type: str) -> str:
         """
@@ -42,87 +62,123 @@ class TextExtractor:
             mime_type: MIME type of the file
 
         Returns:
-            Extracted text content as string
+            Extracted text content as string, or a message describing why it could not be extracted
         """
         try:
-            if mime_type == 'text/plain':
-                return file_content.decode('utf-8', errors='replace')
+            return TextExtractor._extract_text(file_content, mime_type)
+        except TextExtractionError as e:
+            return str(e)
+        except Exception as e:
+            logger.error(f"Error extracting text: {str(e)}")
+            return f"Error extracting text: {str(e)}"
 
-            elif mime_type == 'application/pdf':
-                return TextExtractor._extract_from_pdf(file_content)
+    @staticmethod
+    def extract_pages(file_content: bytes, mime_type: str) -> List[str]:
+        """
+        Extract the text of each page of a file, so that chunks do not cross pages.
 
-            elif mime_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                               'application/msword']:
-                return TextExtractor._extract_from_docx(file_content)
+        Args:
+            file_content: Binary content of the file
+            mime_type: MIME type of the file
 
-            elif mime_type in ['application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                               'application/vnd.ms-powerpoint']:
-                return TextExtractor._extract_from_pptx(file_content)
+        Returns:
+            Text of each page for PDF files; a single element with the whole text otherwise
 
-            elif mime_type in ['text/html', 'application/xhtml+xml']:
-                return TextExtractor._extract_from_html(file_content)
+        Raises:
+            TextExtractionError: If the file cannot be read (corrupt file, missing extraction library)
+        """
+        if mime_type == 'application/pdf' and PYPDF_AVAILABLE:
+            try:
+                return TextExtractor._extract_pdf_pages(file_content)
+            except Exception as e:
+                logger.error(f"Error extracting text from PDF: {str(e)}")
+                raise TextExtractionError(f"Error extracting text from PDF: {str(e)}") from e
+        return [TextExtractor._extract_text(file_content, mime_type)]
 
-            elif mime_type in ['application/json']:
-                return file_content.decode('utf-8', errors='replace')
+    @staticmethod
+    def _extract_text(file_content: bytes, mime_type: str) -> str:
+        """Extract text based on mime_type, raising TextExtractionError when the file cannot be read."""
+        if mime_type == 'text/plain':
+            return file_content.decode('utf-8', errors='replace')
 
-            elif mime_type in ['text/markdown', 'text/x-markdown']:
-                return file_content.decode('utf-8', errors='replace')
+        elif mime_type == 'application/pdf':
+            return TextExtractor._extract_from_pdf(file_content)
 
-            else:
-                # Fallback to treating as plain text
-                logger.warning(f"Unsupported mime type: {mime_type}, trying to extract as plain text")
-                try:
-                    return file_content.decode('utf-8', errors='replace')
-                except Exception:
-                    return "Unable to extract text from this file type."
+        elif mime_type in ['application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                           'application/msword']:
+            return TextExtractor._extract_from_docx(file_content)
 
-        except Exception as e:
-            logger.error(f"Error extracting text: {str(e)}")
-            return f"Error extracting text: {str(e)}"
+        elif mime_type in ['application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                           'application/vnd.ms-powerpoint']:
+            return TextExtractor._extract_from_pptx(file_content)
+
+        elif mime_type in ['text/html', 'application/xhtml+xml']:
+            return TextExtractor._extract_from_html(file_content)
+
+        elif mime_type in ['application/json']:
+            return file_content.decode('utf-8', errors='replace')
+
+        elif mime_type in ['text/markdown', 'text/x-markdown']:
+            return file_content.decode('utf-8', errors='replace')
+
+        else:
+            # Fallback to treating as plain text
+            logger.warning(f"Unsupported mime type: {mime_type}, trying to extract as plain text")
+            try:
+                return file_content.decode('utf-8', errors='replace')
+            except Exception:
+                raise TextExtractionError("Unable to extract text from this file type.")
+
+    @staticmethod
+    def _extract_pdf_pages(file_content: bytes) -> List[str]:
+        """Extract the text of each page of a PDF file."""
+        with io.BytesIO(file_content) as pdf_file:
+            reader = PyPDF2.PdfReader(pdf_file)
+            return [page.extract_text() or "" for page in reader.pages]
 
     @staticmethod
     def _extract_from_pdf(file_content: bytes) -> str:
         """Extract text from a PDF file."""
         if not PYPDF_AVAILABLE:
             logger.warning("PyPDF2 is not installed. Cannot extract text from PDF.")
-            return "PDF extraction requires PyPDF2 library. Please install it with: pip install PyPDF2"
+            raise TextExtractionError("PDF extraction requires PyPDF2 library. Please install it with: pip install PyPDF2")
 
         try:
-            text = ""
-            with io.BytesIO(file_content) as pdf_file:
-                reader = PyPDF2.PdfReader(pdf_file)
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    text += page.extract_text() + "\n\n"
-            return text
+            return "".join(page + "\n\n" for page in TextExtractor._extract_pdf_pages(file_content))
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
-            return f"Error extracting text from PDF: {str(e)}"
+            raise TextExtractionError(f"Error extracting text from PDF: {str(e)}") from e
 
     @staticmethod
     def _extract_from_docx(file_content: bytes) -> str:
         """Extract text from a DOCX file."""
         if not DOCX_AVAILABLE:
             logger.warning("python-docx is not installed. Cannot extract text from DOCX.")
-            return "DOCX extraction requires python-docx library. Please install it with: pip install python-docx"
+            raise TextExtractionError("DOCX extraction requires python-docx library. Please install it with: pip install python-docx")
 
         try:
             text = ""
             with io.BytesIO(file_content) as docx_file:
                 doc = docx.Document(docx_file)
                 for para in doc.paragraphs:
-                    text += para.text + "\n"
+                    # Heading paragraphs are marked as Markdown headings, where the chunker splits sections
+                    style = para.style.name if para.style is not None else ""
+                    level = style[len("Heading "):] if style.startswith("Heading ") else ""
+                    if level.isdigit() and para.text.strip():
+                        text += "#" * min(int(level), 6) + " " + para.text + "\n"
+                    else:
+                        text += para.text + "\n"
             return text
         except Exception as e:
             logger.error(f"Error extracting text from DOCX: {str(e)}")
-            return f"Error extracting text from DOCX: {str(e)}"
+            raise TextExtractionError(f"Error extracting text from DOCX: {str(e)}") from e
 
     @staticmethod
     def _extract_from_pptx(file_content: bytes) -> str:
         """Extract text from a PPTX file."""
         if not PPTX_AVAILABLE:
             logger.warning("python-pptx is not installed. Cannot extract text from PPTX.")
-            return "PPTX extraction requires python-pptx library. Please install it with: pip install python-pptx"
+            raise TextExtractionError("PPTX extraction requires python-pptx library. Please install it with: pip install python-pptx")
 
         try:
             text = ""
@@ -135,7 +191,7 @@ class TextExtractor:
             return text
         except Exception as e:
             logger.error(f"Error extracting text from PPTX: {str(e)}")
-            return f"Error extracting text from PPTX: {str(e)}"
+            raise TextExtractionError(f"Error extracting text from PPTX: {str(e)}") from e
 
     @staticmethod
     def _extract_from_html(file_content: bytes) -> str:
@@ -0,0 +1,159 @@
+"""
+Benchmark of the bulk document ingestion with a stand-in embeddings model.
+
+Generates text files of a few chunks each (plus, with --corrupt, PDFs that cannot be read)
+and indexes them with aingest_files into an in-memory Qdrant, with the embeddings
+admission control enabled. The embeddings model is replaced by a deterministic fake with a
+configurable log-normal latency; lower --embedding-tpm to see the batches being paced on
+the token limit.
+
+Fails (exit status 1) unless every text file is reported "ok", every corrupt file is
+reported "error", and the collection holds exactly the chunks of the indexed files.
+
+Usage:
+    python -m benchmarks.bulk_ingest --files 80
+    python -m benchmarks.bulk_ingest --files 200 --embedding-tpm 200000 --corrupt 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, Any, List
+
+WORDS = (
+    "revisión técnica vehículo planta certificado inspección frenos luces emisiones suspensión "
+    "alineamiento taxi camión combi moto categoría tarifa requisito propiedad conductor vigente "
+    "renovación cita horario sábado municipalidad transporte escolar público carga peso bruto"
+).split()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark of the bulk document ingestion.")
+    parser.add_argument("--files", type=int, default=80, help="Text files to index")
+    parser.add_argument("--paragraphs", type=int, default=12, help="Paragraphs of each text file")
+    parser.add_argument("--sentences", type=int, default=8, help="Sentences of each paragraph")
+    parser.add_argument("--corrupt", type=int, default=2, help="Unreadable PDF files added to the upload")
+    parser.add_argument("--embedding-median-ms", type=float, default=80, help="Median latency of an embeddings call")
+    parser.add_argument("--embedding-p99-ms", type=float, default=300, help="p99 latency of an embeddings call")
+    parser.add_argument("--embedding-rpm", type=int, help="Embeddings requests per minute (default: the setting)")
+    parser.add_argument("--embedding-tpm", type=int, help="Embeddings tokens per minute (default: the setting)")
+    parser.add_argument("--no-admission", action="store_true", help="Disable the admission control")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application logs")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Set the settings of the run. Must happen before the app modules are imported."""
+    os.environ["QDRANT_URL"] = ":memory:"
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["ADMISSION_ENABLED"] = "false" if args.no_admission else "true"
+    # A single process: the admission buckets get the whole rate limits
+    os.environ["API_WORKERS"] = "1"
+    if args.embedding_rpm is not None:
+        os.environ["EMBEDDING_RATE_LIMIT_RPM"] = str(args.embedding_rpm)
+    if args.embedding_tpm is not None:
+        os.environ["EMBEDDING_RATE_LIMIT_TPM"] = str(args.embedding_tpm)
+    for name in ("MESSAGE_LOG_ENABLED", "ANSWER_CACHE_DB_ENABLED", "QUERY_EMBEDDING_CACHE_DB_ENABLED"):
+        os.environ[name] = "false"
+    if not args.verbose:
+        os.environ["LOG_LEVEL"] = "WARNING"
+
+
+def build_files(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Files in the format of expand_uploads: the generated text files, then the corrupt PDFs."""
+    rng = random.Random(args.seed)
+    files = []
+    for i in range(args.files):
+        paragraphs = [
+            " ".join(
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+                for _ in range(args.sentences)
+            )
+            for _ in range(args.paragraphs)
+        ]
+        content = f"Documento {i}.\n\n" + "\n\n".join(paragraphs)
+        files.append({"filename": f"doc-{i:04d}.txt", "content": content.encode("utf-8"),
+                      "mime_type": "text/plain", "archive": None})
+    for i in range(args.corrupt):
+        files.append({"filename": f"corrupt-{i:02d}.pdf", "content": b"%PDF-1.4\nnot really a pdf",
+                      "mime_type": "application/pdf", "archive": None})
+    return files
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    configure_environment(args)
+    from app.services.admission import get_admission_controller
+    from app.services.bulk_ingest import aingest_files, close_extraction_pool
+    from app.services.document_service import get_document_service
+    from app.services.llm_clients import override_models
+    from benchmarks.fakes import FakeEmbeddings, LatencyModel
+
+    embeddings = FakeEmbeddings(LatencyModel(args.embedding_median_ms, args.embedding_p99_ms, seed=args.seed))
+    override_models({}, embeddings)
+    service = get_document_service()
+
+    files = build_files(args)
+    results = []
+    started = time.perf_counter()
+    try:
+        async for result in aingest_files(files, {"source": "benchmark"}):
+            if result.get("done"):
+                summary = result
+            else:
+                results.append(result)
+    finally:
+        close_extraction_pool()
+    duration_s = time.perf_counter() - started
+
+    stored = (await service.async_qdrant_client.count(service.collection_name, exact=True)).count
+    expected = {file["filename"]: "error" if file["mime_type"] == "application/pdf" else "ok" for file in files}
+    unexpected = [
+        {"filename": result["filename"], "status": result["status"], "error": result["error"]}
+        for result in results if result["status"] != expected[result["filename"]]
+    ]
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json_path", "verbose")},
+        "files": len(files),
+        "summary": summary,
+        "duration_s": round(duration_s, 3),
+        "embedding_calls": embeddings.calls,
+        "stored_points": stored,
+        "unexpected": unexpected,
+        "errors": sorted({result["error"] for result in results if result["error"]}),
+        "admission": None if args.no_admission else get_admission_controller("embeddings").stats(),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    summary = report["summary"]
+    print(f"\n{report['files']} files in {report['duration_s']:.2f}s ({summary['files_per_second']} files/s): "
+          f"{summary['indexed']} indexed, {summary['errors']} errors, {summary['skipped']} skipped")
+    print(f"chunks {summary['chunks']}  stored points {report['stored_points']}  "
+          f"embeddings calls {report['embedding_calls']}")
+    for error in report["errors"]:
+        print(f"error: {error}")
+    if report["admission"]:
+        print(f"admission: {report['admission']}")
+    for result in report["unexpected"]:
+        print(f"UNEXPECTED {result['filename']}: {result['status']} ({result['error']})")
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["unexpected"] or report["stored_points"] != report["summary"]["chunks"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
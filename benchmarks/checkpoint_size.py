@@ -0,0 +1,182 @@
+"""
+Checkpoint write volume of the chat graph, per node and per turn.
+
+Runs conversations through the async graph with the stand-in models (see load_test)
+and a saver that measures what the PostgresSaver would write: the checkpoint row
+(including the primitive channel values it inlines), the blobs of the updated
+non-primitive channels and the pending writes of each task. Bytes are attributed to
+the node whose task wrote them; the checkpoint row written after a step is split
+between the nodes of that step. The conversation summary runs inside the graph.
+
+Usage:
+    python -m benchmarks.checkpoint_size --threads 4 --turns 8
+    python -m benchmarks.checkpoint_size --by-channel --json sizes.json
+    python -m benchmarks.checkpoint_size --codec zstd
+"""
+import argparse
+import asyncio
+import json
+import random
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from benchmarks.load_test import configure_environment, install_models, seed_documents
+
+# Attribution of the bytes not written by a node's task
+INPUT = "__input__"
+
+
+def _node_from_task_path(task_path: str) -> str:
+    """The node of a task path such as "~__pregel_pull, retrieve_context"."""
+    return task_path.split(",")[-1].strip() or "__unknown__"
+
+
+def _is_inlined(value: Any) -> bool:
+    """Whether the PostgresSaver stores a channel value in the checkpoint row instead of a blob."""
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+class CheckpointSizeRecorder(InMemorySaver):
+    """
+    In-memory saver that records the size of each write as the PostgresSaver would store it.
+
+    Set turn before running a turn; records are (turn, node, kind, channel, bytes) with
+    kind "writes", "blobs" or "checkpoint".
+    """
+
+    def __init__(self, serde: Optional[Any] = None):
+        super().__init__(serde=serde)
+        self.turn: Any = None
+        self.records: List[Tuple[Any, str, str, str, int]] = []
+        self._step_writers: Dict[str, str] = {}
+
+    def _size(self, value: Any) -> int:
+        _, data = self.serde.dumps_typed(value)
+        return len(data or b"")
+
+    def put_writes(self, config, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        node = _node_from_task_path(task_path)
+        for channel, value in writes:
+            self.records.append((self.turn, node, "writes", channel, self._size(value)))
+            self._step_writers[channel] = node
+        return super().put_writes(config, writes, task_id, task_path)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        values = checkpoint["channel_values"]
+        inlined = {channel: value for channel, value in values.items() if _is_inlined(value)}
+        for channel in new_versions:
+            if channel in values and channel not in inlined:
+                node = self._step_writers.get(channel, INPUT)
+                self.records.append((self.turn, node, "blobs", channel, self._size(values[channel])))
+
+        row = json.dumps({**checkpoint, "channel_values": inlined}, default=str)
+        row_bytes = len(row.encode("utf-8")) + len(json.dumps(metadata, default=str).encode("utf-8"))
+        nodes = sorted(set(self._step_writers.values())) or [INPUT]
+        for node in nodes:
+            self.records.append((self.turn, node, "checkpoint", "(row)", row_bytes // len(nodes)))
+        self._step_writers = {}
+        return super().put(config, checkpoint, metadata, new_versions)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the checkpoint bytes written per node and turn.")
+    parser.add_argument("--threads", type=int, default=4, help="Conversations to run")
+    parser.add_argument("--turns", type=int, default=8, help="Messages sent on each conversation")
+    parser.add_argument("--by-channel", action="store_true", help="Also report the bytes per state channel")
+    parser.add_argument("--codec", choices=["none", "zlib", "zstd"], default="none",
+                        help="Compression of the checkpoint blobs and writes (see app.database.checkpoint_serde)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application logs")
+    args = parser.parse_args()
+
+    # Settings of the load benchmark: instant stand-in models, in-memory Qdrant, no caches
+    defaults = {
+        "qdrant_url": ":memory:", "answer_cache": False, "admission": False, "hedging": False,
+        "deadline_ms": None, "postgres": False, "model": [], "ambiguous_ratio": 0.1,
+        "llm_median_ms": 0, "llm_p99_ms": 0, "structured_median_ms": 0, "structured_p99_ms": 0,
+        "embedding_median_ms": 0, "embedding_p99_ms": 0,
+    }
+    return argparse.Namespace(**{**defaults, **vars(args)})
+
+
+async def record_conversations(args: argparse.Namespace, recorder: CheckpointSizeRecorder) -> None:
+    """Run args.threads conversations of args.turns messages through the graph."""
+    from app.graph.chat_graph import build_workflow, ASYNC_NODES
+    from app.services.chat_service import _build_config, _build_initial_state
+    from benchmarks.data import QUESTIONS
+
+    graph = build_workflow(ASYNC_NODES).compile(checkpointer=recorder)
+    rng = random.Random(args.seed)
+    for thread in range(args.threads):
+        thread_id = f"checkpoint-size-{thread}"
+        for turn in range(args.turns):
+            recorder.turn = turn
+            await graph.ainvoke(_build_initial_state(rng.choice(QUESTIONS)), _build_config(thread_id))
+
+
+def summarize(records: List[Tuple[Any, str, str, str, int]], threads: int) -> Dict[str, Any]:
+    """Mean bytes per turn, per node (and kind) and per channel."""
+    per_turn = defaultdict(int)
+    per_node = defaultdict(lambda: defaultdict(int))
+    per_channel = defaultdict(int)
+    for turn, node, kind, channel, size in records:
+        per_turn[turn] += size
+        per_node[node][kind] += size
+        if channel != "(row)":
+            per_channel[channel] += size
+
+    turns = len(per_turn) * threads or 1
+    return {
+        "turns": {turn: round(total / threads) for turn, total in sorted(per_turn.items())},
+        "nodes": {
+            node: {kind: round(sizes.get(kind, 0) / turns) for kind in ("writes", "blobs", "checkpoint")}
+            for node, sizes in per_node.items()
+        },
+        "channels": {channel: round(size / turns) for channel, size in
+                     sorted(per_channel.items(), key=lambda item: -item[1])},
+        "mean_bytes_per_turn": round(sum(per_turn.values()) / turns),
+    }
+
+
+def print_report(report: Dict[str, Any], by_channel: bool) -> None:
+    print(f"\nCheckpoint bytes per turn (mean over threads): {report['mean_bytes_per_turn']}")
+    print("  " + "  ".join(f"#{turn}: {size}" for turn, size in report["turns"].items()))
+
+    print(f"\n{'node':<26}{'writes':>10}{'blobs':>10}{'checkpoint':>12}{'total':>10}   (mean bytes per turn)")
+    rows = sorted(report["nodes"].items(), key=lambda item: -sum(item[1].values()))
+    for node, sizes in rows:
+        print(f"{node:<26}{sizes['writes']:>10}{sizes['blobs']:>10}{sizes['checkpoint']:>12}"
+              f"{sum(sizes.values()):>10}")
+
+    if by_channel:
+        print(f"\n{'channel':<50}{'bytes':>10}   (writes and blobs, mean per turn)")
+        for channel, size in report["channels"].items():
+            print(f"{channel[:49]:<50}{size:>10}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    configure_environment(args)
+    install_models(args)
+    await seed_documents()
+
+    from app.database.checkpoint_serde import CompressedSerializer
+
+    recorder = CheckpointSizeRecorder(serde=CompressedSerializer(codec=args.codec))
+    await record_conversations(args, recorder)
+    return summarize(recorder.records, args.threads)
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report, args.by_channel)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
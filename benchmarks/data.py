@@ -0,0 +1,38 @@
+# Questions sent by the load driver; a share of them are trivial and take the fast path
+QUESTIONS = [
+    "¿Cuánto cuesta la revisión técnica para un taxi M1?",
+    "¿Qué documentos necesito para la revisión técnica por primera vez?",
+    "¿Dónde está la planta de San Juan de Lurigancho?",
+    "Tengo un camión de carga, ¿cuánto demora la inspección?",
+    "¿Atienden los domingos en la planta de Trapiche?",
+    "¿Cada cuánto tiempo debo pasar la revisión de mi auto particular?",
+    "Mi certificado está vencido, ¿me pueden multar?",
+    "¿Qué revisan en la prueba de emisiones?",
+    "¿Cuál es la tarifa para transporte escolar?",
+    "¿Necesito cita previa para la renovación en Carabayllo?",
+    "¿Puedo pagar con tarjeta en la planta?",
+    "¿Qué pasa si mi vehículo no aprueba la revisión?",
+    "Tengo una combi de transporte público, ¿qué requisitos hay?",
+    "¿La revisión de una moto cuesta lo mismo?",
+    "¿Cuánto tiempo es válido el certificado para un taxi?",
+]
+
+TRIVIAL_MESSAGES = ["hola", "gracias", "ok, perfecto", "buenas tardes", "chau, gracias"]
+
+DOCUMENTS = [
+    ("tarifas.txt", "Tarifas de revisión técnica 2024.\n\nCategoría M1 (autos particulares y taxis): S/ 110.\n\n"
+                    "Categoría M2 y M3 (transporte público y escolar): S/ 160.\n\n"
+                    "Categoría N1 a N3 (transporte de mercancías): entre S/ 150 y S/ 220 según el peso bruto."),
+    ("requisitos.txt", "Requisitos para la revisión técnica.\n\nPrimera vez: tarjeta de propiedad, SOAT vigente y "
+                       "DNI del conductor.\n\nRenovación: además, el certificado de inspección anterior.\n\n"
+                       "Vehículos escolares: constancia de la municipalidad."),
+    ("plantas.txt", "Plantas de revisión.\n\nSJL: Av. Próceres 1234, lunes a sábado de 7:00 a 19:00.\n\n"
+                    "Trapiche: Av. Trapiche 567, lunes a sábado de 7:00 a 18:00.\n\n"
+                    "Carabayllo: Av. Universitaria 8910, lunes a viernes de 8:00 a 17:00."),
+    ("proceso.txt", "Proceso de inspección.\n\nLa inspección dura unos 30 minutos e incluye frenos, luces, "
+                    "alineamiento, suspensión y emisiones.\n\nSi el vehículo no aprueba, tiene 30 días para "
+                    "corregir las observaciones y volver sin costo adicional."),
+    ("frecuencia.txt", "Frecuencia de la revisión.\n\nAutos particulares: cada año a partir del cuarto año de "
+                       "fabricación.\n\nTaxis, transporte público y escolar: cada seis meses o cada año según la "
+                       "antigüedad.\n\nMulta por certificado vencido: 0.05 UIT."),
+]
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from app.util.entity_matcher import match_vehicle_info
+
+
+def _stable_hash(text: str) -> int:
+    """Hash that does not change between runs (unlike hash())."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class LatencyModel:
+    """
+    Log-normal latency distribution defined by its median and p99, in milliseconds.
+    Seeded, so a run with the same settings sees the same sequence of latencies.
+    """
+
+    # z-score of the 99th percentile of a standard normal distribution
+    Z_99 = 2.326
+
+    def __init__(self, median_ms: float, p99_ms: Optional[float] = None, seed: int = 0):
+        self.median_ms = median_ms
+        self.p99_ms = p99_ms if p99_ms is not None else median_ms
+        self.sigma = math.log(self.p99_ms / median_ms) / self.Z_99 if median_ms > 0 and self.p99_ms > median_ms else 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Next latency in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            return self._random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    def __repr__(self) -> str:
+        return f"LatencyModel(median_ms={self.median_ms}, p99_ms={self.p99_ms})"
+
+
+ANSWERS = [
+    "La revisión técnica para {topic} cuesta según la categoría del vehículo; para un M1 la tarifa es de S/ 110.",
+    "Para {topic} necesitas tu tarjeta de propiedad, SOAT vigente y el certificado anterior si es renovación.",
+    "Puedes acercarte a nuestras plantas de SJL, Trapiche o Carabayllo para {topic}, de lunes a sábado.",
+    "El proceso de {topic} dura unos 30 minutos e incluye frenos, luces, emisiones y suspensión.",
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatOpenAI.
+
+    The answer depends only on the last message; the whole answer takes one sample of the
+    latency model, spread over its tokens when streamed. with_structured_output returns
+    plausible VehicleInfo and AmbiguityClassification values. Responses carry usage
+    metadata estimated from the text length, like the OpenAI responses. A share
+    error_rate of the calls fails, to exercise the fallback chains.
+    """
+
+    latency: Any = None
+    structured_latency: Any = None
+    ambiguous_ratio: float = 0.1
+    error_rate: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        text = str(messages[-1].content) if messages else ""
+        topic = " ".join(text.split()[:6]) or "tu consulta"
+        return ANSWERS[_stable_hash(text) % len(ANSWERS)].format(topic=topic)
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], content: str) -> Dict[str, int]:
+        """Token usage estimated at 4 characters per token."""
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4 + 1
+        output_tokens = len(content) // 4 + 1
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _response(self, messages: List[BaseMessage], structured_schema: Optional[str]) -> Tuple[float, ChatResult]:
+        """Latency and result of a call; structured calls answer with the JSON of the schema."""
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Simulated model error")
+        if structured_schema:
+            latency = self.structured_latency or self.latency
+            content = json.dumps(self._structured(structured_schema, messages), ensure_ascii=False)
+        else:
+            latency = self.latency
+            content = self._answer(messages)
+        message = AIMessage(content=content, usage_metadata=self._usage(messages, content))
+        return latency.sample(), ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  structured_schema: Optional[str] = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        delay, result = self._response(messages, structured_schema)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         structured_schema: Optional[str] = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        delay, result = self._response(messages, structured_schema)
+        await asyncio.sleep(delay)
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                structured_schema: Optional[str] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        delay, result = self._response(messages, structured_schema)
+        words = result.generations[0].message.content.split(" ")
+        delay /= len(words)
+        usage = result.generations[0].message.usage_metadata
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=word if i == 0 else f" {word}",
+                usage_metadata=usage if i == len(words) - 1 else None
+            ))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       structured_schema: Optional[str] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        delay, result = self._response(messages, structured_schema)
+        words = result.generations[0].message.content.split(" ")
+        delay /= len(words)
+        usage = result.generations[0].message.usage_metadata
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=word if i == 0 else f" {word}",
+                usage_metadata=usage if i == len(words) - 1 else None
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _structured(self, name: str, messages: List[BaseMessage]) -> Dict[str, Any]:
+        text = str(messages[-1].content) if messages else ""
+
+        if name == "VehicleInfo":
+            values, _ = match_vehicle_info(text)
+            return {field: values.get(field) for field in
+                    ("vehicle_type", "plant_location", "service_type", "tariff_type")}
+        if name == "AmbiguityClassification":
+            ambiguous = (_stable_hash(text) % 1000) < self.ambiguous_ratio * 1000
+            return {
+                "is_ambiguous": ambiguous,
+                "ambiguity_category": "VEHICULO" if ambiguous else "NINGUNA",
+                "clarification_question": "¿Qué tipo de vehículo tienes?" if ambiguous else "",
+            }
+        return {}
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        # A regular model call (so callbacks see it, as with ChatOpenAI) whose JSON answer is parsed
+        return (self.bind(structured_schema=getattr(schema, "__name__", ""))
+                | RunnableLambda(lambda message: json.loads(message.content), name="parse_structured_output"))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic stand-in for OpenAIEmbeddings: a unit vector seeded by the text,
+    so equal texts get equal vectors. Each call takes one sample of the latency model.
+    """
+
+    def __init__(self, latency: LatencyModel, size: int = 1536):
+        self.latency = latency
+        self.size = size
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.random.default_rng(_stable_hash(text)).standard_normal(self.size).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
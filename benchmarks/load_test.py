@@ -0,0 +1,352 @@
+"""
+End-to-end load benchmark of the chat pipeline with stand-in models.
+
+The OpenAI chat and embedding models are replaced by deterministic fakes with configurable
+log-normal latencies, Qdrant runs in memory with a small seeded corpus, and checkpoints go
+to a MemorySaver (or to the configured Postgres with --postgres). Everything else is the
+real code: the FastAPI app (--target app) or the synchronous graph built like
+create_chat_graph (--target graph), driven at a fixed concurrency.
+
+Reports requests per second, p50/p95/p99 latency and the time spent in each graph node.
+
+Usage:
+    python -m benchmarks.load_test --requests 500 --concurrency 32
+    python -m benchmarks.load_test --target graph --llm-median-ms 800 --llm-p99-ms 3000
+    python -m benchmarks.load_test --postgres --json results.json
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Awaitable
+
+import numpy as np
+
+# Time spent in each graph node, filled by the timed node wrappers
+NODE_TIMINGS: Dict[str, List[float]] = defaultdict(list)
+# Stages skipped or cut short by the turn deadline, from the chat results
+DEGRADATIONS: Counter = Counter()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load benchmark of the chat pipeline with stand-in models.")
+    parser.add_argument("--target", choices=["app", "graph"], default="app",
+                        help="app: POST /chat/message through the FastAPI app; graph: the sync graph in threads")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at the same time")
+    parser.add_argument("--turns-per-thread", type=int, default=4, help="Messages sent on each thread")
+    parser.add_argument("--trivial-ratio", type=float, default=0.1, help="Share of greetings/thanks messages")
+    parser.add_argument("--ambiguous-ratio", type=float, default=0.1, help="Share of queries classified ambiguous")
+    parser.add_argument("--llm-median-ms", type=float, default=600, help="Median latency of a chat completion")
+    parser.add_argument("--llm-p99-ms", type=float, default=2000, help="p99 latency of a chat completion")
+    parser.add_argument("--structured-median-ms", type=float, default=300, help="Median latency of structured calls")
+    parser.add_argument("--structured-p99-ms", type=float, default=900, help="p99 latency of structured calls")
+    parser.add_argument("--model", action="append", default=[], metavar="NAME=MEDIAN:P99[:ERROR_RATE]",
+                        help="Latency (and error rate) of a specific model, e.g. gpt-4.1-nano=150:400:0.01")
+    parser.add_argument("--embedding-median-ms", type=float, default=80, help="Median latency of an embedding")
+    parser.add_argument("--embedding-p99-ms", type=float, default=300, help="p99 latency of an embedding")
+    parser.add_argument("--deadline-ms", type=int, help="Time budget of each turn (default: TURN_DEADLINE_MS)")
+    parser.add_argument("--postgres", action="store_true",
+                        help="Use the configured Postgres for checkpoints and the DB-backed caches and logs")
+    parser.add_argument("--qdrant-url", default=":memory:", help="Qdrant URL (default: in-memory)")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache enabled")
+    parser.add_argument("--admission", action="store_true", help="Keep the model admission control enabled")
+    parser.add_argument("--hedging", action="store_true", help="Hedge the calls of the LLM_HEDGE_NODES")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application logs")
+    return parser.parse_args()
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Set the settings of the run. Must happen before the app modules are imported."""
+    os.environ["QDRANT_URL"] = args.qdrant_url
+    os.environ["ANSWER_CACHE_ENABLED"] = "true" if args.answer_cache else "false"
+    os.environ["ADMISSION_ENABLED"] = "true" if args.admission else "false"
+    # A single process: the admission buckets get the whole rate limits
+    os.environ["API_WORKERS"] = "1"
+    os.environ["LLM_HEDGING"] = "true" if args.hedging else "false"
+    if args.deadline_ms is not None:
+        os.environ["TURN_DEADLINE_MS"] = str(args.deadline_ms)
+    if not args.postgres:
+        for name in ("MESSAGE_LOG_ENABLED", "ANSWER_CACHE_DB_ENABLED", "QUERY_EMBEDDING_CACHE_DB_ENABLED",
+                     "THREAD_ADVISORY_LOCKS"):
+            os.environ[name] = "false"
+    if not args.verbose:
+        os.environ["LOG_LEVEL"] = "WARNING"
+
+
+def timed(name: str, node: Callable) -> Callable:
+    """Wrap a node so its duration is recorded in NODE_TIMINGS."""
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_node(state, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await node(state, *args, **kwargs)
+            finally:
+                NODE_TIMINGS[name].append((time.perf_counter() - started) * 1000)
+        return async_node
+
+    @functools.wraps(node)
+    def sync_node(state, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return node(state, *args, **kwargs)
+        finally:
+            NODE_TIMINGS[name].append((time.perf_counter() - started) * 1000)
+    return sync_node
+
+
+def install_models(args: argparse.Namespace) -> Dict[str, Any]:
+    """Replace the OpenAI models of every node's fallback chain with the stand-ins."""
+    from app.config.settings import LLM_NODES
+    from app.services.llm_clients import get_node_model_settings, override_models
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings, LatencyModel
+
+    specs = {}
+    for spec in args.model:
+        name, _, values = spec.partition("=")
+        specs[name] = dict(zip(("median_ms", "p99_ms", "error_rate"), (float(v) for v in values.split(":"))))
+
+    names = dict.fromkeys(name for node in LLM_NODES for name in get_node_model_settings(node)["models"])
+    models = {}
+    for i, name in enumerate(names):
+        spec = specs.get(name, {})
+        # A model given with --model has the same latency for plain and structured calls
+        median_ms, p99_ms = spec.get("median_ms"), spec.get("p99_ms", spec.get("median_ms"))
+        models[name] = FakeChatModel(
+            latency=LatencyModel(median_ms or args.llm_median_ms, p99_ms or args.llm_p99_ms, seed=args.seed + i),
+            structured_latency=LatencyModel(median_ms or args.structured_median_ms,
+                                            p99_ms or args.structured_p99_ms, seed=args.seed + 100 + i),
+            ambiguous_ratio=args.ambiguous_ratio,
+            error_rate=spec.get("error_rate", 0.0)
+        )
+    embeddings = FakeEmbeddings(LatencyModel(args.embedding_median_ms, args.embedding_p99_ms, seed=args.seed + 200))
+    override_models(models, embeddings)
+    return {"chat": models, "embeddings": embeddings}
+
+
+async def seed_documents() -> None:
+    """Index the benchmark corpus (in both Qdrant clients' stores when in memory)."""
+    from qdrant_client.http import models as qdrant_models
+    from app.services.document_service import get_document_service
+    from benchmarks.data import DOCUMENTS
+
+    service = get_document_service()
+    vectors = await service.embeddings.aembed_documents([content for _, content in DOCUMENTS])
+    points = [
+        qdrant_models.PointStruct(
+            id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark/{name}")),
+            vector=vector,
+            payload={"content": content, "metadata": {"name": name}, "type": "document"}
+        )
+        for (name, content), vector in zip(DOCUMENTS, vectors)
+    ]
+    await service.aupsert_points(points)
+
+
+async def install_graphs(args: argparse.Namespace) -> None:
+    """Activate graphs built like the production ones, with timed nodes and the chosen checkpointer."""
+    from langgraph.checkpoint.memory import MemorySaver
+    from app.config.settings import SPECULATIVE_GENERATION, SUMMARY_IN_BACKGROUND, ANSWER_CACHE_ENABLED
+    from app.database.postgres import get_postgres_saver, get_async_postgres_saver
+    from app.graph.chat_graph import build_workflow, SYNC_NODES, ASYNC_NODES, SPECULATIVE_CLASSIFIERS
+    from app.graph.registry import get_graph_registry
+
+    def timed_nodes(nodes: Dict[str, Callable], mode: str) -> Dict[str, Callable]:
+        nodes = dict(nodes)
+        if SPECULATIVE_GENERATION:
+            # Swapped in here rather than by build_workflow, so it is timed too
+            nodes["classify_ambiguity"] = SPECULATIVE_CLASSIFIERS[mode]
+        return {name: timed(name, node) for name, node in nodes.items()}
+
+    def builder():
+        workflow = build_workflow(timed_nodes(SYNC_NODES, "sync"), answer_cache=ANSWER_CACHE_ENABLED)
+        return workflow.compile(checkpointer=get_postgres_saver() if args.postgres else MemorySaver())
+
+    async def async_builder():
+        workflow = build_workflow(
+            timed_nodes(ASYNC_NODES, "async"),
+            background_summary=SUMMARY_IN_BACKGROUND,
+            answer_cache=ANSWER_CACHE_ENABLED
+        )
+        return workflow.compile(checkpointer=await get_async_postgres_saver() if args.postgres else MemorySaver())
+
+    await get_graph_registry().aswap("benchmark", builder, async_builder)
+
+
+def build_sender(args: argparse.Namespace):
+    """Return a coroutine function sending one message, and a cleanup coroutine."""
+    if args.target == "app":
+        import httpx
+        from main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None)
+
+        async def send(thread_id: str, message: str) -> bool:
+            response = await client.post("/chat/message", json={"thread_id": thread_id, "message": message})
+            if response.status_code != 200:
+                return False
+            result = response.json()
+            DEGRADATIONS.update(result.get("degradations", []))
+            return not result.get("error")
+
+        return send, client.aclose
+
+    from app.services.chat_service import process_message
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="benchmark")
+
+    async def send(thread_id: str, message: str) -> bool:
+        result = await asyncio.get_running_loop().run_in_executor(executor, process_message, message, thread_id)
+        DEGRADATIONS.update(result.get("degradations", []))
+        return not result.get("error")
+
+    async def close() -> None:
+        executor.shutdown(wait=False)
+
+    return send, close
+
+
+async def drive(args: argparse.Namespace, send: Callable[[str, str], Awaitable[bool]], total: int,
+                run_id: str) -> Dict[str, Any]:
+    """Send total messages with args.concurrency workers; each worker owns its threads."""
+    from benchmarks.data import QUESTIONS, TRIVIAL_MESSAGES
+
+    rng = random.Random(f"{args.seed}-{run_id}")
+    messages = [
+        rng.choice(TRIVIAL_MESSAGES) if rng.random() < args.trivial_ratio else rng.choice(QUESTIONS)
+        for _ in range(total)
+    ]
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(worker_id: int) -> None:
+        nonlocal errors
+        turns = 0
+        thread_number = 0
+        while (index := next(counter)) < total:
+            if turns == args.turns_per_thread:
+                thread_number += 1
+                turns = 0
+            thread_id = f"bench-{run_id}-w{worker_id}-t{thread_number}"
+
+            started = time.perf_counter()
+            try:
+                ok = await send(thread_id, messages[index])
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Request failed: {str(e)}")
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += not ok
+            turns += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    return {"latencies": latencies, "errors": errors, "duration_s": time.perf_counter() - started}
+
+
+def distribution(values: List[float]) -> Dict[str, Any]:
+    """Count, mean and percentiles of a list of milliseconds."""
+    if not values:
+        return {"count": 0}
+    array = np.asarray(values)
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean_ms": round(float(array.mean()), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(array.max()), 2),
+        "total_ms": round(float(array.sum()), 2),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    print(f"\n{report['requests']} requests to {report['config']['target']} at concurrency "
+          f"{report['config']['concurrency']} in {report['duration_s']:.2f}s "
+          f"({report['requests_per_second']:.2f} req/s, {report['errors']} errors)")
+    print(f"latency ms  p50 {latency['p50_ms']:>9}  p95 {latency['p95_ms']:>9}  "
+          f"p99 {latency['p99_ms']:>9}  max {latency['max_ms']:>9}")
+    print(f"\n{'node':<24}{'calls':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'share':>8}")
+    total = sum(node.get("total_ms", 0) for node in report["nodes"].values()) or 1
+    for name, node in sorted(report["nodes"].items(), key=lambda item: -item[1].get("total_ms", 0)):
+        print(f"{name:<24}{node['count']:>8}{node['mean_ms']:>10}{node['p50_ms']:>10}{node['p95_ms']:>10}"
+              f"{node['p99_ms']:>10}{node['total_ms'] / total:>8.1%}")
+    print(f"\nmodel calls: {report['model_calls']}")
+    if report["degradations"]:
+        print(f"degradations: {report['degradations']}")
+    for node, hedging in (report["hedging"] or {}).items():
+        print(f"hedging {node}: {hedging}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    configure_environment(args)
+    models = install_models(args)
+    from app.services.hedging import get_hedging_policy
+
+    if args.postgres:
+        from app.database.init_db import init_db
+        init_db()
+
+    await seed_documents()
+    await install_graphs(args)
+    send, close = build_sender(args)
+
+    try:
+        if args.warmup:
+            await drive(args, send, args.warmup, run_id=f"warmup-{uuid.uuid4().hex[:8]}")
+        NODE_TIMINGS.clear()
+        DEGRADATIONS.clear()
+        for model in models["chat"].values():
+            model.calls = 0
+        models["embeddings"].calls = 0
+
+        result = await drive(args, send, args.requests, run_id=uuid.uuid4().hex[:8])
+    finally:
+        await close()
+        from app.services.summary_jobs import get_summary_job_queue
+        await get_summary_job_queue().stop()
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json_path", "verbose")},
+        "requests": args.requests,
+        "errors": result["errors"],
+        "duration_s": round(result["duration_s"], 3),
+        "requests_per_second": round(args.requests / result["duration_s"], 2),
+        "latency": distribution(result["latencies"]),
+        "nodes": {name: distribution(values) for name, values in NODE_TIMINGS.items()},
+        "model_calls": {
+            **{name: model.calls for name, model in models["chat"].items()},
+            "embeddings": models["embeddings"].calls,
+        },
+        "degradations": dict(DEGRADATIONS),
+        "hedging": get_hedging_policy().stats()["nodes"] if args.hedging else None,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
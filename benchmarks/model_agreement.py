@@ -0,0 +1,246 @@
+"""
+Offline comparison of models on the LLM tasks of the chat graph.
+
+First record the outputs of a reference model on a set of cases, then run candidate
+models on the same prompts and measure how often they agree with the recording and
+how fast they are. Use it before pinning a node to a cheaper or faster model.
+
+- capture_important_info and classify_ambiguity (structured output): the share of
+  fields equal to the recorded ones, and the share of cases where all fields are equal.
+- generate_response (free text): cosine similarity between the embeddings of the
+  answers; a case agrees when it is above --similarity-threshold.
+
+Cases are the benchmark questions (benchmarks/data.py) or a JSONL file with
+{"input": ..., "last_assistant_message": ...} per line; the benchmark documents are
+used as retrieved context. --fake runs everything with the stand-in models.
+
+Usage:
+    python -m benchmarks.model_agreement record --model gpt-4o --output recordings.jsonl
+    python -m benchmarks.model_agreement compare --recordings recordings.jsonl --models gpt-4.1-nano,gpt-4o-mini
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from app.graph.nodes import _build_capture_messages, _build_classifier_messages, _build_response_inputs, \
+    get_response_prompt
+from app.graph.state import AmbiguityClassification, VehicleInfo
+from app.services.llm_clients import get_model_for_node, get_embeddings, override_models
+from app.util.context_assembler import assemble_context, get_token_budget
+from app.util.entity_matcher import merge_vehicle_info
+from benchmarks.data import QUESTIONS, DOCUMENTS
+
+NODES = ["capture_important_info", "classify_ambiguity", "generate_response"]
+
+# Fields compared for the structured tasks (the clarification question is free text)
+AGREEMENT_FIELDS = {
+    "capture_important_info": ["vehicle_type", "plant_location", "service_type", "tariff_type"],
+    "classify_ambiguity": ["is_ambiguous", "ambiguity_category"],
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare models on the LLM tasks of the chat graph.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Record the outputs of a reference model")
+    record.add_argument("--model", required=True, help="Reference model")
+    record.add_argument("--output", required=True, help="JSONL file to write")
+    record.add_argument("--cases", help="JSONL file of cases (default: the benchmark questions)")
+
+    compare = subparsers.add_parser("compare", help="Compare models with a recording")
+    compare.add_argument("--recordings", required=True, help="JSONL file written by record")
+    compare.add_argument("--models", required=True, help="Comma-separated candidate models")
+    compare.add_argument("--similarity-threshold", type=float, default=0.9,
+                         help="Minimum embedding similarity for free-text answers to agree")
+    compare.add_argument("--json", dest="json_path", help="Also write the report to this file")
+
+    for subparser in (record, compare):
+        subparser.add_argument("--nodes", default=",".join(NODES), help="Comma-separated tasks to run")
+        subparser.add_argument("--concurrency", type=int, default=4, help="Model calls at the same time")
+        subparser.add_argument("--fake", action="store_true", help="Use the stand-in models (no API calls)")
+    return parser.parse_args()
+
+
+def load_cases(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Read the cases from a JSONL file, or use the benchmark questions."""
+    if not path:
+        return [{"input": question} for question in QUESTIONS]
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _build_state(case: Dict[str, Any]) -> Dict[str, Any]:
+    """Minimal graph state for a case, with the benchmark documents as retrieved context."""
+    documents = [Document(page_content=content, metadata={"name": name}) for name, content in DOCUMENTS]
+    last_assistant_message = case.get("last_assistant_message")
+    return {
+        "input": case["input"],
+        "messages": [AIMessage(content=last_assistant_message)] if last_assistant_message else [],
+        "summary": "",
+        "vehicle_info": merge_vehicle_info(None, None),
+        "documents": documents,
+        "context": assemble_context(case["input"], documents, get_token_budget("generate_response")),
+    }
+
+
+async def run_task(node: str, model: str, case: Dict[str, Any]) -> Any:
+    """Run one node's LLM call for a case with a specific model, as the node builds it."""
+    state = _build_state(case)
+    base = get_model_for_node(node, model)
+    if node == "capture_important_info":
+        return await base.with_structured_output(VehicleInfo).ainvoke(
+            _build_capture_messages(state, state["vehicle_info"])
+        )
+    if node == "classify_ambiguity":
+        return await base.with_structured_output(AmbiguityClassification).ainvoke(_build_classifier_messages(state))
+    if node == "generate_response":
+        return await (get_response_prompt() | base | StrOutputParser()).ainvoke(_build_response_inputs(state))
+    raise ValueError(f"Unsupported node: {node}")
+
+
+async def run_all(jobs: List[Tuple[str, str, Dict[str, Any]]], concurrency: int) -> List[Dict[str, Any]]:
+    """Run (node, model, case) jobs with bounded concurrency, timing each one."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(node: str, model: str, case: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                output, error = await run_task(node, model, case), None
+            except Exception as e:
+                output, error = None, str(e)
+            return {"node": node, "model": model, "case": case, "output": output, "error": error,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    return await asyncio.gather(*(run(*job) for job in jobs))
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip().lower()
+        return None if value in ("", "null", "none") else value
+    return value
+
+
+def structured_agreement(node: str, reference: Dict[str, Any], candidate: Dict[str, Any]) -> Tuple[float, bool]:
+    """Share of the node's fields equal in both outputs, and whether all of them are."""
+    fields = AGREEMENT_FIELDS[node]
+    equal = [_normalize((reference or {}).get(f)) == _normalize((candidate or {}).get(f)) for f in fields]
+    return sum(equal) / len(fields), all(equal)
+
+
+def text_similarities(pairs: List[Tuple[str, str]]) -> List[float]:
+    """Cosine similarity between the embeddings of each (reference, candidate) pair."""
+    if not pairs:
+        return []
+    vectors = np.asarray(get_embeddings().embed_documents([text for pair in pairs for text in pair]))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return [float(vectors[2 * i] @ vectors[2 * i + 1]) for i in range(len(pairs))]
+
+
+def summarize(results: List[Dict[str, Any]], recordings: Dict[Tuple[str, str], Dict[str, Any]],
+              threshold: float) -> Dict[str, Any]:
+    """Agreement and latency per node and model."""
+    groups = defaultdict(list)
+    for result in results:
+        groups[(result["node"], result["model"])].append(result)
+
+    report = {}
+    for (node, model), group in sorted(groups.items()):
+        ok = [r for r in group if r["error"] is None and recordings[(node, r["case"]["input"])]["output"] is not None]
+        references = [recordings[(node, r["case"]["input"])]["output"] for r in ok]
+        if node in AGREEMENT_FIELDS:
+            scores = [structured_agreement(node, ref, r["output"]) for ref, r in zip(references, ok)]
+            agreement = [score for score, _ in scores]
+            exact = [float(all_equal) for _, all_equal in scores]
+        else:
+            similarities = text_similarities([(ref, r["output"]) for ref, r in zip(references, ok)])
+            agreement = similarities
+            exact = [float(similarity >= threshold) for similarity in similarities]
+
+        latencies = [r["latency_ms"] for r in group if r["error"] is None]
+        p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (0.0, 0.0)
+        report.setdefault(node, {})[model] = {
+            "cases": len(group),
+            "errors": len(group) - len(latencies),
+            "agreement": round(float(np.mean(agreement)), 4) if agreement else None,
+            "agreed_cases": round(float(np.mean(exact)), 4) if exact else None,
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any], reference_model: str) -> None:
+    print(f"\nAgreement with {reference_model}")
+    print(f"{'node':<24}{'model':<22}{'cases':>7}{'errors':>8}{'agreement':>11}{'agreed':>8}{'p50':>9}{'p95':>9}")
+    for node, models in report.items():
+        for model, row in models.items():
+            agreement = f"{row['agreement']:.1%}" if row["agreement"] is not None else "-"
+            agreed = f"{row['agreed_cases']:.1%}" if row["agreed_cases"] is not None else "-"
+            print(f"{node:<24}{model:<22}{row['cases']:>7}{row['errors']:>8}{agreement:>11}{agreed:>8}"
+                  f"{row['p50_ms']:>9}{row['p95_ms']:>9}")
+
+
+def install_fakes(models: List[str]) -> None:
+    """Replace the models (and the embeddings) with the stand-ins."""
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings, LatencyModel
+
+    override_models(
+        {model: FakeChatModel(latency=LatencyModel(300, 900, seed=i), structured_latency=LatencyModel(150, 450, seed=i))
+         for i, model in enumerate(models)},
+        FakeEmbeddings(LatencyModel(0))
+    )
+
+
+async def record(args: argparse.Namespace) -> None:
+    nodes = args.nodes.split(",")
+    if args.fake:
+        install_fakes([args.model])
+
+    cases = load_cases(args.cases)
+    results = await run_all([(node, args.model, case) for node in nodes for case in cases], args.concurrency)
+    with open(args.output, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    errors = sum(1 for result in results if result["error"])
+    print(f"Recorded {len(results)} outputs of {args.model} ({errors} errors) to {args.output}")
+
+
+async def compare(args: argparse.Namespace) -> None:
+    nodes = args.nodes.split(",")
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    with open(args.recordings, encoding="utf-8") as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+    recordings = {(r["node"], r["case"]["input"]): r for r in recorded if r["node"] in nodes}
+    reference_model = recorded[0]["model"] if recorded else "-"
+    if args.fake:
+        install_fakes(models)
+
+    jobs = [(node, model, r["case"]) for (node, _), r in recordings.items() for model in models]
+    results = await run_all(jobs, args.concurrency)
+    report = summarize(results, recordings, args.similarity_threshold)
+    print_report(report, reference_model)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"reference_model": reference_model, "nodes": report}, f, indent=2)
+
+
+def main() -> None:
+    args = parse_args()
+    asyncio.run(record(args) if args.command == "record" else compare(args))
+
+
+if __name__ == "__main__":
+    main()
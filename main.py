@@ -1,20 +1,34 @@
 import logging
+import os
+import shutil
+import tempfile
+import time
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routers import chat, documents
-from app.config.settings import API_HOST, API_PORT, API_WORKERS, LOG_LEVEL
+from app.config.settings import API_HOST, API_PORT, API_WORKERS, LOG_LEVEL, TRACE_ID_HEADER, \
+    THREAD_ADVISORY_LOCKS, METRICS_ENABLED, PROMETHEUS_MULTIPROC_DIR
 from app.database.postgres import check_postgres_connection, close_postgres_connections
 from app.database.engine import close_connections
 from app.database.init_db import init_db
+from app.database.retention import get_checkpoint_pruner
+from app.graph.registry import get_graph_registry
+from app.services.admission import current_client
+from app.services.bulk_ingest import close_extraction_pool
+from app.services.llm_clients import close_llm_clients
+from app.services.metrics import trace_id, new_trace_id, install_trace_id_logging, render_metrics, close_metrics, \
+    HTTP_DURATION
+from app.services.summary_jobs import get_summary_job_queue
 
 # Setup logging
 logging_level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
 logging.basicConfig(
     level=logging_level,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
 )
+install_trace_id_logging()
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
@@ -33,6 +47,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def admission_client_middleware(request: Request, call_next):
+    """Identify the client of each request, so model calls are queued fairly across clients."""
+    client = request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+    token = current_client.set(client)
+    try:
+        return await call_next(request)
+    finally:
+        current_client.reset(token)
+
+
+@app.middleware("http")
+async def trace_middleware(request: Request, call_next):
+    """Assign a trace id to each request (added to its logs) and time it."""
+    token = trace_id.set(new_trace_id(request.headers.get(TRACE_ID_HEADER)))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-Id"] = trace_id.get()
+        return response
+    finally:
+        # Route template rather than the path, to keep the label cardinality bounded
+        route = request.scope.get("route")
+        HTTP_DURATION.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        ).observe(time.perf_counter() - started)
+        trace_id.reset(token)
+
+
 # Include routers
 app.include_router(chat.router)
 app.include_router(documents.router)  # Add the documents router
@@ -52,10 +100,24 @@ def health_check():
     return {
         "status": "healthy",
         "database": db_status,
+        "graph": get_graph_registry().info(),
         "version": "1.0.0"
     }
 
 
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: node, model, embedding, Qdrant and checkpoint latencies,
+    pool utilization and the counters of the caches, admission control and queues.
+    """
+    try:
+        body, content_type = render_metrics()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(content=body, media_type=content_type)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
@@ -70,6 +132,24 @@ async def startup_event():
         else:
             logger.error("PostgreSQL connection failed")
 
+        # Compile the chat graphs once for this worker
+        graph_info = await get_graph_registry().awarmup()
+        logger.info(
+            f"Chat graph version {graph_info['version']} ready "
+            f"(compiled in {graph_info['compile_time_ms']} ms, "
+            f"async in {graph_info['async_compile_time_ms']} ms)"
+        )
+
+        # Prune old checkpoints periodically
+        get_checkpoint_pruner().start()
+
+        if API_WORKERS > 1 and not THREAD_ADVISORY_LOCKS:
+            logger.warning(f"{API_WORKERS} workers without THREAD_ADVISORY_LOCKS: turns of the same thread "
+                           f"on different workers are not serialized")
+        if API_WORKERS > 1 and METRICS_ENABLED and not PROMETHEUS_MULTIPROC_DIR:
+            logger.warning(f"{API_WORKERS} workers without PROMETHEUS_MULTIPROC_DIR: /metrics only reports "
+                           f"the worker serving the scrape")
+
     except Exception as e:
         logger.error(f"Error initializing services: {str(e)}")
         # We don't want to crash the app if services fail to initialize
@@ -81,19 +161,43 @@ async def shutdown_event():
     """Clean up resources on shutdown"""
     logger.info("Application shutting down")
 
+    # Stop the background summary workers and the checkpoint pruner
+    await get_summary_job_queue().stop()
+    await get_checkpoint_pruner().stop()
+
     # Close PostgreSQL connections
     close_postgres_connections()
 
     # Close SQLAlchemy connections
     close_connections()
 
+    # Close the pooled LLM HTTP clients
+    await close_llm_clients()
+
+    # Stop the extraction workers of the bulk uploads
+    close_extraction_pool()
+
+    # Stop counting this worker's calls in flight
+    close_metrics()
+
 
 if __name__ == "__main__":
+    metrics_dir = None
+    if API_WORKERS > 1 and METRICS_ENABLED and not PROMETHEUS_MULTIPROC_DIR:
+        # The workers share their metrics through files; they inherit the variable and read it
+        # before prometheus_client is imported
+        metrics_dir = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
     logger.info(f"Starting server on {API_HOST}:{API_PORT} with {API_WORKERS} workers")
-    uvicorn.run(
-        "app.main:app",
-        host=API_HOST,
-        port=API_PORT,
-        workers=API_WORKERS,
-        reload=True  # Enable auto-reload during development
-    )
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=API_HOST,
+            port=API_PORT,
+            workers=API_WORKERS,
+            reload=True  # Enable auto-reload during development
+        )
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)